@@ -0,0 +1,88 @@
+'''Measures the cost of move generation against board size.
+
+For each board size the same number of men is scattered around the
+ball, so the position is equally complicated on every board, and the
+median time of a legal move search is reported for men stored as a
+set and as a BitBoard, for both move generators. The peak memory used
+while setting up the board and finding its legal moves is measured
+with tracemalloc.
+
+Usage: python benchmarks/board_size.py [men] [repeats]
+'''
+
+import random
+import sys
+import time
+import tracemalloc
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from engine import AbstractBoard, BitBoard
+from engine.moves import get_legal_moves, get_reachable_moves
+
+SHAPES = [(15, 19), (31, 31), (51, 51), (101, 101), (201, 201)]
+
+
+def position(shape, number_of_men, seed=0):
+    '''Returns a ball and set of men, with the men in a 15x15 square
+    around the ball in the middle of the board.'''
+    rng = random.Random(seed)
+    ball = (shape[0] // 2, shape[1] // 2)
+    men = set()
+    while len(men) < number_of_men:
+        coords = (ball[0] + rng.randint(-7, 7), ball[1] + rng.randint(-7, 7))
+        if coords != ball and 0 <= coords[0] < shape[0] and \
+                0 <= coords[1] < shape[1]:
+            men.add(coords)
+    return ball, men
+
+
+def time_function(function, repeats):
+    samples = []
+    for i in range(repeats):
+        start = time.time()
+        function()
+        samples.append(time.time() - start)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def peak_memory(shape, ball, men):
+    tracemalloc.start()
+    board = AbstractBoard(shape=shape, move_generator='reachable')
+    board.ball_coords = ball
+    for coords in men:
+        board.add_man(coords)
+    board.update_legal_moves()
+    board.reset_speculation()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    number_of_men = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    print('{} men, median of {} runs'.format(number_of_men, repeats))
+    print('{:>9} {:>11} {:>11} {:>11} {:>11} {:>11}'.format(
+        'shape', 'paths set', 'paths bits', 'reach set', 'reach bits',
+        'peak KiB'))
+    for shape in SHAPES:
+        ball, men = position(shape, number_of_men)
+        bits = BitBoard(shape, men)
+        times = [
+            time_function(lambda: get_legal_moves(ball, men, shape), repeats),
+            time_function(lambda: get_legal_moves(ball, bits), repeats),
+            time_function(lambda: get_reachable_moves(ball, men, shape),
+                          repeats),
+            time_function(lambda: get_reachable_moves(ball, bits), repeats)]
+        print('{:>9} {} {:>11.1f}'.format(
+            '{}x{}'.format(*shape),
+            ' '.join('{:>8.3f} ms'.format(t * 1000) for t in times),
+            peak_memory(shape, ball, men) / 1024.))
+
+
+if __name__ == '__main__':
+    main()
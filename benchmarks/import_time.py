@@ -0,0 +1,47 @@
+'''Measures the cold import time of the headless engine package.
+
+Each sample imports the package in a fresh interpreter, so nothing is
+cached in sys.modules. The time for a bare interpreter start is
+measured the same way and subtracted. Also checks that importing the
+engine does not pull in Kivy.
+
+Usage: python benchmarks/import_time.py [module] [repeats]
+'''
+
+import subprocess
+import sys
+import time
+from os.path import abspath, dirname
+
+ROOT = dirname(dirname(abspath(__file__)))
+
+
+def time_command(code, repeats):
+    samples = []
+    for i in range(repeats):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code], cwd=ROOT)
+        samples.append(time.time() - start)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    module = sys.argv[1] if len(sys.argv) > 1 else 'engine'
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    check = ('import sys, {0}; '
+             'sys.exit(any(name == "kivy" or name.startswith("kivy.") '
+             'for name in sys.modules))').format(module)
+    if subprocess.call([sys.executable, '-c', check], cwd=ROOT) != 0:
+        print('warning: importing {} also imports kivy'.format(module))
+
+    baseline = time_command('pass', repeats)
+    total = time_command('import {}'.format(module), repeats)
+    print('interpreter startup: {:.1f} ms'.format(baseline * 1000))
+    print('import {}: {:.1f} ms (median of {})'.format(
+        module, (total - baseline) * 1000, repeats))
+
+
+if __name__ == '__main__':
+    main()
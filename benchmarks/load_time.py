@@ -0,0 +1,76 @@
+'''Measures the time to load .phut files.
+
+For each file, reports the median time to parse the json alone, to
+load it into an AbstractBoard (legal moves are then found only when
+first used), and to load it and then use its legal moves. Also
+reports the time per file to go through every file with iter_boards.
+
+Usage: python benchmarks/load_time.py [directory] [repeats]
+'''
+
+import glob
+import json
+import os
+import sys
+import time
+from os.path import abspath, dirname
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from engine import AbstractBoard
+from engine.board import iter_boards
+
+
+def time_function(function, repeats):
+    samples = []
+    for i in range(repeats):
+        start = time.time()
+        function()
+        samples.append(time.time() - start)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def parse(filen):
+    with open(filen, 'r') as fileh:
+        json.load(fileh)
+
+
+def load(filen):
+    AbstractBoard().load_file(filen)
+
+
+def load_and_move(filen):
+    board = AbstractBoard()
+    board.load_file(filen)
+    board.legal_moves
+
+
+def main():
+    directory = (sys.argv[1] if len(sys.argv) > 1 else
+                 os.path.join(ROOT, 'puzzles', 'dir01_tutorials'))
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    filens = sorted(glob.glob(os.path.join(directory, '*.phut')))
+    if not filens:
+        sys.exit('No .phut files in {}'.format(directory))
+
+    print('median of {} runs, in microseconds'.format(repeats))
+    print('{:<24} {:>8} {:>8} {:>14}'.format('file', 'json', 'load',
+                                            'load + moves'))
+    for filen in filens:
+        times = [time_function(lambda: function(filen), repeats)
+                 for function in (parse, load, load_and_move)]
+        print('{:<24} {:>8.1f} {:>8.1f} {:>14.1f}'.format(
+            os.path.basename(filen), *[t * 1e6 for t in times]))
+
+    def load_all():
+        for filen, board in iter_boards(directory):
+            pass
+    total = time_function(load_all, repeats)
+    print('iter_boards: {:.1f} microseconds per file'.format(
+        total / len(filens) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+'''Benchmark suite for the engine's hot paths.
+
+Every benchmark is run on every position of a fixed corpus: the
+tutorial .phut files, and sparse, medium and dense boards generated
+from fixed seeds (men scattered in a 9x9 square around the ball). Each
+sample sets up a fresh board, untimed, and times one call with the
+garbage collector off. The results are written as json, with the
+median, 90th and 99th percentiles, minimum and mean of each
+benchmark/position pair in seconds.
+
+The batch benchmarks time BATCH copies of a position at once: with
+engine.batch.batch_legal_moves (only if NumPy is installed), and with
+get_legal_moves called on each copy in turn, so that their medians can
+be compared directly.
+
+With --compare, the results are checked against a saved run, and any
+benchmark whose median has grown by more than --threshold (a fraction)
+is reported as a regression; the exit status is then 1.
+
+Usage:
+
+    python benchmarks/suite.py -o baseline.json
+    python benchmarks/suite.py --compare baseline.json
+    python benchmarks/suite.py --filter legal_moves --repeats 500
+'''
+
+import argparse
+import gc
+import glob
+import json
+import os
+import platform
+import random
+import sys
+import time
+from os.path import abspath, dirname
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from engine import AbstractBoard, AI
+from engine.moves import get_legal_moves
+
+try:
+    from engine.batch import batch_legal_moves, batch_from_boards
+except ImportError:
+    batch_legal_moves = None
+
+SUITE_VERSION = 1
+
+GENERATED = [('sparse', 8), ('medium', 20), ('dense', 30)]
+
+BATCH = 256
+
+
+def generated_position(name, number_of_men, shape=(15, 19)):
+    '''Returns a .phut dictionary with number_of_men men in a 9x9 square
+    around the ball in the middle of the board.'''
+    rng = random.Random('suite-{}'.format(name))
+    ball = (shape[0] // 2, shape[1] // 2)
+    men = set()
+    while len(men) < number_of_men:
+        coords = (ball[0] + rng.randint(-4, 4), ball[1] + rng.randint(-4, 4))
+        if coords != ball:
+            men.add(coords)
+    board = AbstractBoard(shape=shape)
+    board.ball_coords = ball
+    for coords in sorted(men):
+        board.add_man(coords)
+    board.current_player = 'bottom'
+    return json.loads(board.serialise())
+
+
+def corpus():
+    '''Returns a list of (name, .phut dictionary).'''
+    positions = []
+    for filen in sorted(glob.glob(os.path.join(ROOT, 'puzzles',
+                                               'dir01_tutorials', '*.phut'))):
+        with open(filen, 'r') as fileh:
+            positions.append((os.path.splitext(os.path.basename(filen))[0],
+                              json.load(fileh)))
+    for name, number_of_men in GENERATED:
+        positions.append((name, generated_position(name, number_of_men)))
+    return positions
+
+
+def load(d):
+    board = AbstractBoard(shape=d['shape'])
+    board.load_dict(d)
+    return board
+
+
+def farthest_move(board):
+    '''Returns the legal jump that removes the most men, or None.'''
+    best = None
+    best_length = -1
+    for coords, paths in sorted(board.legal_moves.items()):
+        length = max(len(path) for path in paths)
+        if length > best_length:
+            best, best_length = coords, length
+    return best
+
+
+def empty_square_near_ball(board):
+    ball_x, ball_y = board.ball_coords
+    for radius in range(1, max(board.shape)):
+        for dx in range(-radius, radius + 1):
+            for dy in range(-radius, radius + 1):
+                coords = (ball_x + dx, ball_y + dy)
+                if coords not in board.man_coords and \
+                        0 <= coords[0] < board.shape[0] and \
+                        0 <= coords[1] < board.shape[1] and \
+                        coords != board.ball_coords:
+                    return coords
+
+
+# Each benchmark is (setup, run): setup(d) is untimed and returns the
+# argument of run, or None if the benchmark does not apply to d.
+
+def setup_get_legal_moves(d):
+    return (tuple(d['ball_coords']), set(map(tuple, d['man_coords'])),
+            tuple(d['shape']))
+
+
+def run_get_legal_moves(args):
+    ball, men, shape = args
+    get_legal_moves(ball, men, shape)
+
+
+def setup_get_legal_moves_batch(d):
+    return [setup_get_legal_moves(d)] * BATCH
+
+
+def run_get_legal_moves_batch(batch):
+    for args in batch:
+        run_get_legal_moves(args)
+
+
+def setup_batch_legal_moves(d):
+    if batch_legal_moves is None:
+        return None
+    return batch_from_boards([load(d)] * BATCH)
+
+
+def run_batch_legal_moves(args):
+    occupancy, balls = args
+    batch_legal_moves(occupancy, balls)
+
+
+def setup_speculative_move(d):
+    board = load(d)
+    coords = farthest_move(board)
+    if coords is None:
+        return None
+    return board, coords
+
+
+def run_speculative_move(args):
+    board, coords = args
+    board.speculative_move_ball_to(coords)
+
+
+def setup_speculative_play(d):
+    board = load(d)
+    board.legal_moves
+    return board, empty_square_near_ball(board)
+
+
+def run_speculative_play(args):
+    board, coords = args
+    board.speculative_play_man_at(coords)
+
+
+# Speculating only invalidates the speculative legal moves, which are
+# found when first read; these time the change and that read together.
+
+def run_speculative_move_read(args):
+    board, coords = args
+    board.speculative_move_ball_to(coords)
+    board.speculative_legal_moves
+
+
+def run_speculative_play_read(args):
+    board, coords = args
+    board.speculative_play_man_at(coords)
+    board.speculative_legal_moves
+
+
+def setup_confirm_move(d):
+    args = setup_speculative_move(d)
+    if args is None:
+        return None
+    run_speculative_move(args)
+    return args[0]
+
+
+def setup_confirm_play(d):
+    args = setup_speculative_play(d)
+    run_speculative_play(args)
+    return args[0]
+
+
+def run_confirm(board):
+    board.confirm_speculation()
+
+
+def setup_ai(d):
+    board = load(d)
+    board.legal_moves
+    return AI(board, mode='heuristic')
+
+
+def run_ai(ai):
+    ai.get_move()
+
+
+def setup_board(d):
+    board = load(d)
+    board.legal_moves
+    return board
+
+
+def run_serialise(board):
+    board.serialise()
+
+
+def run_load_dict(d):
+    AbstractBoard(shape=d['shape']).load_dict(d)
+
+
+def run_as_ascii(board):
+    board.as_ascii()
+
+
+BENCHMARKS = [
+    ('get_legal_moves', setup_get_legal_moves, run_get_legal_moves),
+    ('get_legal_moves/x{}'.format(BATCH), setup_get_legal_moves_batch,
+     run_get_legal_moves_batch),
+    ('batch_legal_moves/x{}'.format(BATCH), setup_batch_legal_moves,
+     run_batch_legal_moves),
+    ('speculative_move_ball_to', setup_speculative_move,
+     run_speculative_move),
+    ('speculative_play_man_at', setup_speculative_play, run_speculative_play),
+    ('speculative_move_ball_to+legal_moves', setup_speculative_move,
+     run_speculative_move_read),
+    ('speculative_play_man_at+legal_moves', setup_speculative_play,
+     run_speculative_play_read),
+    ('confirm_speculation/move', setup_confirm_move, run_confirm),
+    ('confirm_speculation/play', setup_confirm_play, run_confirm),
+    ('ai_get_move/heuristic', setup_ai, run_ai),
+    ('serialise', setup_board, run_serialise),
+    ('load_dict', lambda d: d, run_load_dict),
+    ('as_ascii', setup_board, run_as_ascii),
+]
+
+
+def percentile(samples, fraction):
+    '''Returns the value at fraction of the sorted samples, by nearest
+    rank.'''
+    index = min(len(samples) - 1, int(fraction * len(samples)))
+    return samples[index]
+
+
+def measure(setup, run, d, repeats):
+    '''Returns a dict of statistics of repeats timed calls, or None if
+    the benchmark does not apply to d.'''
+    samples = []
+    gc.collect()
+    for i in range(repeats):
+        args = setup(d)
+        if args is None:
+            return None
+        gc.disable()
+        start = time.perf_counter()
+        run(args)
+        samples.append(time.perf_counter() - start)
+        gc.enable()
+    samples.sort()
+    return {'median': percentile(samples, 0.5),
+            'p90': percentile(samples, 0.9),
+            'p99': percentile(samples, 0.99),
+            'min': samples[0],
+            'mean': sum(samples) / len(samples),
+            'samples': len(samples)}
+
+
+def run_suite(repeats, pattern=None):
+    results = {}
+    for position_name, d in corpus():
+        for name, setup, run in BENCHMARKS:
+            key = '{}/{}'.format(name, position_name)
+            if pattern is not None and pattern not in key:
+                continue
+            stats = measure(setup, run, d, repeats)
+            if stats is not None:
+                results[key] = stats
+    return {'version': SUITE_VERSION,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'repeats': repeats,
+            'results': results}
+
+
+def compare(run, baseline, threshold, noise=2e-6):
+    '''Returns a list of (key, baseline median, new median, change) for
+    every benchmark in both runs, and the list of regressed keys. A
+    slowdown of less than noise seconds is never a regression, as
+    timings of a few microseconds vary by more than the threshold from
+    run to run.'''
+    rows = []
+    regressions = []
+    for key in sorted(run['results']):
+        if key not in baseline['results']:
+            continue
+        old = baseline['results'][key]['median']
+        new = run['results'][key]['median']
+        change = (new - old) / old if old else 0.
+        rows.append((key, old, new, change))
+        if change > threshold and new - old > noise:
+            regressions.append(key)
+    return rows, regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the engine on a fixed corpus.')
+    parser.add_argument('-o', '--output', default=None,
+                        help='file to write the json results to (default: '
+                        'standard output)')
+    parser.add_argument('--repeats', type=int, default=200,
+                        help='timed calls per benchmark and position')
+    parser.add_argument('--filter', default=None,
+                        help='only run benchmarks whose name/position '
+                        'contains this')
+    parser.add_argument('--compare', default=None, metavar='BASELINE',
+                        help='json results of an earlier run to compare '
+                        'with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='median slowdown, as a fraction, reported as '
+                        'a regression')
+    parser.add_argument('--noise', type=float, default=2e-6,
+                        help='smallest median slowdown, in seconds, '
+                        'reported as a regression')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    run = run_suite(args.repeats, args.filter)
+    text = json.dumps(run, indent=1, sort_keys=True)
+    if args.output is not None:
+        with open(args.output, 'w') as fileh:
+            fileh.write(text + '\n')
+    elif args.compare is None:
+        print(text)
+
+    if args.compare is None:
+        return
+    with open(args.compare, 'r') as fileh:
+        baseline = json.load(fileh)
+    rows, regressions = compare(run, baseline, args.threshold,
+                                  args.noise)
+    print('{:<48} {:>10} {:>10} {:>8}'.format('benchmark', 'baseline',
+                                               'now', 'change'))
+    for key, old, new, change in rows:
+        print('{:<48} {:>10.1f} {:>10.1f} {:>+7.1f}%{}'.format(
+            key, old * 1e6, new * 1e6, change * 100,
+            ' REGRESSION' if key in regressions else ''))
+    print('medians in microseconds; {} of {} benchmarks regressed by more '
+          'than {:.0f}%'.format(len(regressions), len(rows),
+                                args.threshold * 100))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+'''Rebuilds puzzles/manifest.json, the index the puzzle browser reads.
+
+Only puzzles that are new or have changed since the last build are
+solved, so run this after adding or editing puzzles.
+
+Example:
+
+    python build_manifest.py
+    python build_manifest.py --rebuild --max-depth 4
+'''
+
+import argparse
+import os
+import time
+
+from engine.manifest import MANIFEST_NAME, build_manifest, load_manifest, \
+    save_manifest
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Rebuild the puzzle manifest.')
+    parser.add_argument('root', nargs='?', default='puzzles',
+                        help='directory of puzzle sets')
+    parser.add_argument('--max-depth', type=int, default=3,
+                        help='longest win to look for when rating '
+                        'difficulty')
+    parser.add_argument('--time-limit', type=float, default=5.,
+                        help='seconds to solve each puzzle')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='solve every puzzle again')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    filen = os.path.join(args.root, MANIFEST_NAME)
+    previous = None if args.rebuild else load_manifest(filen)
+    start = time.time()
+    manifest, read = build_manifest(args.root, previous, args.max_depth,
+                                    args.time_limit)
+    save_manifest(manifest, filen)
+    total = sum(len(puzzle_set['puzzles']) for puzzle_set in manifest['sets'])
+    print('{} sets, {} puzzles ({} solved) in {:.2f} s; wrote {}'.format(
+        len(manifest['sets']), total, read, time.time() - start, filen))
+
+
+if __name__ == '__main__':
+    main()
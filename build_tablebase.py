@@ -0,0 +1,47 @@
+'''Generates the endgame tablebase of winning jumps near the goals.
+
+The table (see engine.tablebase) only depends on the rules, not on the
+board shape, so it needs building once. Pass the file to selfplay.py
+with --tablebase, or to AI(..., tablebase=filen).
+
+Example:
+
+    python build_tablebase.py
+    python build_tablebase.py -o /tmp/endgame.phtb --processes 4
+'''
+
+import argparse
+import multiprocessing
+import time
+
+from engine.tablebase import TABLEBASE_NAME, generate, regions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Generate the endgame tablebase.')
+    parser.add_argument('-o', '--output', default=TABLEBASE_NAME,
+                        help='file to write the tablebase to')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: one per cpu)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = time.time()
+    if args.processes == 1:
+        entries = generate(args.output)
+    else:
+        pool = multiprocessing.Pool(args.processes)
+        try:
+            entries = generate(args.output, pool)
+        finally:
+            pool.terminate()
+            pool.join()
+    print('{} regions, {} positions in {:.2f} s; wrote {}'.format(
+        len(regions()), entries, time.time() - start, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+'''Headless phutball engine: board state, move generation, win
+detection, serialisation and ai.
+
+Nothing in this package imports Kivy (or any other gui code), so it can
+be used on machines without a display stack, e.g. for batch analysis.
+The gui uses it through the abstractboard module.
+'''
+
+from .bitboard import BitBoard
+from .moves import get_legal_moves, get_reachable_moves
+from .board import AbstractBoard
+from .ai import AI
+from .transposition import TranspositionTable
@@ -0,0 +1,214 @@
+'''Module for a simple phutball playing ai.'''
+
+import logging
+
+from .search import SearchEngine
+from .mcts import MCTSPlayer
+from .tablebase import open_tablebase
+
+logger = logging.getLogger(__name__)
+
+def max_height_in_coords(coords):
+    '''Returns the first of coords with the greatest y, or None if
+    coords is empty.'''
+    return max(coords, key=lambda coord: coord[1], default=None)
+
+def min_height_in_coords(coords):
+    '''Returns the first of coords with the smallest y, or None if
+    coords is empty.'''
+    return min(coords, key=lambda coord: coord[1], default=None)
+
+class AI(object):
+    '''Chooses moves for the current player of an AbstractBoard.
+
+    mode 'heuristic' is a fast one-ply heuristic for the bottom player.
+    mode 'search' runs an alpha-beta search (see engine.search) for
+    whichever player is to move, deepening for time_limit seconds (and
+    to at most max_depth moves, if that is given).
+    mode 'mcts' runs a Monte Carlo tree search (see engine.mcts) over
+    workers processes for time_limit seconds; call close() to stop the
+    worker pool.
+
+    get_move returns ('move', coords) or ('play', coords). For jumps
+    chosen by the search, self.path also holds the squares the ball
+    should jump from, so that the exact searched move can be replayed.
+
+    tablebase optionally names a tablebase file (see engine.tablebase)
+    for the search and mcts modes to look up wins near the goals in.
+
+    If progress is set, the search calls it after each completed
+    iteration (see SearchEngine.search). stop() makes a search or mcts
+    search in progress return early, and may be called from another
+    thread; searches stay stopped until resume(). The heuristic is
+    quick and is not stopped.
+    '''
+
+    def __init__(self, abstractboard, mode='heuristic', time_limit=1.0,
+                 max_depth=None, workers=None, tablebase=None):
+        self.abstractboard = abstractboard
+        self.mode = mode
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.workers = workers
+        self.tablebase = tablebase
+        self.engine = None
+        self.mcts = None
+        self.path = None
+        self.last_search = None
+        self.progress = None
+        self.stopped = False
+
+    def get_move(self):
+        self.path = None
+        move = None
+        if self.mode == 'search':
+            move = self.get_search_move()
+        elif self.mode == 'mcts':
+            move = self.get_mcts_move()
+        if move is not None:
+            return move
+        return self.get_heuristic_move()
+
+    def stop(self):
+        # Set first: an engine or mcts player created after this checks
+        # it (see _created).
+        self.stopped = True
+        for searcher in (self.engine, self.mcts):
+            if searcher is not None:
+                searcher.stop()
+
+    def resume(self):
+        self.stopped = False
+        for searcher in (self.engine, self.mcts):
+            if searcher is not None:
+                searcher.resume()
+
+    def _created(self, searcher):
+        '''Stops a newly created engine or mcts player if stop() has been
+        called, possibly from another thread, and not resumed.'''
+        if self.stopped:
+            searcher.stop()
+
+    def search_engine(self):
+        '''Returns the SearchEngine for the board's shape, creating it
+        if needed. It is kept between moves, with its transposition
+        table.'''
+        board = self.abstractboard
+        engine = self.engine
+        if engine is None or engine.geometry.shape != tuple(board.shape):
+            table = board.transposition_table
+            if engine is not None and table is None:
+                table = engine.transposition_table
+            tablebase = None
+            if self.tablebase is not None:
+                tablebase = open_tablebase(self.tablebase)
+            engine = self.engine = SearchEngine(
+                board.shape, table, max_depth=self.max_depth,
+                time_limit=self.time_limit, tablebase=tablebase)
+            self._created(engine)
+        return engine
+
+    def close(self):
+        if self.mcts is not None:
+            self.mcts.close()
+            self.mcts = None
+
+    def get_mcts_move(self):
+        board = self.abstractboard
+        if (self.mcts is None or
+                self.mcts.geometry.shape != tuple(board.shape)):
+            self.close()
+            self.mcts = MCTSPlayer(board.shape, workers=self.workers,
+                                   time_limit=self.time_limit,
+                                   tablebase=self.tablebase)
+            self._created(self.mcts)
+        result = self.mcts.search(board.ball_coords, board.man_coords,
+                                  board.current_player,
+                                  time_limit=self.time_limit)
+        self.last_search = result
+        if result is None:
+            return None
+        self.path = result.path
+        return (result.move_type, result.coords)
+
+    def get_search_move(self):
+        board = self.abstractboard
+        engine = self.search_engine()
+        result = engine.search(board.ball_coords, board.man_coords,
+                               board.current_player,
+                               time_limit=self.time_limit,
+                               max_depth=self.max_depth,
+                               progress=self.progress)
+        self.last_search = result
+        if result is None:
+            return None
+        self.path = result.path
+        return (result.move_type, result.coords)
+
+    def get_heuristic_move(self):
+        legal_moves = self.abstractboard.legal_moves
+        current_pos = self.abstractboard.ball_coords
+        current = self.abstractboard.ball_coords
+        shape = self.abstractboard.shape
+
+        if len(legal_moves) == 0:
+            return ('play', (current_pos[0], current_pos[1]-1))
+
+        # Check max/min possible moves
+        max_move = max_height_in_coords(legal_moves)
+        min_move = min_height_in_coords(legal_moves)
+        y_max = max_move[1]
+        y_min = min_move[1]
+
+        # If can win, win
+        if min_move[1] <= 1:
+            logger.debug('Win by playing at %s', min_move)
+            return ('move', min_move)
+
+        # If opponent can move 6 spaces and end up closer than that to the bottom
+        jump = y_max - current[1]
+        if jump >= 6:
+            if shape[1]-2 - y_max < jump:
+                logger.debug('Opponent can jump too far to %s, '
+                             'trying to prevent.', max_move)
+
+                # If can jump more than one move and end up closer to bottom
+                down_jump = current[1] - y_min
+                if down_jump >= 6:
+                    if 2 + y_max < jump:
+                        logger.debug('Performing counter-jump to %s',
+                                     min_move)
+                        return ('move', min_move)
+                        
+                # If can flip parity usefully, do so
+                best_change = max_move
+                best_height = y_max
+                best_play = None
+                for coords in legal_moves[max_move][0][1:]:
+                    coords = tuple(coords)
+                    self.abstractboard.speculative_play_man_at(coords)
+                    new_legal_moves = self.abstractboard.speculative_legal_moves
+                    new_max_coord = max_height_in_coords(new_legal_moves)
+                    # No moves at all is the best possible outcome.
+                    new_height = (-1 if new_max_coord is None
+                                  else new_max_coord[1])
+                    if new_height < best_height:
+                        best_change = new_max_coord
+                        best_height = new_height
+                        best_play = coords
+                    self.abstractboard.reset_speculation()
+                if best_play is not None:
+                    logger.debug('Flipping parity, playing at %s',
+                                 best_change)
+                    return ('play', best_play)
+
+        # If opponent can win, at least try to jump away.
+        # TODO
+
+        # Else, make a move to get higher
+        logger.debug('Nothing else useful to do, trying to jump further.')
+        if current_pos[1] < min_move[1]:
+            new_move = (current_pos[0], current_pos[1]-1)
+        else:
+            new_move = (min_move[0], min_move[1]-1)
+        return ('play', new_move)
@@ -0,0 +1,178 @@
+'''Move generation for many positions at once, vectorised with NumPy.
+
+The search is the same breadth-first search over (ball square,
+remaining men) states as moves.get_reachable_moves, but each depth is
+processed as a whole batch of states: ray scans step every state one
+square at a time in each direction, the men of each state are the bits
+of a few 64-bit words, and equal states are found by sorting, so no
+step loops over the states in Python.
+
+On 15x19 boards with the ball in the middle, batches of 5000 random
+positions are two and a half times faster than calling
+moves.get_reachable_moves on each in turn: about 590,000 positions a
+second with one square in twenty holding a man, and 310,000 with one
+in eight. Batches of a thousand such sparse positions only break even,
+and batches of a hundred are four times slower. Dense positions, whose
+searches reach thousands of states each, are three to four times
+faster at any batch size. The batch_legal_moves benchmarks of
+benchmarks/suite.py measure it against get_legal_moves.
+
+This module needs NumPy, which the rest of the engine does not, so it
+is not imported by the engine package itself.
+'''
+
+import numpy as np
+
+from .moves import directions
+
+
+def batch_legal_moves(occupancy, balls, maxdepth=None):
+    '''Returns the legal landing squares for a batch of positions.
+
+    occupancy is a boolean array of shape (N, width, height), true
+    where there is a man. balls is an integer array of shape (N, 2)
+    holding the ball coordinates of each position.
+
+    Returns a boolean array of shape (N, width, height + 2) that is true
+    at every square the ball can land on, with row y at index y + 1 so
+    that the rows past the goal lines fit; the squares for board n (see
+    landing_squares) are the keys of get_legal_moves for that board,
+    with the same maxdepth.
+    '''
+    occupancy = np.asarray(occupancy, dtype=bool)
+    balls = np.asarray(balls, dtype=np.intp)
+    number, width, height = occupancy.shape
+    landings = np.zeros((number, width, height + 2), dtype=bool)
+
+    # Pad the boards with one empty square on every side, so a run of
+    # men always ends on the board or on the padding, and number the
+    # squares of the padded board x * stride + y. The men of each state
+    # are kept as the bits of 64-bit words, bit i of the board in bit
+    # i % 64 of word i // 64.
+    stride = height + 2
+    padded = np.zeros((number, width + 2, stride), dtype=bool)
+    padded[:, 1:-1, 1:-1] = occupancy
+    men = _pack_men(padded.reshape(number, -1))
+    deltas = [dx * stride + dy for dx, dy in directions]
+
+    board = np.arange(number, dtype=np.intp)
+    ball_x = balls[:, 0] + 1
+    ball_y = balls[:, 1] + 1
+    valid = ((ball_x >= 1) & (ball_x <= width) &
+             (ball_y >= 1) & (ball_y <= height))
+    board, ball, men = (board[valid], (ball_x * stride + ball_y)[valid],
+                        men[valid])
+
+    depth = 1
+    while len(board) and (maxdepth is None or depth <= maxdepth):
+        new_states = [_jumps_in_direction(board, ball, men, delta)
+                      for delta in deltas]
+        board = np.concatenate([state[0] for state in new_states])
+        ball = np.concatenate([state[1] for state in new_states])
+        men = np.concatenate([state[2] for state in new_states])
+
+        # Landing on the padding columns is off the board, but the
+        # padding rows are the rows past the goal lines.
+        x, y = np.divmod(ball, stride)
+        landed = (x >= 1) & (x <= width)
+        board, ball, men, x, y = (board[landed], ball[landed],
+                                  men[landed], x[landed], y[landed])
+        if not len(board):
+            break
+        landings[board, x - 1, y] = True
+
+        # No jump continues from past a goal line.
+        on_board = (y >= 1) & (y <= height)
+        board, ball, men = board[on_board], ball[on_board], men[on_board]
+        if not len(board):
+            break
+
+        # Keep one of each set of equal states. Every jump removes at
+        # least one man, so a state can only come back at a later depth
+        # by a different route, which is rare enough that searching it
+        # again costs less than remembering every state.
+        keep = _first_of_equal(board, ball, men)
+        board, ball, men = board[keep], ball[keep], men[keep]
+        depth += 1
+    return landings
+
+
+def _pack_men(squares):
+    '''Packs a boolean array of shape (N, squares) into an array of
+    shape (N, words) of 64-bit words.'''
+    bits = np.packbits(squares, axis=1, bitorder='little')
+    padding = -bits.shape[1] % 8
+    if padding:
+        bits = np.pad(bits, ((0, 0), (0, padding)))
+    return np.ascontiguousarray(bits).view('<u8')
+
+
+def _has_man(men, square):
+    return (men[np.arange(len(square)), square >> 6] >>
+            (square & 63).astype(np.uint64)) & np.uint64(1) != 0
+
+
+def _jumps_in_direction(board, ball, men, delta):
+    '''Makes the jump in direction delta from every state that has
+    one. Returns the board, ball and men arrays of the new states.'''
+    square = ball + delta
+    jumping = _has_man(men, square)
+    board, square, men = board[jumping], square[jumping], men[jumping]
+    new_men = men.copy()
+    rows = np.arange(len(square))
+
+    running = np.ones(len(square), dtype=bool)
+    while running.any():
+        jumped = rows[running]
+        new_men[jumped, square[jumped] >> 6] ^= (
+            np.uint64(1) << (square[jumped] & 63).astype(np.uint64))
+        square = square + delta * running
+        running = _has_man(men, square)
+    return board, square, new_men
+
+
+def _first_of_equal(board, ball, men):
+    '''Returns the indices of one state from each set of equal
+    states.
+
+    The states are sorted by a 64-bit hash of the whole state, which
+    brings equal states together, and then compared in full with their
+    neighbours. A hash collision can at worst separate two equal states,
+    so that both are kept.'''
+    position = board.astype(np.uint64) << np.uint64(32) | ball.astype(
+        np.uint64)
+    hashes = position * _MULTIPLIER
+    for word in men.T:
+        hashes ^= word
+        hashes *= _MULTIPLIER
+        hashes ^= hashes >> np.uint64(29)
+    order = np.argsort(hashes)
+    position, men = position[order], men[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = ((position[1:] != position[:-1]) |
+                 (men[1:] != men[:-1]).any(axis=1))
+    return order[first]
+
+
+# An odd constant with well mixed bits, for _first_of_equal.
+_MULTIPLIER = np.uint64(0x9e3779b97f4a7c15)
+
+
+def batch_from_boards(boards):
+    '''Builds the occupancy and ball arrays for batch_legal_moves from a
+    list of AbstractBoards, which must all have the same shape.'''
+    width, height = boards[0].shape
+    occupancy = np.zeros((len(boards), width, height), dtype=bool)
+    balls = np.zeros((len(boards), 2), dtype=np.intp)
+    for i, board in enumerate(boards):
+        for x, y in board.man_coords:
+            occupancy[i, x, y] = True
+        balls[i] = board.ball_coords
+    return occupancy, balls
+
+
+def landing_squares(landings, n):
+    '''Returns the set of landing coordinates for board n of a
+    batch_legal_moves result.'''
+    xs, ys = np.nonzero(landings[n])
+    return set(zip(xs.tolist(), (ys - 1).tolist()))
@@ -0,0 +1,305 @@
+'''Compact position representation, packing the men on a board into a
+single integer bitmask.
+
+Squares are numbered row by row with one guard column between rows and
+a guard row above and below the board, so that stepping off any edge
+of the board in any of the eight directions always lands on a guard
+square that can never hold a man. This lets ray scans run without any
+explicit bounds checks.
+
+The guard squares of the rows above and below the board, past the two
+goal lines, still have coordinates: the ball may land there, winning
+the game, but no man can be placed there and no jump continues from
+there.
+'''
+
+_geometries = {}
+
+
+class BoardGeometry(object):
+    '''Precomputed index tables for a board of a given shape.'''
+
+    def __init__(self, shape):
+        self.shape = shape = (int(shape[0]), int(shape[1]))
+        width, height = shape
+        self.stride = stride = width + 1
+        self.size = (height + 2) * stride + 1
+
+        self.coords = [None] * self.size
+        on_board = 0
+        for y in range(height):
+            for x in range(width):
+                index = (y + 1) * stride + x + 1
+                self.coords[index] = (x, y)
+                on_board |= 1 << index
+        self.on_board = on_board
+
+        past_goals = 0
+        for y in (-1, height):
+            for x in range(width):
+                index = (y + 1) * stride + x + 1
+                self.coords[index] = (x, y)
+                past_goals |= 1 << index
+        self.past_goals = past_goals
+
+        self.deltas = [dx + dy * stride for dx, dy in
+                       [(1, 0), (1, 1), (0, 1), (-1, 1),
+                        (-1, 0), (-1, -1), (0, -1), (1, -1)]]
+
+    def index(self, coords):
+        '''Returns the bit index of coords, or None if coords are not on
+        the board.'''
+        x, y = int(coords[0]), int(coords[1])
+        if x < 0 or y < 0 or x >= self.shape[0] or y >= self.shape[1]:
+            return None
+        return (y + 1) * self.stride + x + 1
+
+
+def geometry_for(shape):
+    '''Returns the (cached) BoardGeometry for the given shape.'''
+    shape = (int(shape[0]), int(shape[1]))
+    geometry = _geometries.get(shape)
+    if geometry is None:
+        geometry = _geometries[shape] = BoardGeometry(shape)
+    return geometry
+
+
+def iter_indices(bits):
+    '''Yields the index of every set bit in bits, lowest first.'''
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class BitBoard(object):
+    '''A set-like collection of man coordinates, stored as an integer
+    bitmask. Supports the subset of the set interface used by
+    AbstractBoard, so it can be used in place of a set of tuples.
+    '''
+
+    __slots__ = ('geometry', 'bits')
+
+    def __init__(self, shape=(15, 19), coords=(), bits=0):
+        self.geometry = geometry_for(shape)
+        self.bits = bits
+        for entry in coords:
+            self.add(entry)
+
+    @property
+    def shape(self):
+        return self.geometry.shape
+
+    def _index(self, coords):
+        index = self.geometry.index(coords)
+        if index is None:
+            raise ValueError('{} is not on a board of shape {}'.format(
+                tuple(coords), self.geometry.shape))
+        return index
+
+    def _other_bits(self, other):
+        if isinstance(other, BitBoard) and other.geometry is self.geometry:
+            return other.bits
+        bits = 0
+        for coords in other:
+            index = self.geometry.index(coords)
+            if index is not None:
+                bits |= 1 << index
+        return bits
+
+    def __contains__(self, coords):
+        index = self.geometry.index(coords)
+        if index is None:
+            return False
+        return self.bits >> index & 1 == 1
+
+    def __iter__(self):
+        coords = self.geometry.coords
+        for index in iter_indices(self.bits):
+            yield coords[index]
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+    def __bool__(self):
+        return self.bits != 0
+    __nonzero__ = __bool__
+
+    def __eq__(self, other):
+        if isinstance(other, BitBoard):
+            return (self.geometry is other.geometry and
+                    self.bits == other.bits)
+        if isinstance(other, (set, frozenset)):
+            return set(self) == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __sub__(self, other):
+        return BitBoard(self.shape, bits=self.bits & ~self._other_bits(other))
+
+    def __or__(self, other):
+        return BitBoard(self.shape, bits=self.bits | self._other_bits(other))
+
+    def __and__(self, other):
+        return BitBoard(self.shape, bits=self.bits & self._other_bits(other))
+
+    def __repr__(self):
+        return 'BitBoard({}, {})'.format(self.shape, sorted(self))
+
+    def copy(self):
+        return BitBoard(self.shape, bits=self.bits)
+
+    def add(self, coords):
+        self.bits |= 1 << self._index(coords)
+
+    def remove(self, coords):
+        index = self.geometry.index(coords)
+        if index is None or not self.bits >> index & 1:
+            raise KeyError(tuple(coords))
+        self.bits ^= 1 << index
+
+    def discard(self, coords):
+        index = self.geometry.index(coords)
+        if index is not None:
+            self.bits &= ~(1 << index)
+
+    def update(self, coords_list):
+        for coords in coords_list:
+            self.add(coords)
+
+    def clear(self):
+        self.bits = 0
+
+
+class LegalMoves(dict):
+    '''The result of get_legal_moves: a dict from each landing square
+    to the list of paths (the squares the ball jumps from, starting
+    with its own) that reach it.
+
+    Two paths that jump the same men and land on the same square give
+    the same position, so only one of them is kept: the shortest, and
+    the first found among equally short ones. Every path in a list
+    therefore removes a different set of men, and the lists are ordered
+    shortest first, so the first path is the canonical one.
+
+    number_of_states is the number of (ball square, remaining men)
+    states find_jumps visited to fill it, including the start, and
+    number_of_paths the number of paths it added.
+    '''
+
+    def __init__(self, geometry=None, men=0):
+        dict.__init__(self)
+        self.geometry = geometry
+        self.men = men
+        self.number_of_states = 0
+        self.number_of_paths = 0
+        # Landing square -> the men left after each path, in order.
+        self.remaining = {}
+
+    def _add(self, landing, path, remaining):
+        self.number_of_paths += 1
+        if landing not in self:
+            self[landing] = [path]
+            self.remaining[landing] = [remaining]
+        else:
+            self[landing].append(path)
+            self.remaining[landing].append(remaining)
+
+    def shortest_path(self, coords):
+        '''Returns the canonical (shortest) path to coords.'''
+        return self[tuple(coords)][0]
+
+    def alternatives(self, coords):
+        '''Returns a list of (path, removed men) for every genuinely
+        different way to reach coords, shortest first.'''
+        coords = tuple(coords)
+        squares = self.geometry.coords
+        return [(path, [squares[index] for index in
+                        iter_indices(self.men ^ remaining)])
+                for path, remaining in zip(self[coords],
+                                           self.remaining[coords])]
+
+
+def find_jumps(geometry, ball, men, maxdepth=None, first_deltas=None,
+               previous_path=(), legal_moves=None, probe=False):
+    '''Finds every distinct jump sequence from ball, breadth first over
+    (ball square, remaining men) states so that each position is
+    reached once, by a shortest path. maxdepth optionally limits the
+    number of jumps, and first_deltas the directions of the first jump.
+
+    Returns a LegalMoves, and if probe is True also the mask of every
+    square whose occupancy the search read.
+    '''
+    coords = geometry.coords
+    past_goals = geometry.past_goals
+    if legal_moves is None:
+        legal_moves = LegalMoves(geometry, men)
+    start = (ball, men)
+    paths = {start: list(previous_path) + [coords[ball]]}
+    frontier = [start]
+    deltas = first_deltas or geometry.deltas
+    probed = 0
+    depth = 1
+    while frontier and (maxdepth is None or depth <= maxdepth):
+        next_frontier = []
+        for state in frontier:
+            ball, men = state
+            path = paths[state]
+            for delta in deltas:
+                square = ball + delta
+                if probe:
+                    probed |= 1 << square
+                if not men >> square & 1:
+                    continue
+                jumped = 0
+                while men >> square & 1:
+                    jumped |= 1 << square
+                    square += delta
+                if probe:
+                    probed |= jumped | 1 << square
+                landing = coords[square]
+                if landing is None:
+                    continue
+                new_state = (square, men ^ jumped)
+                if new_state in paths:
+                    continue
+                paths[new_state] = path + [landing]
+                legal_moves._add(landing, path, men ^ jumped)
+                if not past_goals >> square & 1:
+                    next_frontier.append(new_state)
+        frontier = next_frontier
+        deltas = geometry.deltas
+        depth += 1
+    legal_moves.number_of_states += len(paths)
+    if probe:
+        return legal_moves, probed
+    return legal_moves
+
+
+def get_legal_moves_bitboard(ball_coords, men, previous_path=None,
+                             legal_moves=None, depth=1, maxdepth=None):
+    '''Equivalent of moves.get_legal_moves for men stored in a
+    BitBoard. Jumped stones are removed by masking, so no copies of the
+    position are made during the search.
+    '''
+    geometry = men.geometry
+    found = LegalMoves(geometry, men.bits)
+    if maxdepth is not None:
+        maxdepth -= depth - 1
+    ball = geometry.index(ball_coords)
+    if ball is not None and (maxdepth is None or maxdepth >= 1):
+        find_jumps(geometry, ball, men.bits, maxdepth,
+                   previous_path=previous_path or (), legal_moves=found)
+    if legal_moves is None:
+        return found
+    # Added to the caller's dict, which may already hold moves.
+    for coords, paths in found.items():
+        legal_moves.setdefault(coords, []).extend(paths)
+    return legal_moves
@@ -0,0 +1,915 @@
+'''The AbstractBoard class, which keeps track of the full logical state
+of a game independently of any gui.'''
+
+from .ai import AI
+from .bitboard import BitBoard
+from .incremental import LegalMoveTracker
+from .moves import (get_speculative_move_identifiers,
+                    removed_coords_from_steps,
+                    remove_coords_lists_from_set,
+                    add_coords_lists_to_set,
+                    coords_on_board,
+                    get_legal_moves,
+                    get_reachable_moves)
+from .search import other_player
+from .zobrist import keys_for
+import contextlib
+import glob
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class MoveRecord(object):
+    '''Everything needed to undo one move: what changed, and the state
+    it changed from.
+
+    added is the list of men placed by the move; removed is a list of
+    lists of men jumped, one list per jump step. Legal moves (and the
+    tracker, if any) are those of the position before the move, so
+    they can be restored without a recompute; they may be None if they
+    were never computed. edits is the board's count of direct edits
+    (add_man, remove_man, setting ball_coords) when the record was
+    made; if the board has been edited since, the stored legal moves
+    are out of date.
+
+    Speculative records also keep the legal moves (and tracker) of the
+    position after them once they have been found, in next_legal_moves
+    and next_legal_move_tracker, so that stepping back to or forward
+    through that position again needs no recompute.
+
+    A confirmed speculation may both place men and jump, possibly over
+    men it placed or onto squares it emptied; its changes then holds
+    every ('add', coords) and ('remove', coords) in the order they
+    happened, which is applied in order and undone in reverse.
+    '''
+
+    __slots__ = ('move_type', 'coords', 'steps', 'added', 'removed',
+                 'changes', 'ball_coords', 'current_player', 'legal_moves',
+                 'legal_move_tracker', 'edits', 'next_legal_moves',
+                 'next_legal_move_tracker')
+
+    def __init__(self, move_type, coords, ball_coords, current_player,
+                 legal_moves=None, legal_move_tracker=None):
+        self.move_type = move_type
+        self.coords = coords
+        self.steps = None
+        self.added = []
+        self.removed = []
+        self.changes = None
+        self.ball_coords = ball_coords
+        self.current_player = current_player
+        self.legal_moves = legal_moves
+        self.legal_move_tracker = legal_move_tracker
+        self.edits = 0
+        self.next_legal_moves = None
+        self.next_legal_move_tracker = None
+
+    def ordered_changes(self):
+        '''Returns the list of ('add', coords) and ('remove', coords)
+        made by the move, in order.'''
+        if self.changes is not None:
+            return self.changes
+        changes = [('add', coords) for coords in self.added]
+        for segment in self.removed:
+            changes.extend(('remove', coords) for coords in segment)
+        return changes
+
+    def __repr__(self):
+        return 'MoveRecord({!r}, {}, steps={})'.format(
+            self.move_type, self.coords, self.steps)
+
+
+class AbstractBoard(object):
+    '''A class that keeps track of the board logic; piece positions, legal
+    moves etc.
+
+    If bitboard is True, men are stored in BitBoards rather than sets
+    of tuples, which makes move generation and speculation copies much
+    cheaper on crowded boards.
+
+    move_generator selects how legal moves are found: 'paths' records,
+    for every landing square, one shortest path for each different set
+    of men that can be jumped on the way (see bitboard.LegalMoves);
+    'reachable' records only one shortest path per landing square,
+    which is much cheaper when there are many chained jumps.
+
+    Jump chains are followed to their end by default, which on a board
+    of any size is bounded by the number of men; maxdepth optionally
+    limits the number of jumps in a legal move. The cost of following
+    every chain grows very quickly with the density of men, and
+    'reachable' copes with much denser boards than 'paths'.
+
+    If incremental is True, legal moves are kept up to date across man
+    placements and removals by searching again only the jump chains
+    that pass through the edited squares (see engine.incremental).
+
+    The board keeps Zobrist hashes (position_hash and
+    speculative_position_hash) of the real and speculative positions up
+    to date as they change. If a TranspositionTable is given, legal
+    moves are cached in it by position hash.
+
+    Moves are made in place with make_move and undone with
+    unmake_move, which restores the previous position and legal moves
+    from a MoveRecord without any copying. Speculative moves are kept
+    on a stack of records in the same way, so stepping back or
+    resetting the speculation only undoes what was changed. Legal
+    moves found at each step of a speculative jump are kept with its
+    record, and records stepped back from are kept in
+    speculative_redo, so stepping back to an earlier step, or forward
+    again along the same path, needs no recompute.
+
+    Legal moves are only found when read: moves and edits just mark
+    them out of date. Many edits can be grouped with bulk_edit (or
+    edit_men), after which the speculation is reset once.
+    '''
+
+    def __init__(self, shape=None, bitboard=False, move_generator='paths',
+                 incremental=False, transposition_table=None, maxdepth=None):
+        self.ai = None
+
+        if move_generator not in ('paths', 'reachable'):
+            raise ValueError(
+                'Unknown move generator {!r}'.format(move_generator))
+        self.move_generator = move_generator
+        self.maxdepth = maxdepth
+        self.bitboard = bitboard
+        self.incremental = incremental
+        self.legal_move_tracker = None
+        self.speculative_legal_move_tracker = None
+        self.transposition_table = transposition_table
+        self._shape = (15, 19)
+        if shape is not None:
+            self._shape = tuple(shape)
+
+        self.man_coords = self.new_man_set()
+        self._ball_coords = (0, 0)
+        self._legal_moves = {}
+        self._bulk_edits = 0
+        self._edits = 0
+
+        # Speculative attributes will hold data about the move the
+        # player is currently making, without disrupting the full
+        # logical state.
+        self.speculative_ball_coords = (0, 0)
+        self.speculative_man_coords = self.new_man_set()
+        self._speculative_legal_moves = {}
+        self.speculative_step_removals = []
+        self.speculative_steps = []
+
+        # Records of moves made on the real board, and of the
+        # speculative actions since the speculation was last reset.
+        # While the speculation is in sync, undoing every speculative
+        # record gives back the real position.
+        self.move_stack = []
+        self.speculative_stack = []
+        self._speculation_in_sync = True
+
+        # Speculative jump records undone by stepping back, latest
+        # first from the end, which can be replayed by moving forward
+        # along the same path.
+        self.speculative_redo = []
+
+        self.message = ''
+
+        self.current_player = 'top'
+
+        self._rehash()
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @shape.setter
+    def shape(self, shape):
+        shape = tuple(shape)
+        if shape == self._shape:
+            return
+        self._shape = shape
+        if self.bitboard:
+            self.man_coords = self.new_man_set(self.man_coords)
+            self.speculative_man_coords = self.new_man_set(
+                self.speculative_man_coords)
+        self._legal_moves = None
+        self._speculation_in_sync = False
+        self._rehash()
+
+    @property
+    def ball_coords(self):
+        return self._ball_coords
+
+    @ball_coords.setter
+    def ball_coords(self, coords):
+        # Legal moves are found again when next read.
+        self._ball_coords = coords
+        self._legal_moves = None
+        self._edits += 1
+        self._speculation_in_sync = False
+
+    @property
+    def legal_moves(self):
+        '''The legal moves of the real position. They are found when
+        first needed, rather than whenever the position changes.'''
+        if self._legal_moves is None:
+            self.update_legal_moves()
+        return self._legal_moves
+
+    @legal_moves.setter
+    def legal_moves(self, legal_moves):
+        self._legal_moves = legal_moves
+
+    @property
+    def speculative_legal_moves(self):
+        '''The legal moves of the speculative position, found when first
+        needed.'''
+        if self._speculative_legal_moves is None:
+            if self._speculation_in_sync and not self.speculative_stack:
+                # Same position as the real board.
+                self._speculative_legal_moves = self.legal_moves
+                self.speculative_legal_move_tracker = (
+                    self.legal_move_tracker)
+            else:
+                self.update_speculative_legal_moves()
+        return self._speculative_legal_moves
+
+    @speculative_legal_moves.setter
+    def speculative_legal_moves(self, legal_moves):
+        self._speculative_legal_moves = legal_moves
+
+    @property
+    def zobrist(self):
+        return keys_for(self.shape)
+
+    @property
+    def position_hash(self):
+        '''Zobrist hash of the men, ball square and side to move.'''
+        zobrist = self.zobrist
+        return (self._men_hash ^ zobrist.ball_key(self.ball_coords) ^
+                zobrist.side_key(self.current_player))
+
+    @property
+    def speculative_position_hash(self):
+        '''Zobrist hash of the speculative position.'''
+        zobrist = self.zobrist
+        return (self._speculative_men_hash ^
+                zobrist.ball_key(self.speculative_ball_coords) ^
+                zobrist.side_key(self.current_player))
+
+    def _rehash(self):
+        '''Recomputes the men hashes from scratch, for when a whole set
+        of men has been replaced.'''
+        self._men_hash = self.zobrist.hash_men(self.man_coords)
+        self._speculative_men_hash = self.zobrist.hash_men(
+            self.speculative_man_coords)
+
+    def _toggle_speculative_hash(self, coords_lists):
+        man_key = self.zobrist.man_key
+        for coords_segment in coords_lists:
+            for coords in coords_segment:
+                self._speculative_men_hash ^= man_key(coords)
+
+    def new_man_set(self, coords=()):
+        '''Returns a new collection of man coordinates, of the type
+        appropriate to this board.'''
+        coords = [tuple(entry) for entry in coords
+                  if coords_on_board(entry, self.shape)]
+        if self.bitboard:
+            return BitBoard(self.shape, coords)
+        return set(coords)
+
+    def generate_legal_moves(self, ball_coords, man_coords):
+        '''Returns the legal moves for the given position, using this
+        board's shape and move generator.'''
+        if self.move_generator == 'reachable':
+            return get_reachable_moves(ball_coords, man_coords, self.shape,
+                                       maxdepth=self.maxdepth)
+        return get_legal_moves(ball_coords, man_coords, self.shape,
+                               maxdepth=self.maxdepth)
+
+    def _updated_tracker(self, tracker, ball_coords, man_coords):
+        if tracker is None or tracker.shape != self.shape:
+            return LegalMoveTracker(self.shape, ball_coords, man_coords,
+                                    self.move_generator, self.maxdepth)
+        return tracker.updated(ball_coords, man_coords)
+
+    def verify_legal_moves(self):
+        '''Checks the real and speculative legal moves against a full
+        recompute. Returns True if both agree.'''
+        legal_moves = self.legal_moves
+        speculative_legal_moves = self.speculative_legal_moves
+        if self.incremental:
+            return all(tracker is None or tracker.verify() for tracker in
+                       (self.legal_move_tracker,
+                        self.speculative_legal_move_tracker))
+        fresh = self.generate_legal_moves(self.ball_coords, self.man_coords)
+        fresh_speculative = self.generate_legal_moves(
+            self.speculative_ball_coords, self.speculative_man_coords)
+        return (set(fresh) == set(legal_moves) and
+                set(fresh_speculative) == set(speculative_legal_moves))
+
+    def initialise_ai(self):
+        if not self.ai:
+            self.ai = AI(self)
+
+    def check_for_win(self):
+        '''Checks if either player has won.'''
+        ball_coords = self.ball_coords
+        if ball_coords[1] <= 1:
+            return 'bottom'
+        elif ball_coords[1] >= self.shape[1]-2:
+            return 'top'
+        else:
+            return 'none'
+
+    def _choose_path(self, legal_moves, coords):
+        '''Returns the path used to reach coords, or the list of
+        conflicting paths if there is more than one candidate. The paths
+        are shortest first, and each removes a different set of men.'''
+        possible_paths = legal_moves[coords]
+        if len(possible_paths) == 1 or len(possible_paths[0]) == 1:
+            return possible_paths[0], None
+        return None, possible_paths
+
+    def speculative_move_ball_to(self, coords):
+        '''Tries to move the ball to the given coordinates. Returns
+        appropriate instructions for how the board should change in
+        response.'''
+        coords = tuple(coords)
+
+        # Moving forward along a path the player has stepped back from
+        # replays its records, with their legal moves.
+        redo = self.speculative_redo
+        for depth in range(1, len(redo) + 1):
+            if redo[-depth].coords == coords:
+                for i in range(depth):
+                    self._redo_speculative_jump(redo.pop())
+                self._use_next_legal_moves()
+                return {'speculative_marker':
+                        get_speculative_move_identifiers(
+                            coords, self.speculative_steps)}
+
+        if coords in self.speculative_legal_moves:
+            steps, conflicts = self._choose_path(
+                self.speculative_legal_moves, coords)
+            if conflicts is not None:
+                return {'conflicting_paths': (coords, conflicts)}
+
+            # Each jump of the path is a separate record, so that the
+            # player can step back to any intermediate square.
+            self.speculative_redo = []
+            steps = list(map(tuple, steps))
+            ends = steps[1:] + [coords]
+            for step, end in zip(steps, ends):
+                self._make_speculative_jump(step, end)
+            return {'speculative_marker': get_speculative_move_identifiers(
+                coords, self.speculative_steps)}
+
+        if coords in self.speculative_steps:
+            index = self.speculative_steps.index(coords)
+            while len(self.speculative_steps) > index:
+                record = self._unmake_speculative()
+                if record.move_type == 'move':
+                    self.speculative_redo.append(record)
+            if record.legal_moves is not None:
+                self._speculative_legal_moves = record.legal_moves
+                self.speculative_legal_move_tracker = (
+                    record.legal_move_tracker)
+            else:
+                self._use_next_legal_moves()
+            return {'speculative_marker': get_speculative_move_identifiers(
+                coords, self.speculative_steps)}
+
+        return None
+
+    def _use_next_legal_moves(self):
+        '''Sets the speculative legal moves to those stored on the top
+        speculative record, which may be None if they were never
+        found.'''
+        if self.speculative_stack:
+            record = self.speculative_stack[-1]
+            self._speculative_legal_moves = record.next_legal_moves
+            if record.next_legal_moves is not None:
+                self.speculative_legal_move_tracker = (
+                    record.next_legal_move_tracker)
+        else:
+            self._speculative_legal_moves = None
+
+    def _make_speculative_jump(self, start, end):
+        '''Pushes a single speculative jump from start to end.'''
+        removed = removed_coords_from_steps(end, [start])
+        record = MoveRecord('move', end, self.speculative_ball_coords,
+                            self.current_player,
+                            self._speculative_legal_moves,
+                            self.speculative_legal_move_tracker)
+        record.steps = [start]
+        record.removed = removed
+        self._redo_speculative_jump(record)
+        self._speculative_legal_moves = None
+
+    def _redo_speculative_jump(self, record):
+        '''Applies a speculative jump record and pushes it on the
+        speculative stack. Does not update legal moves.'''
+        remove_coords_lists_from_set(record.removed,
+                                     self.speculative_man_coords)
+        self._toggle_speculative_hash(record.removed)
+        self.speculative_ball_coords = record.coords
+        self.speculative_steps.append(record.steps[0])
+        self.speculative_step_removals.extend(record.removed)
+        self.speculative_stack.append(record)
+
+    def _unmake_speculative(self):
+        '''Undoes the last speculative record, except for restoring
+        legal moves, and returns it.'''
+        record = self.speculative_stack.pop()
+        for coords in record.added:
+            self.speculative_man_coords.discard(coords)
+            self._speculative_men_hash ^= self.zobrist.man_key(coords)
+        if record.move_type == 'move':
+            add_coords_lists_to_set(record.removed,
+                                    self.speculative_man_coords)
+            self._toggle_speculative_hash(record.removed)
+            self.speculative_steps.pop()
+            del self.speculative_step_removals[-len(record.removed):]
+        self.speculative_ball_coords = record.ball_coords
+        return record
+
+    def speculative_play_man_at(self, coords):
+        '''Speculatively plays a man at the given coordinates.'''
+        coords = tuple(coords)
+        if not coords_on_board(coords, self.shape):
+            return
+        record = MoveRecord('play', coords, self.speculative_ball_coords,
+                            self.current_player,
+                            self._speculative_legal_moves,
+                            self.speculative_legal_move_tracker)
+        if coords not in self.speculative_man_coords:
+            self.speculative_man_coords.add(coords)
+            self._speculative_men_hash ^= self.zobrist.man_key(coords)
+            record.added = [coords]
+        self.speculative_stack.append(record)
+        self.speculative_redo = []
+        self._speculative_legal_moves = None
+
+    def confirm_speculation(self):
+        '''Sets the current speculation state to the real board state, as
+        one move on the move stack. Returns a list of permanent
+        instructions.'''
+        in_sync = self._speculation_in_sync
+        changes = []
+        if in_sync:
+            new_men = []
+            for record in self.speculative_stack:
+                new_men.extend(record.added)
+                changes.extend(('add', coords) for coords in record.added)
+                if record.move_type == 'move':
+                    for segment in record.removed:
+                        changes.extend(('remove', coords)
+                                       for coords in segment)
+            removed = list(self.speculative_step_removals)
+        else:
+            # The real men were edited during the speculation, so the
+            # differences can't be read from the speculative records.
+            new_men = list(self.speculative_man_coords - self.man_coords)
+            removed = [list(self.man_coords - self.speculative_man_coords)]
+            changes = ([('remove', coords) for coords in removed[0]] +
+                       [('add', coords) for coords in new_men])
+        if not self.speculative_steps and not new_men:
+            return None
+
+        # The whole speculation becomes a single move on the real board.
+        start_men = set(self.man_coords)
+        jumped = bool(self.speculative_steps)
+        record = MoveRecord('move' if jumped else 'play',
+                            self.speculative_ball_coords, self.ball_coords,
+                            self.current_player, self._legal_moves,
+                            self.legal_move_tracker)
+        record.edits = self._edits
+        record.added = new_men
+        record.removed = removed
+        record.changes = changes
+        if jumped:
+            record.steps = list(self.speculative_steps)
+        else:
+            record.coords = new_men[-1]
+        self._apply_record(record)
+        self._legal_moves = self._speculative_legal_moves
+        self.legal_move_tracker = self.speculative_legal_move_tracker
+
+        # The gui applies these to the position it already shows, so
+        # they are the net differences, whatever order they happened in.
+        instructions = {}
+        added = [coords for coords in new_men
+                 if coords in self.man_coords and coords not in start_men]
+        if added:
+            instructions['add'] = added
+        if jumped:
+            instructions.update({
+                'move_ball_to': self.ball_coords,
+                'move_ball_via': get_speculative_move_identifiers(
+                    tuple(self.ball_coords), self.speculative_steps),
+                'remove': [coords for coords in start_men
+                           if coords not in self.man_coords],
+                'clear_transient': None})
+
+        # The speculative position already matches the new real one, so
+        # it can be kept as it is rather than copied.
+        self.speculative_stack = []
+        self._speculation_in_sync = True
+        self.reset_speculation()
+        return instructions
+
+    def reset_speculation(self):
+        '''Returns the speculative position to the real one. If the
+        speculative position was derived from the current real position,
+        this undoes the speculative records; otherwise the real men are
+        copied.'''
+        if self._speculation_in_sync:
+            while self.speculative_stack:
+                self._unmake_speculative()
+        else:
+            self.speculative_man_coords = self.man_coords.copy()
+            self._speculative_men_hash = self._men_hash
+            self.speculative_stack = []
+            self._speculation_in_sync = True
+        self.speculative_ball_coords = self.ball_coords
+        self._speculative_legal_moves = self._legal_moves
+        self.speculative_legal_move_tracker = self.legal_move_tracker
+        self.speculative_step_removals = []
+        self.speculative_steps = []
+        self.speculative_redo = []
+
+    def reset(self, *args):
+        self.man_coords = self.new_man_set()
+        self._men_hash = 0
+        self.ball_coords = (0, 0)
+        self.legal_moves = []
+        self.legal_move_tracker = None
+        self.move_stack = []
+        self._speculation_in_sync = False
+        self.reset_speculation()
+
+    def add_man(self, coords):
+        coords = tuple(coords)
+        if coords in self.man_coords or not coords_on_board(coords,
+                                                            self.shape):
+            return None
+        self.man_coords.add(coords)
+        self._men_hash ^= self.zobrist.man_key(coords)
+        self._legal_moves = None
+        self._edits += 1
+        self._speculation_in_sync = False
+        return {'add': [coords]}
+
+    def remove_man(self, coords):
+        coords = tuple(coords)
+        if coords not in self.man_coords:
+            return None
+        self.man_coords.remove(coords)
+        self._men_hash ^= self.zobrist.man_key(coords)
+        self._legal_moves = None
+        self._edits += 1
+        self._speculation_in_sync = False
+        return {'remove': [coords]}
+
+    def toggle_man(self, coords):
+        coords = tuple(coords)
+        if coords in self.man_coords:
+            return self.remove_man(coords)
+        return self.add_man(coords)
+
+    def edit_men(self, added=(), removed=()):
+        '''Adds and removes many men at once, then resets the
+        speculation to the new position. Legal moves are found once,
+        when next read. Returns instructions for the men that actually
+        changed.'''
+        with self.bulk_edit():
+            instructions = {'add': [], 'remove': []}
+            for coords in removed:
+                change = self.remove_man(coords)
+                if change is not None:
+                    instructions['remove'].extend(change['remove'])
+            for coords in added:
+                change = self.add_man(coords)
+                if change is not None:
+                    instructions['add'].extend(change['add'])
+        return instructions
+
+    @contextlib.contextmanager
+    def bulk_edit(self):
+        '''Context manager for editing the real position in many steps,
+        e.g. with add_man, remove_man or by setting ball_coords. Legal
+        moves are not found during the edit, and the speculation is
+        reset to the new position once, at the end. Legal moves are
+        only found if something reads them during the edit.'''
+        self._bulk_edits += 1
+        try:
+            yield self
+        finally:
+            self._bulk_edits -= 1
+            if not self._bulk_edits:
+                self._legal_moves = None
+                self.reset_speculation()
+
+    def play_man_at(self, coords):
+        '''Method for attempting to play a man piece. Adds the man, and
+        updates internal move state if necessary.
+        '''
+        coords = tuple(coords)
+        if (coords in self.man_coords or coords == tuple(self.ball_coords) or
+                not coords_on_board(coords, self.shape)):
+            return None
+        self.make_move('play', coords)
+        self.reset_speculation()
+        return {'add': [coords]}
+
+    def _apply_record(self, record):
+        '''Applies a move record to the real position and pushes it on
+        the move stack. Does not update legal moves.'''
+        man_key = self.zobrist.man_key
+        for change, coords in record.ordered_changes():
+            if change == 'add':
+                self.man_coords.add(coords)
+            else:
+                self.man_coords.remove(coords)
+            self._men_hash ^= man_key(coords)
+        if record.move_type == 'move':
+            self._ball_coords = record.coords
+        self.current_player = other_player(record.current_player)
+        self.move_stack.append(record)
+        self._speculation_in_sync = False
+
+    def make_move(self, move_type, coords, steps=None):
+        '''Plays a move on the real board, in place, and records how to
+        undo it on the move stack. move_type is 'play' (place a man at
+        coords) or 'move' (jump the ball to coords along steps, or along
+        the unique or direct path if steps is not given). The turn
+        passes to the other player. Returns the MoveRecord.
+        '''
+        coords = tuple(coords)
+        record = MoveRecord(move_type, coords, self.ball_coords,
+                            self.current_player, self._legal_moves,
+                            self.legal_move_tracker)
+        record.edits = self._edits
+        if move_type == 'play':
+            if (coords in self.man_coords or
+                    coords == tuple(self.ball_coords) or
+                    not coords_on_board(coords, self.shape)):
+                raise ValueError('Cannot play a man at {}'.format(coords))
+            record.added = [coords]
+        elif move_type == 'move':
+            if steps is None:
+                if coords not in self.legal_moves:
+                    raise ValueError(
+                        'Cannot move the ball to {}'.format(coords))
+                steps, conflicts = self._choose_path(self.legal_moves,
+                                                     coords)
+                if conflicts is not None:
+                    raise ValueError(
+                        'More than one path to {}'.format(coords))
+            record.steps = list(map(tuple, steps))
+            record.removed = removed_coords_from_steps(coords, record.steps)
+        else:
+            raise ValueError('Unknown move type {!r}'.format(move_type))
+        self._apply_record(record)
+        self._legal_moves = None
+        return record
+
+    def unmake_move(self):
+        '''Undoes the last move on the move stack, restoring the
+        position, player to move and legal moves. Returns the
+        MoveRecord.'''
+        record = self.move_stack.pop()
+        man_key = self.zobrist.man_key
+        # Changes are undone in reverse order. The men may have been
+        # edited since the move, so only undo what is still there to
+        # undo.
+        for change, coords in reversed(record.ordered_changes()):
+            if change == 'add':
+                if coords in self.man_coords:
+                    self.man_coords.remove(coords)
+                    self._men_hash ^= man_key(coords)
+            elif coords not in self.man_coords:
+                self.man_coords.add(coords)
+                self._men_hash ^= man_key(coords)
+        self._ball_coords = record.ball_coords
+        self.current_player = record.current_player
+        if record.edits == self._edits:
+            self._legal_moves = record.legal_moves
+            if record.legal_moves is not None:
+                self.legal_move_tracker = record.legal_move_tracker
+        else:
+            self._legal_moves = None
+        self._speculation_in_sync = False
+        return record
+
+    @property
+    def history(self):
+        '''The moves played on this board since it was reset or loaded,
+        as (move_type, coords, steps) tuples.'''
+        return [(record.move_type, record.coords, record.steps)
+                for record in self.move_stack]
+
+    def do_ai_move(self):
+        if not self.ai:
+            self.initialise_ai()
+
+        self.reset_speculation()
+
+        move_type, coords = self.ai.get_move()
+        self.speculate_ai_move(move_type, coords, self.ai.path)
+
+    def speculate_ai_move(self, move_type, coords, path=None):
+        '''Makes the given ai move as the speculation, ready to be
+        confirmed. Returns the instructions of the last step.'''
+        logger.debug('AI move: %s at %s', move_type, coords)
+        self.reset_speculation()
+        if move_type == 'move':
+            # Follow the ai's exact path one jump at a time, if it gave
+            # one, so there can be no conflicting paths.
+            for step in (path or [])[1:]:
+                self.speculative_move_ball_to(step)
+            return self.speculative_move_ball_to(coords)
+        elif move_type == 'play':
+            return self.speculative_play_man_at(coords)
+
+    def copy_position(self):
+        '''Returns a new AbstractBoard with the position (but not the
+        speculation, history or ai) of self, and the same settings.'''
+        board = AbstractBoard(shape=self.shape, bitboard=self.bitboard,
+                              move_generator=self.move_generator,
+                              maxdepth=self.maxdepth)
+        board.load_dict({'shape': self.shape,
+                         'ball_coords': self.ball_coords,
+                         'man_coords': list(self.man_coords),
+                         'current_player': self.current_player})
+        return board
+
+    def _cached_legal_moves(self, key, ball_coords, man_coords):
+        table = self.transposition_table
+        if table is None:
+            return self.generate_legal_moves(ball_coords, man_coords)
+        moves = table.get_legal_moves(key)
+        if moves is None:
+            moves = self.generate_legal_moves(ball_coords, man_coords)
+            table.store_legal_moves(key, moves)
+        return moves
+
+    def update_legal_moves(self):
+        if self.incremental:
+            self.legal_move_tracker = self._updated_tracker(
+                self.legal_move_tracker, self.ball_coords, self.man_coords)
+            moves = self.legal_move_tracker.legal_moves
+        else:
+            moves = self._cached_legal_moves(
+                self.position_hash, self.ball_coords, self.man_coords)
+        self.legal_moves = moves
+        return self.legal_moves
+
+    def update_speculative_legal_moves(self):
+        if self.incremental:
+            self.speculative_legal_move_tracker = self._updated_tracker(
+                self.speculative_legal_move_tracker,
+                self.speculative_ball_coords, self.speculative_man_coords)
+            moves = self.speculative_legal_move_tracker.legal_moves
+        else:
+            moves = self._cached_legal_moves(
+                self.speculative_position_hash,
+                self.speculative_ball_coords, self.speculative_man_coords)
+        self.speculative_legal_moves = moves
+        if self.speculative_stack:
+            record = self.speculative_stack[-1]
+            record.next_legal_moves = moves
+            record.next_legal_move_tracker = (
+                self.speculative_legal_move_tracker)
+        return self.speculative_legal_moves
+
+    def as_ascii(self, speculative=False, *args, margin=None):
+        '''Returns an ascii representation of the board.
+
+        On a big board, a margin can be given to draw only the part of
+        the board within margin squares of the ball, men and legal
+        moves. The first line then gives the columns and rows shown.
+        '''
+        string_elements = []
+        if not speculative:
+            ball_coords = self.ball_coords
+            man_coords = self.man_coords
+            legal_moves = self.legal_moves
+        else:
+            ball_coords = self.speculative_ball_coords
+            man_coords = self.speculative_man_coords
+            legal_moves = self.speculative_legal_moves
+        x_range = range(self.shape[0])
+        y_range = range(self.shape[1])
+        if margin is not None:
+            occupied = [tuple(ball_coords)]
+            occupied.extend(man_coords)
+            occupied.extend(legal_moves)
+            xs = [coords[0] for coords in occupied]
+            ys = [coords[1] for coords in occupied]
+            x_range = range(max(0, min(xs) - margin),
+                            min(self.shape[0], max(xs) + margin + 1))
+            y_range = range(max(0, min(ys) - margin),
+                            min(self.shape[1], max(ys) + margin + 1))
+            string_elements.append('x {}-{}, y {}-{}\n'.format(
+                x_range[0], x_range[-1], y_range[0], y_range[-1]))
+        for y in y_range[::-1]:
+            for x in x_range:
+                coords = (x, y)
+                if (coords[0] == ball_coords[0] and
+                        coords[1] == ball_coords[1]):
+                    string_elements.append('O')
+                elif coords in man_coords:
+                    string_elements.append('X')
+                elif coords in legal_moves:
+                    string_elements.append('@')
+                elif coords[1] <= 1 or coords[1] >= self.shape[1]-2:
+                    string_elements.append(',')
+                else:
+                    string_elements.append(',')
+            string_elements.append('\n')
+        return ''.join(string_elements)
+
+    def serialise(self, legal_moves=False):
+        '''Serialises the board position (all stones, including speculative
+        moves) as json.
+
+        Legal moves are only included if legal_moves is True; they are
+        not needed to load the position, which finds them again when
+        they are first used.
+        '''
+        d = {'shape': self.shape,
+             'ball_coords': self.ball_coords,
+             'man_coords': list(self.man_coords),
+             'current_player': self.current_player,
+             'speculative_ball_coords': self.speculative_ball_coords,
+             'speculative_man_coords': list(self.speculative_man_coords),
+             'speculative_step_removals': self.speculative_step_removals,
+             'speculative_steps': self.speculative_steps,
+             'message': '',
+             'other': '',
+             }
+        if legal_moves:
+            d['legal_moves'] = list(self.legal_moves.items())
+            d['speculative_legal_moves'] = list(
+                self.speculative_legal_moves.items())
+        return json.dumps(d)
+
+    def save_state(self, filen, legal_moves=False):
+        '''Saves the state of self in the given file.'''
+        with open(filen, 'w') as fileh:
+            fileh.write(self.serialise(legal_moves))
+
+    def load_dict(self, d):
+        '''Sets the properties of self according to the dictionary.
+
+        Only the position (shape, ball, men and player to move) and the
+        message are read. Legal moves are not found until they are
+        first used.
+        '''
+        if ('shape' not in d or
+            'ball_coords' not in d or
+            'man_coords' not in d or
+            'current_player' not in d):
+            raise Exception('Not enough information to load.')
+
+        self.shape = d['shape']
+        self.ball_coords = (d['ball_coords'][0], d['ball_coords'][1])
+        self.man_coords = self.new_man_set(d['man_coords'])
+        self._men_hash = self.zobrist.hash_men(self.man_coords)
+        self.current_player = d['current_player']
+        self.move_stack = []
+        self._legal_moves = None
+
+        # Speculative saving not implemented yet. 
+        self._speculation_in_sync = False
+        self.reset_speculation()
+
+        if 'message' in d:
+            self.message = d['message']
+
+    def load_file(self, filen):
+        '''Loads json data from filen and sets the properties of self
+        appropriately.'''
+        with open(filen, 'r') as fileh:
+            data = json.load(fileh)
+        self.load_dict(data)
+
+
+def iter_boards(paths, pattern='*.phut', **options):
+    '''Yields (filen, AbstractBoard) for every .phut file in paths, which
+    may be files or directories, loading each file only when it is
+    reached. options are passed to AbstractBoard.'''
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        if os.path.isdir(path):
+            filens = sorted(glob.glob(os.path.join(path, pattern)))
+        else:
+            filens = [path]
+        for filen in filens:
+            board = AbstractBoard(**options)
+            board.load_file(filen)
+            yield filen, board
@@ -0,0 +1,204 @@
+'''Incremental maintenance of legal moves under man placements and
+removals.
+
+The legal moves from a position are split into eight branches, one for
+each direction of the first jump. While searching a branch we record
+every square whose occupancy was read (its probe mask). Adding or
+removing a man on a square outside a branch's probe mask cannot change
+anything that branch found, so after an edit only the branches whose
+probe masks contain the edited square are searched again.
+'''
+
+from .bitboard import BitBoard, LegalMoves, find_jumps
+from .moves import get_legal_moves, get_reachable_moves
+
+
+def _probe_reachable(geometry, ball, men, maxdepth, first_delta):
+    '''As moves.get_reachable_moves, but only following first_delta for
+    the first jump. Returns the moves, as a LegalMoves with eagerly
+    built paths (but no remaining men), and the probe mask of the
+    search.'''
+    coords = geometry.coords
+    past_goals = geometry.past_goals
+
+    start = (ball, men)
+    parents = {start: None}
+    landings = {}
+    probe = 0
+    frontier = [start]
+    deltas = [first_delta]
+    depth = 1
+    while frontier and (maxdepth is None or depth <= maxdepth):
+        next_frontier = []
+        for state in frontier:
+            ball, men = state
+            for delta in deltas:
+                square = ball + delta
+                probe |= 1 << square
+                if not men >> square & 1:
+                    continue
+                jumped = 0
+                while men >> square & 1:
+                    jumped |= 1 << square
+                    square += delta
+                probe |= jumped | 1 << square
+                landing = coords[square]
+                if landing is None:
+                    continue
+                new_state = (square, men ^ jumped)
+                if new_state in parents:
+                    continue
+                parents[new_state] = state
+                if landing not in landings:
+                    landings[landing] = new_state
+                if not past_goals >> square & 1:
+                    next_frontier.append(new_state)
+        frontier = next_frontier
+        deltas = geometry.deltas
+        depth += 1
+
+    legal_moves = LegalMoves(geometry, start[1])
+    legal_moves.number_of_states = len(parents)
+    legal_moves.number_of_paths = len(landings)
+    for landing, state in landings.items():
+        path = []
+        state = parents[state]
+        while state is not None:
+            path.append(coords[state[0]])
+            state = parents[state]
+        path.reverse()
+        legal_moves[landing] = [path]
+    return legal_moves, probe
+
+
+class LegalMoveTracker(object):
+    '''Legal moves for one position, split into per-direction branches
+    that can be updated individually.
+
+    Trackers are never modified in place; updated() returns a new
+    tracker sharing every branch that did not need to be searched
+    again, so a tracker can be cheaply kept for the real position while
+    a copy is edited speculatively.
+    '''
+
+    def __init__(self, shape, ball_coords, man_coords,
+                 move_generator='paths', maxdepth=None):
+        self.shape = tuple(shape)
+        self.move_generator = move_generator
+        self.maxdepth = maxdepth
+        self.ball_coords = tuple(ball_coords)
+        self.men = _men_bits(self.shape, man_coords)
+
+        self.geometry = BitBoard(self.shape).geometry
+        self.ball = self.geometry.index(self.ball_coords)
+        self.branches = [self._search_branch(delta)
+                         for delta in self.geometry.deltas]
+        self._legal_moves = None
+
+    def _search_branch(self, delta):
+        if self.ball is None:
+            return LegalMoves(self.geometry, self.men), 0
+        if self.move_generator == 'reachable':
+            return _probe_reachable(self.geometry, self.ball, self.men,
+                                    self.maxdepth, delta)
+        return find_jumps(self.geometry, self.ball, self.men, self.maxdepth,
+                          first_deltas=[delta], probe=True)
+
+    def updated(self, ball_coords, man_coords):
+        '''Returns a tracker for the given position. If only men have
+        changed, only the branches that could be affected are searched
+        again; if the ball has moved, everything is.'''
+        ball_coords = tuple(ball_coords)
+        men = _men_bits(self.shape, man_coords)
+        if ball_coords != self.ball_coords:
+            return LegalMoveTracker(self.shape, ball_coords, man_coords,
+                                    self.move_generator, self.maxdepth)
+        changed = men ^ self.men
+        if not changed:
+            return self
+
+        new = LegalMoveTracker.__new__(LegalMoveTracker)
+        new.__dict__.update(self.__dict__)
+        new.men = men
+        new._legal_moves = None
+        new.branches = list(self.branches)
+        for i, (legal_moves, probe) in enumerate(self.branches):
+            if probe & changed:
+                new.branches[i] = new._search_branch(
+                    self.geometry.deltas[i])
+        return new
+
+    @property
+    def legal_moves(self):
+        '''The legal moves of the position, in the same format (and
+        order) as get_legal_moves or get_reachable_moves would return
+        them.'''
+        if self._legal_moves is not None:
+            return self._legal_moves
+        if self.move_generator == 'reachable':
+            merged = {}
+            for legal_moves, probe in self.branches:
+                for coords, paths in legal_moves.items():
+                    if (coords not in merged or
+                            len(paths[0]) < len(merged[coords][0])):
+                        merged[coords] = list(paths)
+            self._legal_moves = merged
+            return merged
+
+        # Different first jumps can reach the same position, so keep
+        # only the shortest path to each, as get_legal_moves does.
+        # Branches that were not searched again saw other men outside
+        # their probe masks, so positions are compared by the men
+        # jumped rather than the men left.
+        merged = LegalMoves(self.geometry, self.men)
+        for legal_moves, probe in self.branches:
+            for coords, paths in legal_moves.items():
+                if coords not in merged:
+                    merged[coords] = []
+                    merged.remaining[coords] = []
+                known = merged.remaining[coords]
+                for path, men in zip(paths, legal_moves.remaining[coords]):
+                    men = self.men ^ (legal_moves.men ^ men)
+                    if men not in known:
+                        merged[coords].append(path)
+                        known.append(men)
+                    else:
+                        i = known.index(men)
+                        if len(path) < len(merged[coords][i]):
+                            merged[coords][i] = path
+        for coords, paths in merged.items():
+            order = sorted(range(len(paths)), key=lambda i: len(paths[i]))
+            merged[coords] = [paths[i] for i in order]
+            remaining = merged.remaining[coords]
+            merged.remaining[coords] = [remaining[i] for i in order]
+        self._legal_moves = merged
+        return merged
+
+    def verify(self):
+        '''Checks the tracked legal moves against a full recompute.
+        Returns True if they agree.'''
+        men = BitBoard(self.shape, bits=self.men)
+        if self.move_generator == 'reachable':
+            fresh = get_reachable_moves(self.ball_coords, men,
+                                        maxdepth=self.maxdepth)
+            return ({coords: len(paths[0]) for coords, paths in
+                     self.legal_moves.items()} ==
+                    {coords: len(fresh.path(coords)) for coords in fresh})
+        fresh = get_legal_moves(self.ball_coords, men,
+                                maxdepth=self.maxdepth)
+
+        # Equally short paths to a position may differ, depending on
+        # which branch found them.
+        def positions(legal_moves):
+            return {coords: sorted((len(path), men) for path, men in
+                                   zip(paths, legal_moves.remaining[coords]))
+                    for coords, paths in legal_moves.items()}
+        return positions(self.legal_moves) == positions(fresh)
+
+
+def _men_bits(shape, man_coords):
+    if isinstance(man_coords, BitBoard) and man_coords.shape == shape:
+        return man_coords.bits
+    return BitBoard(shape, [coords for coords in man_coords
+                            if 0 <= coords[0] < shape[0] and
+                            0 <= coords[1] < shape[1]]).bits
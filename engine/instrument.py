@@ -0,0 +1,237 @@
+'''Opt-in counters and timers for AbstractBoard and AI.
+
+Nothing is measured until enable() is called, which wraps the public
+methods of AbstractBoard and AI (and BitBoard.copy) in counting
+versions; disable() puts the originals back, so there is no cost at
+all while instrumentation is off.
+
+While enabled, the following are recorded:
+
+- calls: for every public method, the number of calls and the total
+  and longest time spent in it (including time in nested calls);
+- searches, nodes and paths: the number of legal move searches made
+  by boards (each branch a LegalMoveTracker searches counting as one),
+  the search states they visited and the jump paths they found, as
+  reported by the searches themselves;
+- table_hits: legal moves found in a transposition table rather than
+  searched for;
+- set_copies: copies of man sets (and BitBoards) made by boards
+  created while enabled, including those made by move generation;
+- recomputations: legal move recomputations, keyed by the outermost
+  public method (the user action) that caused them; those caused by
+  reading legal_moves or speculative_legal_moves directly are keyed by
+  update_legal_moves or update_speculative_legal_moves.
+
+Example:
+
+    from engine import instrument
+    with instrument.enabled():
+        board.speculative_play_man_at((7, 10))
+        board.speculative_legal_moves
+    print(instrument.snapshot())
+'''
+
+import contextlib
+import functools
+import threading
+import time
+
+from .ai import AI
+from .bitboard import BitBoard
+from .board import AbstractBoard
+from .incremental import LegalMoveTracker
+from .transposition import TranspositionTable
+
+
+class Counters(object):
+    '''Everything recorded while instrumentation is enabled.'''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = {}
+        self.searches = 0
+        self.nodes = 0
+        self.paths = 0
+        self.table_hits = 0
+        self.set_copies = 0
+        self.recomputations = {}
+
+    def as_dict(self):
+        return {'calls': {name: {'count': count, 'total': total,
+                                 'max': longest}
+                          for name, (count, total, longest)
+                          in self.calls.items()},
+                'searches': self.searches,
+                'nodes': self.nodes,
+                'paths': self.paths,
+                'table_hits': self.table_hits,
+                'set_copies': self.set_copies,
+                'recomputations': dict(self.recomputations)}
+
+
+counters = Counters()
+
+# The names of the public methods currently running on each thread,
+# outermost first, as the list _local.actions.
+_local = threading.local()
+
+# (owner, name, original) of everything patched by enable().
+_patched = []
+
+_RECOMPUTATIONS = ('update_legal_moves', 'update_speculative_legal_moves')
+
+
+class CountingSet(set):
+    '''A set of man coordinates that counts its copies.'''
+
+    def copy(self):
+        counters.set_copies += 1
+        return CountingSet(self)
+
+
+def _actions():
+    actions = getattr(_local, 'actions', None)
+    if actions is None:
+        actions = _local.actions = []
+    return actions
+
+
+def _timed(qualified_name, method):
+    recomputes = method.__name__ in _RECOMPUTATIONS
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        actions = _actions()
+        actions.append(qualified_name)
+        if recomputes:
+            action = actions[0]
+            counters.recomputations[action] = (
+                counters.recomputations.get(action, 0) + 1)
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            actions.pop()
+            count, total, longest = counters.calls.get(qualified_name,
+                                                       (0, 0., 0.))
+            counters.calls[qualified_name] = (count + 1, total + elapsed,
+                                              max(longest, elapsed))
+    return wrapper
+
+
+def _count_search(moves):
+    counters.searches += 1
+    counters.nodes += moves.number_of_states
+    counters.paths += moves.number_of_paths
+
+
+def _counting_search(method):
+    @functools.wraps(method)
+    def generate_legal_moves(self, ball_coords, man_coords):
+        moves = method(self, ball_coords, man_coords)
+        _count_search(moves)
+        return moves
+    return generate_legal_moves
+
+
+def _counting_branch_search(method):
+    @functools.wraps(method)
+    def _search_branch(self, delta):
+        legal_moves, probe = method(self, delta)
+        _count_search(legal_moves)
+        return legal_moves, probe
+    return _search_branch
+
+
+def _counting_table_lookup(method):
+    @functools.wraps(method)
+    def get_legal_moves(self, key):
+        moves = method(self, key)
+        if moves is not None:
+            counters.table_hits += 1
+        return moves
+    return get_legal_moves
+
+
+def _counting_new_man_set(method):
+    @functools.wraps(method)
+    def new_man_set(self, coords=()):
+        men = method(self, coords)
+        if isinstance(men, set):
+            return CountingSet(men)
+        return men
+    return new_man_set
+
+
+def _counting_bitboard_copy(method):
+    @functools.wraps(method)
+    def copy(self):
+        counters.set_copies += 1
+        return method(self)
+    return copy
+
+
+def _patch(owner, name, replacement):
+    _patched.append((owner, name, owner.__dict__[name]))
+    setattr(owner, name, replacement)
+
+
+def is_enabled():
+    return bool(_patched)
+
+
+def enable():
+    '''Starts recording. Counters are not reset.'''
+    if _patched:
+        return
+    _patch(AbstractBoard, 'generate_legal_moves',
+           _counting_search(AbstractBoard.generate_legal_moves))
+    _patch(LegalMoveTracker, '_search_branch',
+           _counting_branch_search(LegalMoveTracker._search_branch))
+    _patch(TranspositionTable, 'get_legal_moves',
+           _counting_table_lookup(TranspositionTable.get_legal_moves))
+    _patch(AbstractBoard, 'new_man_set',
+           _counting_new_man_set(AbstractBoard.new_man_set))
+    _patch(BitBoard, 'copy', _counting_bitboard_copy(BitBoard.copy))
+    for cls in (AbstractBoard, AI):
+        for name, value in list(vars(cls).items()):
+            if name.startswith('_') or not callable(value) or \
+                    isinstance(value, (staticmethod, classmethod)):
+                continue
+            _patch(cls, name, _timed('{}.{}'.format(cls.__name__, name),
+                                     getattr(cls, name)))
+
+
+def disable():
+    '''Stops recording and restores the original methods. The counters
+    keep their values.'''
+    while _patched:
+        owner, name, original = _patched.pop()
+        setattr(owner, name, original)
+
+
+def reset():
+    '''Sets every counter back to zero.'''
+    counters.reset()
+
+
+def snapshot():
+    '''Returns a dict of the current counter values.'''
+    return counters.as_dict()
+
+
+@contextlib.contextmanager
+def enabled(reset_counters=True):
+    '''Records everything within the with block.'''
+    if reset_counters:
+        reset()
+    was_enabled = is_enabled()
+    enable()
+    try:
+        yield counters
+    finally:
+        if not was_enabled:
+            disable()
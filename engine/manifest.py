@@ -0,0 +1,171 @@
+'''An index of the puzzle collection, so that it can be browsed without
+opening every .phut file.
+
+The puzzles directory holds one subdirectory per puzzle set, named
+dirNN_title (e.g. dir01_tutorials), each holding .phut files. The
+manifest, puzzles/manifest.json, lists the sets in order of NN and the
+puzzles of each set in natural order of filename, with for each puzzle
+its title, message, board shape, number of men, player to move and
+difficulty. The difficulty is the length of the shortest forced win,
+in moves of the player to move, as found by engine.solver; it is None
+if the solver found no win.
+
+Each puzzle entry also stores the file's size and sha1 hash, and the
+max_depth and time_limit it was solved with. build_manifest reuses the
+entry of any file whose contents hash the same, if it was solved with
+the same settings and did not run out of time, so only new or edited
+puzzles are solved again. Nothing in the manifest depends on the
+checkout (such as file times), so rebuilding an unchanged collection
+leaves the committed file unchanged.
+'''
+
+import hashlib
+import json
+import os
+import re
+
+from .solver import Solver
+
+MANIFEST_VERSION = 2
+MANIFEST_NAME = 'manifest.json'
+
+_set_pattern = re.compile(r'^dir(\d+)_(.*)$')
+
+
+def natural_key(text):
+    '''Sorts 'puzzle2' before 'puzzle10'.'''
+    return [int(part) if part.isdigit() else part
+            for part in re.split(r'(\d+)', text)]
+
+
+def title_from_name(name):
+    '''Returns a title for a file or set name, e.g. 'Tutorial 2' for
+    'tutorial2'.'''
+    words = re.sub(r'(\D)(\d)', r'\1 \2', name).replace('_', ' ').split()
+    return ' '.join(word[0].upper() + word[1:] for word in words)
+
+
+def file_hash(filen):
+    with open(filen, 'rb') as fileh:
+        return hashlib.sha1(fileh.read()).hexdigest()
+
+
+def puzzle_entry(root, relative, max_depth=3, time_limit=5.):
+    '''Reads and solves the puzzle at root/relative and returns its
+    manifest entry.'''
+    filen = os.path.join(root, relative)
+    with open(filen, 'rb') as fileh:
+        data = fileh.read()
+    d = json.loads(data.decode('utf-8'))
+    other = d.get('other')
+    name = os.path.splitext(os.path.basename(relative))[0]
+    if isinstance(other, dict) and other.get('title'):
+        title = other['title']
+    else:
+        title = title_from_name(name)
+
+    result = Solver(d['shape']).solve(d['ball_coords'], d['man_coords'],
+                                      d['current_player'], max_depth,
+                                      time_limit)
+    return {'file': relative.replace(os.sep, '/'),
+            'name': name,
+            'title': title,
+            'message': d.get('message', ''),
+            'shape': list(d['shape']),
+            'men': len(d['man_coords']),
+            'current_player': d['current_player'],
+            'difficulty': result.depth if result.status == 'win' else None,
+            'solution': result.status,
+            'max_depth': max_depth,
+            'time_limit': time_limit,
+            'size': len(data),
+            'sha1': hashlib.sha1(data).hexdigest()}
+
+
+def find_sets(root):
+    '''Returns a list of (number, directory name) of the puzzle sets in
+    root, in order.'''
+    sets = []
+    for name in os.listdir(root):
+        match = _set_pattern.match(name)
+        if match and os.path.isdir(os.path.join(root, name)):
+            sets.append((int(match.group(1)), name))
+    sets.sort()
+    return sets
+
+
+def build_manifest(root='puzzles', previous=None, max_depth=3,
+                   time_limit=5.):
+    '''Returns the manifest of the puzzles in root, reusing the entries
+    of unchanged files from the previous manifest, and the number of
+    puzzles that had to be solved.
+
+    An entry is only reused if it was solved with the same max_depth
+    and time_limit, and not if the solver ran out of time, as a
+    timeout depends on the speed of the machine.'''
+    old_hashes = {}
+    if previous is not None and previous.get('version') == MANIFEST_VERSION:
+        for puzzle_set in previous['sets']:
+            for entry in puzzle_set['puzzles']:
+                if (entry.get('max_depth') == max_depth and
+                        entry.get('time_limit') == time_limit and
+                        entry['solution'] != 'timeout'):
+                    old_hashes[entry['sha1']] = entry
+
+    sets = []
+    read = 0
+    for number, directory in find_sets(root):
+        names = [name for name in os.listdir(os.path.join(root, directory))
+                 if name.endswith('.phut')]
+        names.sort(key=natural_key)
+        puzzles = []
+        for name in names:
+            relative = directory + '/' + name
+            filen = os.path.join(root, directory, name)
+            entry = old_hashes.get(file_hash(filen))
+            if entry is not None:
+                # Possibly copied or renamed, but not changed.
+                entry = dict(entry, file=relative,
+                             name=os.path.splitext(name)[0])
+            else:
+                entry = puzzle_entry(root, relative, max_depth, time_limit)
+                read += 1
+            puzzles.append(entry)
+        title = _set_pattern.match(directory).group(2)
+        sets.append({'identifier': directory,
+                     'number': number,
+                     'title': title_from_name(title),
+                     'puzzles': puzzles})
+    return {'version': MANIFEST_VERSION, 'sets': sets}, read
+
+
+def load_manifest(filen=os.path.join('puzzles', MANIFEST_NAME)):
+    '''Returns the manifest in filen, or None if there is none or it is
+    of another version.'''
+    try:
+        with open(filen, 'r') as fileh:
+            manifest = json.load(fileh)
+    except (IOError, OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(manifest, filen=os.path.join('puzzles', MANIFEST_NAME)):
+    temporary = filen + '.tmp'
+    with open(temporary, 'w') as fileh:
+        json.dump(manifest, fileh, indent=1, sort_keys=True)
+        fileh.write('\n')
+    os.replace(temporary, filen)
+
+
+def update_manifest(root='puzzles', max_depth=3, time_limit=5.):
+    '''Rebuilds root/manifest.json from the puzzles in root, reading only
+    new or changed files. Returns the manifest and the number of
+    puzzles read.'''
+    filen = os.path.join(root, MANIFEST_NAME)
+    manifest, read = build_manifest(root, load_manifest(filen), max_depth,
+                                    time_limit)
+    save_manifest(manifest, filen)
+    return manifest, read
@@ -0,0 +1,356 @@
+'''Monte Carlo tree search player, with root parallelism.
+
+Each worker process grows its own UCT tree from the same root position
+with a different random seed; the visit and win counts of the root's
+children are then summed over all workers and the most visited move is
+played. Candidate moves are the same as for the alpha-beta search (see
+engine.search).
+'''
+
+import logging
+import math
+import multiprocessing
+import os
+import random
+import threading
+import time
+
+from .bitboard import geometry_for
+from .search import (SearchEngine, PLAY, MOVE, winner_at, distance_to_goal,
+                     other_player)
+from .tablebase import open_tablebase
+
+logger = logging.getLogger(__name__)
+
+
+class Node(object):
+    __slots__ = ('move', 'parent', 'children', 'untried', 'visits', 'wins',
+                 'player')
+
+    def __init__(self, move, parent, player, untried):
+        self.move = move
+        self.parent = parent
+        self.player = player
+        self.untried = untried
+        self.children = []
+        self.visits = 0
+        self.wins = 0.
+
+    def select_child(self, exploration):
+        log_visits = math.log(self.visits)
+        best, best_score = None, None
+        for child in self.children:
+            score = (child.wins / child.visits +
+                     exploration * math.sqrt(log_visits / child.visits))
+            if best is None or score > best_score:
+                best, best_score = child, score
+        return best
+
+
+def apply_move(ball, men, move):
+    kind, square, new_men, path = move
+    if kind == PLAY:
+        return ball, new_men
+    return square, new_men
+
+
+class TreeSearch(object):
+    '''A single-process UCT search.'''
+
+    def __init__(self, shape, seed=None, exploration=1.4,
+                 placement_radius=2, playout_length=30,
+                 heuristic_playouts=True, tablebase=None, stop_event=None):
+        self.geometry = geometry_for(shape)
+        self.move_generator = SearchEngine(
+            shape, placement_radius=placement_radius)
+        self.random = random.Random(seed)
+        self.exploration = exploration
+        self.playout_length = playout_length
+        self.heuristic_playouts = heuristic_playouts
+        # Opened by name, so that every worker process maps the same
+        # file rather than being sent a copy.
+        self.tablebase = None
+        if tablebase is not None:
+            self.tablebase = open_tablebase(tablebase)
+        # Set (by this process or another) to make run() return early.
+        if stop_event is None:
+            stop_event = threading.Event()
+        self.stop_event = stop_event
+        self.nodes = 0
+        self.playouts = 0
+
+    def stop(self):
+        '''Makes run() return at its next iteration.'''
+        self.stop_event.set()
+
+    def new_node(self, move, parent, ball, men, player):
+        self.nodes += 1
+        untried = []
+        if winner_at(self.geometry, ball) is None:
+            untried = self.move_generator.generate_moves(ball, men, player)
+            self.random.shuffle(untried)
+        return Node(move, parent, player, untried)
+
+    def playout_move(self, ball, men, player):
+        '''Chooses a move for a playout: a winning jump if there is one,
+        otherwise (usually) the jump that gets closest to the goal, or
+        a random nearby placement.'''
+        moves = self.move_generator.generate_moves(ball, men, player)
+        if not self.heuristic_playouts:
+            return self.random.choice(moves)
+        geometry = self.geometry
+        jumps = [move for move in moves if move[0] == MOVE]
+        if jumps:
+            best = jumps[0]
+            if winner_at(geometry, best[1]) == player:
+                return best
+            if (distance_to_goal(geometry, best[1], player) <
+                    distance_to_goal(geometry, ball, player) and
+                    self.random.random() < 0.7):
+                return best
+        return self.random.choice(moves)
+
+    def playout(self, ball, men, player):
+        '''Plays random moves from the position. Returns the winner,
+        or the player with the ball nearer their goal if the playout
+        reaches its length limit.'''
+        self.playouts += 1
+        for i in range(self.playout_length):
+            winner = winner_at(self.geometry, ball)
+            if winner is not None:
+                return winner
+            if self.tablebase is not None and \
+                    self.tablebase.probe_bits(self.geometry, ball, men, player):
+                return player
+            ball, men = apply_move(ball, men,
+                                   self.playout_move(ball, men, player))
+            player = other_player(player)
+        winner = winner_at(self.geometry, ball)
+        if winner is not None:
+            return winner
+        top = distance_to_goal(self.geometry, ball, 'top')
+        bottom = distance_to_goal(self.geometry, ball, 'bottom')
+        if top == bottom:
+            return None
+        return 'top' if top < bottom else 'bottom'
+
+    def run(self, ball, men, player, time_limit=1.0, iterations=None):
+        '''Grows the tree from the given position. Returns the root, as
+        grown so far if the search was stopped.'''
+        root = self.new_node(None, None, ball, men, player)
+        deadline = time.time() + time_limit
+        iteration = 0
+        while True:
+            if iterations is not None and iteration >= iterations:
+                break
+            if iterations is None and time.time() > deadline:
+                break
+            if self.stop_event.is_set():
+                break
+            iteration += 1
+
+            node, node_ball, node_men = root, ball, men
+            while not node.untried and node.children:
+                node = node.select_child(self.exploration)
+                node_ball, node_men = apply_move(node_ball, node_men,
+                                                 node.move)
+            if node.untried:
+                move = node.untried.pop()
+                node_ball, node_men = apply_move(node_ball, node_men, move)
+                child = self.new_node(move, node, node_ball, node_men,
+                                      other_player(node.player))
+                node.children.append(child)
+                node = child
+
+            winner = self.playout(node_ball, node_men, node.player)
+            while node is not None:
+                node.visits += 1
+                # A node's wins are counted for the player who made the
+                # move into it, i.e. the player not to move there.
+                if winner is None:
+                    node.wins += 0.5
+                elif winner != node.player:
+                    node.wins += 1
+                node = node.parent
+        return root
+
+
+# The MCTSPlayer's stop event, in each pool worker process.
+_stop_event = None
+
+
+def _init_worker(stop_event):
+    global _stop_event
+    _stop_event = stop_event
+
+
+def _run_worker(args, stop_event=None):
+    '''Runs one TreeSearch in a worker process and returns the root
+    statistics as plain, picklable data.'''
+    (shape, ball, men, player, time_limit, iterations, seed,
+     options) = args
+    if stop_event is None:
+        stop_event = _stop_event
+    start = time.time()
+    search = TreeSearch(shape, seed=seed, stop_event=stop_event, **options)
+    root = search.run(ball, men, player, time_limit, iterations)
+    busy = time.time() - start
+    children = {}
+    for child in root.children:
+        kind, square, new_men, path = child.move
+        children[(kind, square, new_men)] = (child.visits, child.wins, path)
+    return {'children': children,
+            'playouts': search.playouts,
+            'nodes': search.nodes,
+            'busy': busy,
+            'pid': os.getpid()}
+
+
+class MCTSResult(object):
+    '''The outcome of an MCTS search: the chosen move plus statistics.'''
+
+    def __init__(self, move_type, coords, path, visits, wins, playouts,
+                 nodes, elapsed, worker_busy):
+        self.move_type = move_type
+        self.coords = coords
+        self.path = path
+        self.visits = visits
+        self.wins = wins
+        self.playouts = playouts
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.worker_busy = worker_busy
+
+    @property
+    def playouts_per_second(self):
+        return self.playouts / self.elapsed if self.elapsed > 0 else 0.
+
+    @property
+    def worker_utilisation(self):
+        '''Fraction of the wall-clock search time each worker spent
+        searching.'''
+        if self.elapsed <= 0:
+            return [0. for busy in self.worker_busy]
+        return [min(1., busy / self.elapsed) for busy in self.worker_busy]
+
+    def __repr__(self):
+        return ('MCTSResult({}, {}, visits={}, playouts={}, nodes={}, '
+                'playouts/s={:.0f}, utilisation={})'.format(
+                    self.move_type, self.coords, self.visits, self.playouts,
+                    self.nodes, self.playouts_per_second,
+                    ['{:.2f}'.format(u) for u in self.worker_utilisation]))
+
+
+class MCTSPlayer(object):
+    '''Root-parallel MCTS over a pool of worker processes. With
+    workers=1 the search runs in the calling process.
+
+    The pool is created on first use and kept for later searches; call
+    close() when finished with the player.
+
+    stop() makes a search in progress return as soon as possible (and
+    may be called from another thread): the workers return the trees
+    they have grown so far, and if they have not done so within
+    stop_grace seconds the pool is terminated and the search returns
+    None. Searches stay stopped until resume() is called.
+    '''
+
+    def __init__(self, shape=(15, 19), workers=None, time_limit=1.0,
+                 iterations=None, seed=None, stop_grace=0.5, **options):
+        self.geometry = geometry_for(shape)
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+        self.time_limit = time_limit
+        self.iterations = iterations
+        self.random = random.Random(seed)
+        self.options = options
+        self.stop_grace = stop_grace
+        # Shared with the pool's worker processes, which are given it
+        # when they start.
+        self.stop_event = multiprocessing.Event()
+        self.pool = None
+
+    def stop(self):
+        self.stop_event.set()
+
+    def resume(self):
+        self.stop_event.clear()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def terminate(self):
+        '''Kills the worker processes without waiting for their jobs.'''
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def search(self, ball_coords, man_coords, player, time_limit=None):
+        '''Searches the given position for player to move. Returns an
+        MCTSResult, or None if there are no moves (or the search was
+        stopped and its pool had to be terminated).'''
+        if time_limit is None:
+            time_limit = self.time_limit
+        geometry = self.geometry
+        ball = geometry.index(ball_coords)
+        men = 0
+        for coords in man_coords:
+            index = geometry.index(coords)
+            if index is not None:
+                men |= 1 << index
+
+        jobs = [(geometry.shape, ball, men, player, time_limit,
+                 self.iterations, self.random.getrandbits(32), self.options)
+                for i in range(self.workers)]
+        start = time.time()
+        if self.workers == 1:
+            results = [_run_worker(jobs[0], self.stop_event)]
+        else:
+            results = self._run_pool(jobs)
+            if results is None:
+                return None
+        elapsed = time.time() - start
+
+        merged = {}
+        for result in results:
+            for key, (visits, wins, path) in result['children'].items():
+                total = merged.setdefault(key, [0, 0., path])
+                total[0] += visits
+                total[1] += wins
+        if not merged:
+            return None
+
+        key = max(merged, key=lambda k: merged[k][0])
+        visits, wins, path = merged[key]
+        kind, square, new_men = key
+        path_coords = None
+        if path is not None:
+            path_coords = [geometry.coords[index] for index in path]
+        return MCTSResult(kind, geometry.coords[square], path_coords,
+                          visits, wins,
+                          sum(result['playouts'] for result in results),
+                          sum(result['nodes'] for result in results),
+                          elapsed,
+                          [result['busy'] for result in results])
+
+    def _run_pool(self, jobs):
+        '''Runs the jobs over the pool, watching for stop(). Returns
+        their results, or None if the pool had to be terminated.'''
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(
+                self.workers, _init_worker, (self.stop_event,))
+        pending = self.pool.map_async(_run_worker, jobs)
+        while not self.stop_event.wait(0.05):
+            if pending.ready():
+                return pending.get()
+        pending.wait(self.stop_grace)
+        if pending.ready():
+            return pending.get()
+        logger.debug('MCTS workers did not stop, terminating the pool')
+        self.terminate()
+        return None
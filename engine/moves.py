@@ -0,0 +1,222 @@
+'''Move generation and coordinate helpers for phutball positions.'''
+
+from .bitboard import BitBoard, get_legal_moves_bitboard, iter_indices
+
+from collections.abc import Mapping
+
+
+def get_speculative_move_identifiers(coords, steps):
+    '''Returns a list of speculative move identifiers from end coords
+    (coords) and a list of steps. Returns a list of 4-tuples containing
+    the identifiers.
+    '''
+    identifiers = []
+    for i in range(len(steps)-1):
+        cur = steps[i]
+        nex = steps[i+1]
+        identifiers.append((cur[0], cur[1], nex[0], nex[1]))
+    if len(steps) > 0:
+        identifiers.append((steps[-1][0], steps[-1][1], coords[0], coords[1]))
+    return identifiers
+
+
+def coords_removed_on_step(start_coords, end_coords):
+    '''Returns a list of coordinates on the straight line between
+    start_coords and end_coords.'''
+    dx = end_coords[0] - start_coords[0]
+    dy = end_coords[1] - start_coords[1]
+    number_of_steps = int(round(max(abs(dx), abs(dy))))
+    jump_x = int(round(dx / float(number_of_steps)))
+    jump_y = int(round(dy / float(number_of_steps)))
+
+    removed_coords = []
+    x, y = start_coords[0], start_coords[1]
+    for i in range(number_of_steps-1):
+        x += jump_x
+        y += jump_y
+        removed_coords.append((x, y))
+    return removed_coords
+
+
+def removed_coords_from_steps(end_coord, steps):
+    '''For each step, gets a list of removed coordinates. Returns all
+    these lists.
+    '''
+    removed_coords = []
+    for i in range(len(steps)-1):
+        current_coords = steps[i]
+        next_coords = steps[i+1]
+        removed_coords.append(coords_removed_on_step(current_coords,
+                                                     next_coords))
+    removed_coords.append(coords_removed_on_step(steps[-1], end_coord))
+    return removed_coords
+
+
+def remove_coords_lists_from_set(coords_lists, coords_set):
+    for coords_segment in coords_lists:
+        for coords in coords_segment:
+            coords = tuple(coords)
+            if coords in coords_set:
+                coords_set.remove(coords)
+
+
+def add_coords_lists_to_set(coords_lists, coords_set):
+    for coords_segment in coords_lists:
+        for coords in coords_segment:
+            coords = tuple(coords)
+            if coords not in coords_set:
+                coords_set.add(coords)
+
+
+directions = [(1, 0), (1, 1), (0, 1), (-1, 1),
+              (-1, 0), (-1, -1), (0, -1), (1, -1)]
+
+
+def coords_on_board(coords, shape):
+    '''Returns True if coords lie on a board of the given shape.'''
+    return 0 <= coords[0] < shape[0] and 0 <= coords[1] < shape[1]
+
+
+def get_legal_moves(ball_coords, man_coords, shape=(15, 19),
+                    previous_path=None, legal_moves=None,
+                    depth=1, maxdepth=None):
+    '''Returns a LegalMoves dictionary of legal move coordinates, along
+    with the genuinely different paths to reach them: one path, the
+    shortest, for each different set of men that can be jumped on the
+    way (see bitboard.LegalMoves).
+
+    Every jump removes at least one man, so the search always ends;
+    maxdepth optionally limits the number of jumps in a path. The
+    search is breadth first over distinct positions, so its cost grows
+    with the number of different positions the ball can reach rather
+    than the number of orders it can jump the same men in.
+
+    man_coords may be a set of coordinate tuples or a BitBoard; sets
+    are converted, and the search uses bit operations either way.
+    '''
+    if not isinstance(man_coords, BitBoard):
+        man_coords = BitBoard(shape, [coords for coords in man_coords
+                                      if coords_on_board(coords, shape)])
+    return get_legal_moves_bitboard(ball_coords, man_coords,
+                                    previous_path, legal_moves,
+                                    depth, maxdepth)
+
+
+class ReachableMoves(Mapping):
+    '''The result of get_reachable_moves: a mapping from each reachable
+    landing square to a list holding one canonical (shortest) path to
+    it, in the same format as the values of get_legal_moves.
+
+    Paths are stored as parent links between search states, and only
+    turned into lists of coordinates when a square is looked up.
+    '''
+
+    def __init__(self, geometry, parents, landings):
+        self.geometry = geometry
+        self.parents = parents
+        self.landings = landings
+        self._paths = {}
+
+    @property
+    def number_of_states(self):
+        return len(self.parents)
+
+    @property
+    def number_of_paths(self):
+        return len(self.landings)
+
+    def path(self, coords):
+        '''Returns the canonical path (the list of squares the ball
+        leaves from) used to reach coords.'''
+        coords = tuple(coords)
+        if coords in self._paths:
+            return self._paths[coords]
+        state = self.landings[coords]
+        path = []
+        state = self.parents[state]
+        while state is not None:
+            path.append(self.geometry.coords[state[0]])
+            state = self.parents[state]
+        path.reverse()
+        self._paths[coords] = path
+        return path
+
+    shortest_path = path
+
+    def alternatives(self, coords):
+        '''Returns [(path, removed men)] for the one path kept to
+        coords, as LegalMoves.alternatives.'''
+        state = self.landings[tuple(coords)]
+        start = state
+        while self.parents[start] is not None:
+            start = self.parents[start]
+        squares = self.geometry.coords
+        return [(self.path(coords), [squares[index] for index in
+                                     iter_indices(start[1] ^ state[1])])]
+
+    def __getitem__(self, coords):
+        return [self.path(coords)]
+
+    def __contains__(self, coords):
+        return tuple(coords) in self.landings
+
+    def __iter__(self):
+        return iter(self.landings)
+
+    def __len__(self):
+        return len(self.landings)
+
+
+def get_reachable_moves(ball_coords, man_coords, shape=(15, 19),
+                        maxdepth=None):
+    '''Returns a ReachableMoves mapping with the same landing squares as
+    get_legal_moves, but only one (shortest) path to each.
+
+    The search is breadth first over distinct (ball square, remaining
+    men) states, so its cost grows with the number of distinct states
+    rather than the number of jump paths.
+    '''
+    if not isinstance(man_coords, BitBoard):
+        man_coords = BitBoard(shape, [coords for coords in man_coords
+                                      if coords_on_board(coords, shape)])
+    geometry = man_coords.geometry
+    coords = geometry.coords
+    deltas = geometry.deltas
+    past_goals = geometry.past_goals
+
+    parents = {}
+    landings = {}
+    ball = geometry.index(ball_coords)
+    if ball is None:
+        return ReachableMoves(geometry, parents, landings)
+
+    start = (ball, man_coords.bits)
+    parents[start] = None
+    frontier = [start]
+    depth = 1
+    while frontier and (maxdepth is None or depth <= maxdepth):
+        next_frontier = []
+        for state in frontier:
+            ball, men = state
+            for delta in deltas:
+                square = ball + delta
+                if not men >> square & 1:
+                    continue
+                jumped = 0
+                while men >> square & 1:
+                    jumped |= 1 << square
+                    square += delta
+                landing = coords[square]
+                if landing is None:
+                    continue
+                new_state = (square, men ^ jumped)
+                if new_state in parents:
+                    continue
+                parents[new_state] = state
+                if landing not in landings:
+                    landings[landing] = new_state
+                if not past_goals >> square & 1:
+                    next_frontier.append(new_state)
+        frontier = next_frontier
+        depth += 1
+    return ReachableMoves(geometry, parents, landings)
@@ -0,0 +1,356 @@
+'''A compact, streamable format for game records.
+
+A record file starts with the four bytes PHR1 and is followed by any
+number of games, each stored as a varint byte length and then:
+
+- the board width and height, the ball square, and the player to move
+  (0 for top, 1 for bottom);
+- the number of men, then their squares, sorted, as varint gaps;
+- the winner (0 for none, 1 for top, 2 for bottom);
+- a json object of other information about the game (players, seeds
+  etc.), as a varint length and utf-8 text; an empty object takes one
+  byte;
+- the number of moves, then the moves.
+
+Squares are numbered y * width + x. Every number is an unsigned
+LEB128 varint, so small numbers take one byte. A man placement is the
+varint 2 * square. A jump is the varint 2 * number of steps + 1,
+followed by the direction of each step as a 3 bit index into
+moves.directions, packed into bytes low bits first. The length of each
+step is not stored, as it is fixed by the men on the board, so jumps
+are decoded by replaying the game from the start.
+
+A placement on a 15x19 board takes two bytes and a jump takes one byte
+plus three bits per step. Writers only append to a file, and
+read_records yields one game at a time, so files of any size can be
+read with constant memory.
+'''
+
+import json
+
+from .moves import directions, removed_coords_from_steps
+
+MAGIC = b'PHR1'
+
+PLAYER_CODES = {'top': 0, 'bottom': 1}
+PLAYERS = ('top', 'bottom')
+WINNER_CODES = {None: 0, 'top': 1, 'bottom': 2}
+WINNERS = (None, 'top', 'bottom')
+
+
+class RecordFormatError(Exception):
+    '''Raised when data is not a valid game record.'''
+
+
+class GameRecord(object):
+    '''A starting position and the moves played from it.
+
+    moves is a list of (move_type, coords, steps) tuples, in the form
+    of AbstractBoard.history: steps is None for a placement, and the
+    list of squares the ball jumps from for a jump. info is a dict of
+    anything else to be stored with the game; it must be json
+    serialisable.
+    '''
+
+    def __init__(self, shape, ball_coords, man_coords, current_player='top',
+                 moves=None, winner=None, info=None):
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.ball_coords = tuple(ball_coords)
+        self.man_coords = set(map(tuple, man_coords))
+        self.current_player = current_player
+        self.moves = []
+        for move_type, coords, steps in moves or ():
+            if steps is not None:
+                steps = [tuple(step) for step in steps]
+            self.moves.append((move_type, tuple(coords), steps))
+        self.winner = winner
+        self.info = {} if info is None else info
+
+    def __repr__(self):
+        return 'GameRecord({}x{}, {} moves, winner={})'.format(
+            self.shape[0], self.shape[1], len(self.moves), self.winner)
+
+    def __eq__(self, other):
+        if not isinstance(other, GameRecord):
+            return NotImplemented
+        return (self.shape == other.shape and
+                self.ball_coords == other.ball_coords and
+                self.man_coords == other.man_coords and
+                self.current_player == other.current_player and
+                self.moves == other.moves and
+                self.winner == other.winner and
+                self.info == other.info)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def positions(self):
+        '''Yields (ball_coords, man_coords, current_player) for the
+        starting position and after every move. man_coords is the same
+        set each time, updated in place.'''
+        ball = self.ball_coords
+        men = set(self.man_coords)
+        player = self.current_player
+        yield ball, men, player
+        for move_type, coords, steps in self.moves:
+            if move_type == 'play':
+                men.add(coords)
+            else:
+                for segment in removed_coords_from_steps(coords, steps):
+                    men.difference_update(segment)
+                ball = coords
+            player = 'bottom' if player == 'top' else 'top'
+            yield ball, men, player
+
+
+def encode_varint(number, output):
+    '''Appends number to the bytearray output as an unsigned LEB128
+    varint.'''
+    if number < 0:
+        raise ValueError('Cannot encode negative number {}'.format(number))
+    while number > 0x7f:
+        output.append(number & 0x7f | 0x80)
+        number >>= 7
+    output.append(number)
+
+
+def decode_varint(data, position):
+    '''Returns the varint starting at data[position], and the position
+    after it.'''
+    number = 0
+    shift = 0
+    while True:
+        if position >= len(data):
+            raise RecordFormatError('Truncated varint')
+        byte = data[position]
+        position += 1
+        number |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return number, position
+        shift += 7
+
+
+def _direction(start, end):
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    return directions.index(((dx > 0) - (dx < 0), (dy > 0) - (dy < 0)))
+
+
+def encode_game(record):
+    '''Returns the bytes of a GameRecord, without the length prefix.'''
+    width, height = record.shape
+    output = bytearray()
+    encode_varint(width, output)
+    encode_varint(height, output)
+    ball_x, ball_y = record.ball_coords
+    encode_varint(ball_y * width + ball_x, output)
+    output.append(PLAYER_CODES[record.current_player])
+
+    squares = sorted(y * width + x for x, y in record.man_coords)
+    encode_varint(len(squares), output)
+    previous = 0
+    for square in squares:
+        encode_varint(square - previous, output)
+        previous = square
+    output.append(WINNER_CODES[record.winner])
+
+    info = json.dumps(record.info, separators=(',', ':')).encode('utf-8')
+    encode_varint(len(info), output)
+    output.extend(info)
+
+    encode_varint(len(record.moves), output)
+    for move_type, coords, steps in record.moves:
+        if move_type == 'play':
+            encode_varint(2 * (coords[1] * width + coords[0]), output)
+            continue
+        ends = list(steps[1:]) + [coords]
+        encode_varint(2 * len(steps) + 1, output)
+        bits = 0
+        for i, (start, end) in enumerate(zip(steps, ends)):
+            bits |= _direction(start, end) << 3 * i
+        output.extend(bits.to_bytes((3 * len(steps) + 7) // 8, 'little'))
+    return bytes(output)
+
+
+def decode_game(data):
+    '''Returns the GameRecord encoded in data.'''
+    try:
+        return _decode_game(data)
+    except (IndexError, ValueError) as error:
+        raise RecordFormatError('Invalid game record: {}'.format(error))
+
+
+def _decode_game(data):
+    width, position = decode_varint(data, 0)
+    height, position = decode_varint(data, position)
+    if not width or not height:
+        raise RecordFormatError('Invalid shape {}x{}'.format(width, height))
+    ball, position = decode_varint(data, position)
+    ball = (ball % width, ball // width)
+    current_player = PLAYERS[data[position]]
+    position += 1
+
+    number_of_men, position = decode_varint(data, position)
+    men = set()
+    square = 0
+    for i in range(number_of_men):
+        gap, position = decode_varint(data, position)
+        square += gap
+        men.add((square % width, square // width))
+    winner = WINNERS[data[position]]
+    position += 1
+
+    length, position = decode_varint(data, position)
+    info = json.loads(bytes(data[position:position + length]).decode('utf-8'))
+    position += length
+
+    record = GameRecord((width, height), ball, men, current_player,
+                        winner=winner, info=info)
+
+    # Jumps can only be decoded by following the men on the board.
+    number_of_moves, position = decode_varint(data, position)
+    moves = record.moves
+    for i in range(number_of_moves):
+        code, position = decode_varint(data, position)
+        if not code & 1:
+            square = code >> 1
+            coords = (square % width, square // width)
+            men.add(coords)
+            moves.append(('play', coords, None))
+            continue
+        number_of_steps = code >> 1
+        size = (3 * number_of_steps + 7) // 8
+        bits = int.from_bytes(bytes(data[position:position + size]),
+                              'little')
+        position += size
+        steps = []
+        for step in range(number_of_steps):
+            dx, dy = directions[bits >> 3 * step & 7]
+            steps.append(ball)
+            x, y = ball[0] + dx, ball[1] + dy
+            if (x, y) not in men:
+                raise RecordFormatError(
+                    'No man to jump from {} in move {}'.format(ball, i))
+            while (x, y) in men:
+                men.remove((x, y))
+                x, y = x + dx, y + dy
+            ball = (x, y)
+        moves.append(('move', ball, steps))
+    if position != len(data):
+        raise RecordFormatError('Unexpected data after the moves')
+    return record
+
+
+class RecordWriter(object):
+    '''Appends games to a record file, creating it if necessary.
+
+    Can be used as a context manager:
+
+        with RecordWriter('games.phr') as writer:
+            writer.write(record)
+    '''
+
+    def __init__(self, filen):
+        self.filen = filen
+        self.fileh = open(filen, 'ab')
+        if self.fileh.tell() == 0:
+            self.fileh.write(MAGIC)
+
+    def write(self, record):
+        data = encode_game(record)
+        prefix = bytearray()
+        encode_varint(len(data), prefix)
+        self.fileh.write(bytes(prefix) + data)
+
+    def flush(self):
+        self.fileh.flush()
+
+    def close(self):
+        self.fileh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_records(filen):
+    '''Yields every GameRecord in a record file, in order, reading one
+    game at a time.'''
+    with open(filen, 'rb') as fileh:
+        if fileh.read(len(MAGIC)) != MAGIC:
+            raise RecordFormatError('{} is not a game record file'.format(
+                filen))
+        while True:
+            length = 0
+            shift = 0
+            while True:
+                byte = fileh.read(1)
+                if not byte:
+                    if shift:
+                        raise RecordFormatError('Truncated record length')
+                    return
+                length |= (byte[0] & 0x7f) << shift
+                if not byte[0] & 0x80:
+                    break
+                shift += 7
+            data = fileh.read(length)
+            if len(data) != length:
+                raise RecordFormatError('Truncated game record')
+            yield decode_game(data)
+
+
+def record_from_phut(d, info=None):
+    '''Returns a GameRecord, with no moves, starting from the position
+    in a .phut dictionary (as written by AbstractBoard.serialise).'''
+    if info is None:
+        info = {}
+        if d.get('message'):
+            info['message'] = d['message']
+    return GameRecord(d['shape'], d['ball_coords'], d['man_coords'],
+                      d['current_player'], info=info)
+
+
+def record_to_phut(record, move_number=None):
+    '''Returns a .phut dictionary, which AbstractBoard.load_dict can
+    load, for the position after move_number moves of the game (by
+    default, after every move).'''
+    if move_number is None:
+        move_number = len(record.moves)
+    for number, (ball, men, player) in enumerate(record.positions()):
+        if number == move_number:
+            break
+    else:
+        raise ValueError('The game has only {} moves'.format(
+            len(record.moves)))
+    man_coords = sorted(map(list, men))
+    return {'shape': list(record.shape),
+            'ball_coords': list(ball),
+            'man_coords': man_coords,
+            'current_player': player,
+            'legal_moves': [],
+            'speculative_ball_coords': list(ball),
+            'speculative_man_coords': man_coords,
+            'speculative_legal_moves': [],
+            'speculative_step_removals': [],
+            'speculative_steps': [],
+            'message': record.info.get('message', ''),
+            'other': ''}
+
+
+def load_phut(filen):
+    '''Returns a GameRecord starting from the position in a .phut
+    file.'''
+    with open(filen, 'r') as fileh:
+        return record_from_phut(json.load(fileh))
+
+
+def save_phut(record, filen, move_number=None):
+    '''Writes the position after move_number moves of a GameRecord to a
+    .phut file.'''
+    with open(filen, 'w') as fileh:
+        fileh.write(json.dumps(record_to_phut(record, move_number)))
@@ -0,0 +1,450 @@
+'''Negamax alpha-beta search for phutball.
+
+Positions are searched as plain integers (the men bitmask of a
+BitBoard, and the bit index of the ball), so making a move never copies
+anything bigger than an int. Positions are hashed with the same
+Zobrist keys as AbstractBoard, so a TranspositionTable can be shared
+between a board and the search.
+
+Candidate moves are every distinct jump sequence result (one per
+resulting position) plus man placements close to the ball.
+'''
+
+import time
+
+from .bitboard import geometry_for
+from .transposition import (TranspositionTable, EXACT, LOWER_BOUND,
+                            UPPER_BOUND)
+from .zobrist import keys_for
+
+WIN = 100000
+
+PLAY = 'play'
+MOVE = 'move'
+
+
+class SearchTimeout(Exception):
+    '''Raised inside the search when the deadline has passed.'''
+
+
+def jump_states(geometry, ball, men, maxdepth=None):
+    '''Returns a list of (landing square, path, men) for every distinct
+    position reachable by a sequence of jumps from ball. path is the
+    list of squares the ball jumps from, as in get_legal_moves.'''
+    coords = geometry.coords
+    deltas = geometry.deltas
+    past_goals = geometry.past_goals
+
+    start = (ball, men)
+    parents = {start: None}
+    results = []
+    frontier = [start]
+    depth = 1
+    while frontier and (maxdepth is None or depth <= maxdepth):
+        next_frontier = []
+        for state in frontier:
+            ball, men = state
+            for delta in deltas:
+                square = ball + delta
+                if not men >> square & 1:
+                    continue
+                jumped = 0
+                while men >> square & 1:
+                    jumped |= 1 << square
+                    square += delta
+                if coords[square] is None:
+                    continue
+                new_state = (square, men ^ jumped)
+                if new_state in parents:
+                    continue
+                parents[new_state] = state
+                if not past_goals >> square & 1:
+                    next_frontier.append(new_state)
+                results.append(new_state)
+        frontier = next_frontier
+        depth += 1
+
+    states = []
+    for state in results:
+        path = []
+        parent = parents[state]
+        while parent is not None:
+            path.append(parent[0])
+            parent = parents[parent]
+        path.reverse()
+        states.append((state[0], path, state[1]))
+    return states
+
+
+def winner_at(geometry, ball):
+    '''Returns 'top', 'bottom' or None for a ball at the given index,
+    with the same rule as AbstractBoard.check_for_win.'''
+    y = geometry.coords[ball][1]
+    if y <= 1:
+        return 'bottom'
+    if y >= geometry.shape[1] - 2:
+        return 'top'
+    return None
+
+
+def distance_to_goal(geometry, ball, player):
+    '''Number of rows the ball must travel for player to win.'''
+    y = geometry.coords[ball][1]
+    if player == 'top':
+        return max(0, geometry.shape[1] - 2 - y)
+    return max(0, y - 1)
+
+
+def to_table_value(value, ply):
+    '''Win scores depend on the distance from the root; the table stores
+    them as distances from the stored position instead.'''
+    if value >= WIN - 1000:
+        return value + ply
+    if value <= -(WIN - 1000):
+        return value - ply
+    return value
+
+
+def from_table_value(value, ply):
+    if value >= WIN - 1000:
+        return value - ply
+    if value <= -(WIN - 1000):
+        return value + ply
+    return value
+
+
+def other_player(player):
+    return 'bottom' if player == 'top' else 'top'
+
+
+class SearchResult(object):
+    '''The outcome of a search: the chosen move plus statistics.'''
+
+    def __init__(self, move_type, coords, path, value, depth, nodes,
+                 elapsed):
+        self.move_type = move_type
+        self.coords = coords
+        self.path = path
+        self.value = value
+        self.depth = depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.
+
+    def __repr__(self):
+        return ('SearchResult({}, {}, value={}, depth={}, nodes={}, '
+                'nps={:.0f})'.format(self.move_type, self.coords,
+                                     self.value, self.depth, self.nodes,
+                                     self.nodes_per_second))
+
+
+class SearchEngine(object):
+    '''Iterative deepening negamax with alpha-beta pruning, a
+    transposition table and a wall-clock deadline.
+
+    The search deepens until time_limit has passed; max_depth
+    optionally caps the depth as well. Man placements are only
+    considered within placement_radius squares of the ball. If a
+    tablebase (see engine.tablebase) is given, any position it has a
+    winning jump for is scored as a win without searching it.
+    '''
+
+    def __init__(self, shape=(15, 19), transposition_table=None,
+                 max_depth=None, time_limit=1.0, placement_radius=2,
+                 tablebase=None):
+        self.geometry = geometry_for(shape)
+        if transposition_table is None:
+            transposition_table = TranspositionTable()
+        self.transposition_table = transposition_table
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.placement_radius = placement_radius
+        self.tablebase = tablebase
+
+        keys = keys_for(shape)
+        coords = self.geometry.coords
+        self.man_keys = [0 if c is None else keys.man_key(c) for c in coords]
+        self.ball_keys = [0 if c is None else keys.ball_key(c)
+                          for c in coords]
+        self.side_key = keys.side
+
+        offsets = sorted(
+            [(dx, dy) for dx in range(-placement_radius, placement_radius + 1)
+             for dy in range(-placement_radius, placement_radius + 1)
+             if dx or dy],
+            key=lambda o: (max(abs(o[0]), abs(o[1])), abs(o[0]) + abs(o[1])))
+        stride = self.geometry.stride
+        self.placement_deltas = [dx + dy * stride for dx, dy in offsets]
+
+        self.nodes = 0
+        self.deadline = None
+        self.stopped = False
+
+    def stop(self):
+        '''Makes the search in progress (or the next one, if none is
+        running) return as soon as possible, with the best move of the
+        deepest completed iteration. Searches stay stopped until
+        resume() is called. May be called from another thread.'''
+        self.stopped = True
+
+    def resume(self):
+        self.stopped = False
+
+    def to_bits(self, ball_coords, man_coords):
+        '''Returns the ball square and men bits of a position given in
+        coordinates.'''
+        geometry = self.geometry
+        men = 0
+        for coords in man_coords:
+            index = geometry.index(coords)
+            if index is not None:
+                men |= 1 << index
+        return geometry.index(ball_coords), men
+
+    def position_hash(self, ball, men, player):
+        h = self.ball_keys[ball]
+        if player == 'bottom':
+            h ^= self.side_key
+        man_keys = self.man_keys
+        while men:
+            low = men & -men
+            h ^= man_keys[low.bit_length() - 1]
+            men ^= low
+        return h
+
+    def evaluate(self, ball, men, player, ply=0):
+        '''Static evaluation from the point of view of player, who is to
+        move.
+
+        A jump into player's goal wins at once. Otherwise the score
+        counts the rows the ball is from each goal, how far towards
+        each goal a jump could take it now (either side may jump the
+        same men) or after one man is placed just ahead of the ball,
+        and whether the opponent threatens a winning jump, now or after
+        such a placement.'''
+        geometry = self.geometry
+        opponent = other_player(player)
+        own = distance_to_goal(geometry, ball, player)
+        theirs = distance_to_goal(geometry, ball, opponent)
+        own_reach, their_reach = own, theirs
+        threat = False
+        for landing, path, new_men in jump_states(geometry, ball, men):
+            winner = winner_at(geometry, landing)
+            if winner == player:
+                return WIN - ply - 1
+            if winner is not None:
+                threat = True
+            own_reach = min(own_reach, distance_to_goal(geometry, landing,
+                                                        player))
+            their_reach = min(their_reach, distance_to_goal(
+                geometry, landing, opponent))
+        own_setup = self.setup_reach(ball, men, player)
+        their_setup = self.setup_reach(ball, men, opponent)
+        value = (10 * (theirs - own) +
+                 6 * ((own - own_reach) - (theirs - their_reach)) +
+                 3 * ((own - own_setup) - (theirs - their_setup)))
+        if threat:
+            value -= 200
+        if their_setup == 0:
+            value -= 200
+        return value
+
+    def setup_reach(self, ball, men, player):
+        '''Returns the distance to player's goal the ball could jump to
+        if a man were placed on the square just ahead of it, the usual
+        way to start or extend a chain of jumps.'''
+        geometry = self.geometry
+        best = distance_to_goal(geometry, ball, player)
+        if player == 'top':
+            square = ball + geometry.stride
+        else:
+            square = ball - geometry.stride
+        if not geometry.on_board >> square & 1 or men >> square & 1:
+            return best
+        for landing, path, new_men in jump_states(geometry, ball,
+                                                  men | 1 << square):
+            best = min(best, distance_to_goal(geometry, landing, player))
+        return best
+
+    def generate_moves(self, ball, men, player):
+        '''Returns candidate moves as (kind, square, men after, path)
+        tuples, best first by a cheap static ordering.'''
+        geometry = self.geometry
+        jumps = [(MOVE, landing, new_men, path) for landing, path, new_men
+                 in jump_states(geometry, ball, men)]
+        jumps.sort(key=lambda move: distance_to_goal(geometry, move[1],
+                                                     player))
+
+        on_board = geometry.on_board
+        occupied = men | 1 << ball
+        placements = []
+        for delta in self.placement_deltas:
+            square = ball + delta
+            if 0 <= square < geometry.size and on_board >> square & 1 \
+                    and not occupied >> square & 1:
+                placements.append((PLAY, square, men | 1 << square, None))
+                occupied |= 1 << square
+        # Men placed where jumps pass or land make those jumps longer,
+        # cut them short or change their parity, so they are the usual
+        # way to stop a jump or build on one, even far from the ball.
+        stride = geometry.stride
+        for kind, landing, new_men, path in jumps:
+            for square in path[1:] + [landing, landing - stride,
+                                      landing + stride]:
+                if 0 <= square < geometry.size and \
+                        on_board >> square & 1 and not occupied >> square & 1:
+                    placements.append((PLAY, square, men | 1 << square, None))
+                    occupied |= 1 << square
+        return jumps + placements
+
+    def _check_deadline(self):
+        if self.stopped or (self.deadline is not None and
+                            time.time() > self.deadline):
+            raise SearchTimeout()
+
+    def negamax(self, ball, men, player, h, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 255 == 0:
+            self._check_deadline()
+
+        winner = winner_at(self.geometry, ball)
+        if winner is not None:
+            return WIN - ply if winner == player else -(WIN - ply)
+        if self.tablebase is not None and \
+                self.tablebase.probe_bits(self.geometry, ball, men, player):
+            return WIN - ply - 1
+        if depth <= 0:
+            return self.evaluate(ball, men, player, ply)
+
+        table = self.transposition_table
+        original_alpha = alpha
+        best_move_key = None
+        entry = table.lookup(h)
+        if entry is not None and entry.value is not None:
+            best_move_key = entry.best_move
+            if entry.depth >= depth:
+                value = from_table_value(entry.value, ply)
+                if entry.flag == EXACT:
+                    return value
+                elif entry.flag == LOWER_BOUND:
+                    alpha = max(alpha, value)
+                elif entry.flag == UPPER_BOUND:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+
+        moves = self.generate_moves(ball, men, player)
+        if best_move_key is not None:
+            moves.sort(key=lambda move: move[:3] != best_move_key)
+
+        opponent = other_player(player)
+        best_value = -WIN - 1
+        best_key = None
+        for move in moves:
+            child_ball, child_men, child_h = self.apply(
+                ball, men, h, move)
+            value = -self.negamax(child_ball, child_men, opponent, child_h,
+                                  depth - 1, -beta, -alpha, ply + 1)
+            if value > best_value:
+                best_value = value
+                best_key = move[:3]
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_value >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        table.store(h, depth=depth, value=to_table_value(best_value, ply),
+                    flag=flag, best_move=best_key)
+        return best_value
+
+    def apply(self, ball, men, h, move):
+        '''Returns the ball, men and hash after making move.'''
+        kind, square, new_men, path = move
+        h ^= self.side_key
+        if kind == PLAY:
+            return ball, new_men, h ^ self.man_keys[square]
+        h ^= self.ball_keys[ball] ^ self.ball_keys[square]
+        removed = men ^ new_men
+        man_keys = self.man_keys
+        while removed:
+            low = removed & -removed
+            h ^= man_keys[low.bit_length() - 1]
+            removed ^= low
+        return square, new_men, h
+
+    def search_root(self, ball, men, player, h, depth, moves):
+        '''Searches every root move to the given depth. Returns the best
+        value and move.'''
+        alpha = -WIN - 1
+        beta = WIN + 1
+        best_move = None
+        opponent = other_player(player)
+        for move in moves:
+            child_ball, child_men, child_h = self.apply(ball, men, h, move)
+            value = -self.negamax(child_ball, child_men, opponent, child_h,
+                                  depth - 1, -beta, -alpha, 1)
+            if best_move is None or value > alpha:
+                alpha = value
+                best_move = move
+        return alpha, best_move
+
+    def search(self, ball_coords, man_coords, player, time_limit=None,
+               max_depth=None, progress=None):
+        '''Searches the given position for player to move, deepening
+        until the time limit (or max_depth, if there is one). Returns a
+        SearchResult.
+
+        If progress is given, it is called as progress(depth, value,
+        nodes, elapsed) after each completed iteration.'''
+        if time_limit is None:
+            time_limit = self.time_limit
+        if max_depth is None:
+            max_depth = self.max_depth
+        geometry = self.geometry
+        ball, men = self.to_bits(ball_coords, man_coords)
+        h = self.position_hash(ball, men, player)
+
+        start = time.time()
+        self.nodes = 0
+        self.deadline = None if time_limit is None else start + time_limit
+        moves = self.generate_moves(ball, men, player)
+        if not moves:
+            return None
+
+        best_value, best_move, completed = None, moves[0], 0
+        depth = 0
+        while max_depth is None or depth < max_depth:
+            depth += 1
+            try:
+                value, move = self.search_root(ball, men, player, h, depth,
+                                               moves)
+            except SearchTimeout:
+                break
+            best_value, best_move, completed = value, move, depth
+            if progress is not None:
+                progress(depth, value, self.nodes, time.time() - start)
+            # Search the previous best move first at the next depth.
+            moves.remove(move)
+            moves.insert(0, move)
+            # A proven win or loss is not changed by searching deeper.
+            if abs(value) >= WIN - depth - 1:
+                break
+            if self.deadline is not None and time.time() > self.deadline:
+                break
+
+        kind, square, new_men, path = best_move
+        path_coords = None
+        if path is not None:
+            path_coords = [geometry.coords[index] for index in path]
+        return SearchResult(kind, geometry.coords[square], path_coords,
+                            best_value, completed, self.nodes,
+                            time.time() - start)
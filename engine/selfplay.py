@@ -0,0 +1,233 @@
+'''Headless games between AI players, for tuning and regression runs.
+
+A game is described by a GameSpec, and play_game plays it to the end
+on an AbstractBoard and returns a GameRecord (see engine.records). run_games plays
+many games over a process pool and yields the records as they finish.
+
+Each game gets its own seed (the base seed plus the game's index), so
+a run can be repeated exactly, game by game, with any number of worker
+processes.
+'''
+
+import multiprocessing
+import random
+import time
+
+from .ai import AI
+from .board import AbstractBoard
+from .mcts import MCTSPlayer
+from .records import GameRecord
+from .search import SearchEngine, other_player
+
+PLAYERS = ('heuristic', 'search', 'mcts', 'random')
+
+
+class GameSpec(object):
+    '''Everything needed to play one game. start is None for an empty
+    board with the ball in the centre, or the dict of a .phut file.'''
+
+    def __init__(self, index, seed, players, shape=(15, 19), start=None,
+                 start_name=None, time_limit=0.1, max_depth=None,
+                 max_moves=200, random_opening=0, iterations=None,
+                 tablebase=None):
+        self.index = index
+        self.seed = seed
+        self.players = players
+        self.shape = tuple(shape)
+        self.start = start
+        self.start_name = start_name
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.max_moves = max_moves
+        self.random_opening = random_opening
+        self.iterations = iterations
+        self.tablebase = tablebase
+
+
+class MirroredBoard(object):
+    '''The position of an AbstractBoard turned upside down, so that a
+    player that only knows how to play 'bottom' can play 'top'.'''
+
+    def __init__(self, board):
+        self.height = board.shape[1]
+        self.board = AbstractBoard(shape=board.shape,
+                                   move_generator=board.move_generator)
+        self.board.reset()
+        with self.board.bulk_edit():
+            self.board.ball_coords = self.flip(board.ball_coords)
+            for coords in board.man_coords:
+                self.board.add_man(self.flip(coords))
+            self.board.current_player = other_player(board.current_player)
+
+    def flip(self, coords):
+        return (coords[0], self.height - 1 - coords[1])
+
+
+_move_generators = {}
+
+
+def random_move(board, rng):
+    '''Returns a random jump or nearby placement for the player to move
+    on board.'''
+    engine = _move_generators.get(board.shape)
+    if engine is None:
+        engine = _move_generators[board.shape] = SearchEngine(board.shape)
+    geometry = engine.geometry
+    ball = geometry.index(board.ball_coords)
+    men = 0
+    for coords in board.man_coords:
+        men |= 1 << geometry.index(coords)
+    moves = engine.generate_moves(ball, men, board.current_player)
+    if not moves:
+        raise ValueError('No moves available')
+    kind, square, new_men, path = rng.choice(moves)
+    if path is not None:
+        path = [geometry.coords[index] for index in path]
+    return kind, geometry.coords[square], path
+
+
+class Player(object):
+    '''Chooses moves of one kind for whichever side is to move.'''
+
+    def __init__(self, kind, seed, time_limit=0.1, max_depth=None,
+                 iterations=None, tablebase=None):
+        if kind not in PLAYERS:
+            raise ValueError('Unknown player {!r}'.format(kind))
+        self.kind = kind
+        self.random = random.Random(seed)
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.iterations = iterations
+        self.tablebase = tablebase
+        self.ai = None
+
+    def get_move(self, board):
+        '''Returns (move_type, coords, path) for the player to move on
+        board. path may be None.'''
+        if self.kind == 'random':
+            return random_move(board, self.random)
+        if self.kind == 'heuristic':
+            # The heuristic ai only plays 'bottom'.
+            if board.current_player == 'bottom':
+                return self._ai_move(board, 'heuristic')
+            mirror = MirroredBoard(board)
+            move_type, coords, path = self._ai_move(mirror.board,
+                                                    'heuristic')
+            if path is not None:
+                path = [mirror.flip(step) for step in path]
+            return move_type, mirror.flip(coords), path
+        return self._ai_move(board, self.kind)
+
+    def _ai_move(self, board, mode):
+        if self.ai is None or self.ai.mode != mode:
+            self.close()
+            self.ai = AI(board, mode=mode, time_limit=self.time_limit,
+                         max_depth=self.max_depth, workers=1,
+                         tablebase=self.tablebase)
+        self.ai.abstractboard = board
+        if mode == 'mcts' and self.ai.mcts is None:
+            # Seeded here, as the AI would otherwise seed it randomly.
+            self.ai.mcts = MCTSPlayer(board.shape, workers=1,
+                                      time_limit=self.time_limit,
+                                      iterations=self.iterations,
+                                      seed=self.random.getrandbits(32),
+                                      tablebase=self.tablebase)
+        move_type, coords = self.ai.get_move()
+        return move_type, tuple(coords), self.ai.path
+
+    def close(self):
+        if self.ai is not None:
+            self.ai.close()
+            self.ai = None
+
+
+def new_board(spec):
+    '''Returns the starting AbstractBoard for a game.'''
+    board = AbstractBoard(shape=spec.shape, move_generator='reachable')
+    board.reset()
+    if spec.start is not None:
+        board.load_dict(spec.start)
+    else:
+        with board.bulk_edit():
+            board.ball_coords = (spec.shape[0] // 2, spec.shape[1] // 2)
+            board.current_player = 'top'
+    return board
+
+
+def apply_move(board, move):
+    '''Plays (move_type, coords, path) on board. Raises ValueError if the
+    move is not legal.'''
+    move_type, coords, path = move
+    if move_type == 'move':
+        if coords not in board.legal_moves:
+            raise ValueError('Cannot move the ball to {}'.format(coords))
+        if path is None:
+            path = board.legal_moves[coords][0]
+        board.make_move('move', coords, path)
+    else:
+        board.make_move('play', coords)
+
+
+def play_game(spec):
+    '''Plays the game described by spec and returns its GameRecord.
+    The record's info holds the game's index, seed, start, players,
+    the reason it ended and the time it took.'''
+    start = time.time()
+    rng = random.Random(spec.seed)
+    board = new_board(spec)
+    record = GameRecord(board.shape, board.ball_coords, board.man_coords,
+                        board.current_player)
+    record.info = {'game': spec.index,
+                   'seed': spec.seed,
+                   'start': spec.start_name,
+                   'players': dict(spec.players),
+                   'reason': 'max_moves'}
+    players = {side: Player(kind, rng.getrandbits(32), spec.time_limit,
+                            spec.max_depth, spec.iterations, spec.tablebase)
+               for side, kind in spec.players.items()}
+
+    try:
+        for number in range(spec.max_moves + 1):
+            winner = board.check_for_win()
+            if winner != 'none':
+                record.winner = winner
+                record.info['reason'] = 'goal'
+                break
+            if number == spec.max_moves:
+                break
+            side = board.current_player
+            try:
+                if number < spec.random_opening:
+                    move = random_move(board, rng)
+                else:
+                    move = players[side].get_move(board)
+                apply_move(board, move)
+            except ValueError as error:
+                record.winner = other_player(side)
+                record.info['reason'] = 'illegal move by {}: {}'.format(
+                    side, error)
+                break
+    finally:
+        for player in players.values():
+            player.close()
+
+    record.moves = board.history
+    record.info['elapsed'] = round(time.time() - start, 4)
+    return record
+
+
+def run_games(specs, processes=None):
+    '''Plays every GameSpec over a pool of processes, yielding the
+    records in the order the games finish. With processes=1 the games
+    are played in the calling process.'''
+    if processes == 1:
+        for spec in specs:
+            yield play_game(spec)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        for record in pool.imap_unordered(play_game, specs):
+            yield record
+    finally:
+        pool.terminate()
+        pool.join()
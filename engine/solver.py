@@ -0,0 +1,393 @@
+'''Finds the shortest forced win for the side to move.
+
+The solver is an iterative deepening AND/OR search: at the solving
+player's nodes one winning move is enough, at the opponent's nodes
+every reply must lose. Depths count the solving player's moves, so a
+win in 1 is a jump straight into the goal.
+
+The opponent can place a man on any empty square, which would make
+every opponent node very wide. Instead, each proof also returns its
+zone: every square whose contents the proof depends on (the squares
+read by its jump searches, and the squares the solver placed men on).
+A man placed outside the zone cannot change anything the proof looked
+at. So at an opponent node the solver first proves the position in
+which the opponent passes. Any placement outside that proof's zone is
+then refuted by the same proof, and only placements inside it are
+searched. For a win in 2, the only placements searched are those that
+touch the jumps of the winning move.
+
+The solving player's own placements are all tried, nearest the ball
+first, so the shortest win is always found if the search finishes.
+'''
+
+import time
+
+from .bitboard import geometry_for
+from .search import SearchTimeout, other_player
+from .transposition import TranspositionTable, EXACT, UPPER_BOUND
+from .zobrist import keys_for
+
+PLAY = 'play'
+MOVE = 'move'
+
+# XORed into the hash of positions where the opponent of the solving
+# player is to move, which are stored with a different meaning.
+_OPPONENT_NODE = 0x5bd1e9955bd1e995
+
+
+def jumps_and_probe(geometry, ball, men):
+    '''Returns a list of (landing, path, men after) for every distinct
+    position reachable by jumps from ball, as search.jump_states, and
+    the mask of every square the search read.'''
+    coords = geometry.coords
+    deltas = geometry.deltas
+    past_goals = geometry.past_goals
+    start = (ball, men)
+    parents = {start: None}
+    results = []
+    probe = 0
+    frontier = [start]
+    while frontier:
+        next_frontier = []
+        for state in frontier:
+            ball, men = state
+            for delta in deltas:
+                square = ball + delta
+                probe |= 1 << square
+                if not men >> square & 1:
+                    continue
+                jumped = 0
+                while men >> square & 1:
+                    jumped |= 1 << square
+                    square += delta
+                probe |= jumped | 1 << square
+                if coords[square] is None:
+                    continue
+                new_state = (square, men ^ jumped)
+                if new_state in parents:
+                    continue
+                parents[new_state] = state
+                if not past_goals >> square & 1:
+                    next_frontier.append(new_state)
+                results.append(new_state)
+        frontier = next_frontier
+
+    states = []
+    for state in results:
+        path = []
+        parent = parents[state]
+        while parent is not None:
+            path.append(parent[0])
+            parent = parents[parent]
+        path.reverse()
+        states.append((state[0], path, state[1]))
+    return states, probe
+
+
+class SolveResult(object):
+    '''The outcome of solving a position.
+
+    status is 'win' if a forced win was found, 'none' if there is no
+    forced win within max_depth moves, or 'timeout' if the time ran
+    out first. depth is the length of the win in moves of the solving
+    player (for 'win'), or the greatest depth fully searched. line is
+    a main line of the win as (move_type, coords, steps) tuples,
+    alternating between the players.
+    '''
+
+    def __init__(self, status, depth, line, nodes, elapsed):
+        self.status = status
+        self.depth = depth
+        self.line = line
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    def as_dict(self):
+        return {'status': self.status,
+                'depth': self.depth,
+                'line': [[move_type, list(coords),
+                          None if steps is None else list(map(list, steps))]
+                         for move_type, coords, steps in self.line],
+                'nodes': self.nodes,
+                'elapsed': round(self.elapsed, 4)}
+
+    def __repr__(self):
+        return 'SolveResult({}, depth={}, nodes={}, line={})'.format(
+            self.status, self.depth, self.nodes, self.line)
+
+
+class Solver(object):
+    '''Proves forced wins on a board of the given shape.'''
+
+    def __init__(self, shape=(15, 19), transposition_table=None):
+        self.geometry = geometry_for(shape)
+        if transposition_table is None:
+            transposition_table = TranspositionTable(2**18)
+        self.transposition_table = transposition_table
+
+        keys = keys_for(shape)
+        coords = self.geometry.coords
+        self.man_keys = [0 if c is None else keys.man_key(c) for c in coords]
+        self.ball_keys = [0 if c is None else keys.ball_key(c)
+                          for c in coords]
+        self.side_key = keys.side
+        on_board = self.geometry.on_board
+        self.empty = [index for index in range(len(coords))
+                      if on_board >> index & 1]
+
+        self.nodes = 0
+        self.deadline = None
+
+    def position_hash(self, ball, men, player):
+        h = self.ball_keys[ball]
+        if player == 'bottom':
+            h ^= self.side_key
+        man_keys = self.man_keys
+        while men:
+            low = men & -men
+            h ^= man_keys[low.bit_length() - 1]
+            men ^= low
+        return h
+
+    def winner_at(self, ball):
+        y = self.geometry.coords[ball][1]
+        if y <= 1:
+            return 'bottom'
+        if y >= self.geometry.shape[1] - 2:
+            return 'top'
+        return None
+
+    def _count_node(self):
+        self.nodes += 1
+        if self.nodes & 255 == 0 and self.deadline is not None and \
+                time.time() > self.deadline:
+            raise SearchTimeout()
+
+    def _placements(self, ball, men):
+        '''Empty squares, nearest the ball first.'''
+        coords = self.geometry.coords
+        ball_x, ball_y = coords[ball]
+        occupied = men | 1 << ball
+        squares = [square for square in self.empty
+                   if not occupied >> square & 1]
+        squares.sort(key=lambda square: max(abs(coords[square][0] - ball_x),
+                                            abs(coords[square][1] - ball_y)))
+        return squares
+
+    def _distance(self, ball, player):
+        y = self.geometry.coords[ball][1]
+        if player == 'top':
+            return self.geometry.shape[1] - 2 - y
+        return y - 1
+
+    def prove(self, ball, men, player, h, depth):
+        '''Returns (True, zone, best move) if player, to move, can force
+        a win within depth moves, or (False, 0, None).'''
+        self._count_node()
+        table = self.transposition_table
+        entry = table.lookup(h)
+        if entry is not None and entry.value is not None:
+            if entry.flag == EXACT and entry.depth <= depth:
+                return True, entry.value, entry.best_move
+            if entry.flag == UPPER_BOUND and entry.depth >= depth:
+                return False, 0, None
+
+        states, probe = jumps_and_probe(self.geometry, ball, men)
+        opponent = other_player(player)
+        jumps = []
+        for landing, path, new_men in states:
+            winner = self.winner_at(landing)
+            if winner == player:
+                move = (MOVE, landing, new_men, tuple(path))
+                table.store(h, depth=1, value=probe, flag=EXACT,
+                            best_move=move)
+                return True, probe, move
+            if winner is None:
+                jumps.append((MOVE, landing, new_men, tuple(path)))
+
+        if depth > 1:
+            jumps.sort(key=lambda move: self._distance(move[1], player))
+            moves = jumps + [(PLAY, square, men | 1 << square, None)
+                             for square in self._placements(ball, men)]
+            for move in moves:
+                kind, square, new_men, path = move
+                child_h = self.apply_hash(h, ball, men, move)
+                proven, zone = self.refute(square if kind == MOVE else ball,
+                                           new_men, opponent, child_h,
+                                           depth - 1, player)
+                if proven:
+                    zone |= probe if kind == MOVE else 1 << square
+                    table.store(h, depth=depth, value=zone, flag=EXACT,
+                                best_move=move)
+                    return True, zone, move
+
+        if entry is None or entry.flag != EXACT:
+            table.store(h, depth=depth, value=0, flag=UPPER_BOUND)
+        return False, 0, None
+
+    def refute(self, ball, men, player, h, depth, solver):
+        '''Returns (True, zone) if every move of player, to move, loses
+        to solver within depth moves of solver, or (False, 0).'''
+        self._count_node()
+        table = self.transposition_table
+        key = h ^ _OPPONENT_NODE
+        entry = table.lookup(key)
+        if entry is not None and entry.value is not None:
+            if entry.flag == EXACT and entry.depth <= depth:
+                return True, entry.value
+            if entry.flag == UPPER_BOUND and entry.depth >= depth:
+                return False, 0
+
+        proven, zone = self._refute(ball, men, player, h, depth, solver)
+        if proven:
+            table.store(key, depth=depth, value=zone, flag=EXACT)
+        elif entry is None or entry.flag != EXACT:
+            table.store(key, depth=depth, value=0, flag=UPPER_BOUND)
+        return proven, zone
+
+    def _refute(self, ball, men, player, h, depth, solver):
+        states, probe = jumps_and_probe(self.geometry, ball, men)
+        zone = probe
+        jumps = []
+        for landing, path, new_men in states:
+            winner = self.winner_at(landing)
+            if winner == player:
+                return False, 0
+            if winner is None:
+                jumps.append((MOVE, landing, new_men, tuple(path)))
+
+        for move in jumps:
+            proven, child_zone, best = self.prove(
+                move[1], move[2], solver, self.apply_hash(h, ball, men, move),
+                depth)
+            if not proven:
+                return False, 0
+            zone |= child_zone
+
+        # If solver wins even when player passes, that proof also
+        # refutes every placement outside its zone.
+        placements = self._placements(ball, men)
+        proven, pass_zone, best = self.prove(ball, men, solver,
+                                             h ^ self.side_key, depth)
+        if proven:
+            zone |= pass_zone
+            placements = [square for square in placements
+                          if pass_zone >> square & 1]
+        for square in placements:
+            move = (PLAY, square, men | 1 << square, None)
+            proven, child_zone, best = self.prove(
+                ball, move[2], solver, self.apply_hash(h, ball, men, move),
+                depth)
+            if not proven:
+                return False, 0
+            zone |= child_zone
+        return True, zone
+
+    def apply_hash(self, h, ball, men, move):
+        '''Returns the hash of the position after move.'''
+        kind, square, new_men, path = move
+        h ^= self.side_key
+        if kind == PLAY:
+            return h ^ self.man_keys[square]
+        h ^= self.ball_keys[ball] ^ self.ball_keys[square]
+        removed = men ^ new_men
+        man_keys = self.man_keys
+        while removed:
+            low = removed & -removed
+            h ^= man_keys[low.bit_length() - 1]
+            removed ^= low
+        return h
+
+    def main_line(self, ball, men, player, h, depth):
+        '''Returns the moves of a main line of a proven win: the
+        solver's winning moves, and for the opponent a reply that
+        delays the win as long as possible.'''
+        line = []
+        solver = player
+        while depth > 0:
+            proven, zone, move = self.prove(ball, men, solver, h, depth)
+            if not proven or move is None:
+                break
+            line.append(move)
+            h = self.apply_hash(h, ball, men, move)
+            if move[0] == MOVE:
+                ball = move[1]
+            men = move[2]
+            if self.winner_at(ball) is not None:
+                break
+            depth -= 1
+
+            replies = [(MOVE, landing, new_men, tuple(path))
+                       for landing, path, new_men in
+                       jumps_and_probe(self.geometry, ball, men)[0]]
+            replies.extend((PLAY, square, men | 1 << square, None)
+                           for square in self._placements(ball, men))
+            if not replies:
+                break
+            reply = replies[0]
+            for candidate in replies:
+                child_ball = candidate[1] if candidate[0] == MOVE else ball
+                if self.winner_at(child_ball) is not None:
+                    continue
+                child_h = self.apply_hash(h, ball, men, candidate)
+                if depth <= 1 or not self.prove(child_ball, candidate[2],
+                                                solver, child_h,
+                                                depth - 1)[0]:
+                    reply = candidate
+                    break
+            line.append(reply)
+            h = self.apply_hash(h, ball, men, reply)
+            if reply[0] == MOVE:
+                ball = reply[1]
+            men = reply[2]
+            if self.winner_at(ball) is not None:
+                break
+        return [self._move_coords(move) for move in line]
+
+    def _move_coords(self, move):
+        kind, square, new_men, path = move
+        coords = self.geometry.coords
+        if path is not None:
+            path = [coords[index] for index in path]
+        return kind, coords[square], path
+
+    def solve(self, ball_coords, man_coords, player, max_depth=3,
+              time_limit=10.0):
+        '''Searches for the shortest forced win for player, to move,
+        within max_depth moves. Returns a SolveResult.'''
+        start = time.time()
+        geometry = self.geometry
+        ball = geometry.index(ball_coords)
+        men = 0
+        for coords in man_coords:
+            index = geometry.index(coords)
+            if index is not None:
+                men |= 1 << index
+        h = self.position_hash(ball, men, player)
+
+        self.nodes = 0
+        self.deadline = None if time_limit is None else start + time_limit
+        searched = 0
+        try:
+            for depth in range(1, max_depth + 1):
+                proven, zone, move = self.prove(ball, men, player, h, depth)
+                if proven:
+                    self.deadline = None
+                    line = self.main_line(ball, men, player, h, depth)
+                    return SolveResult('win', depth, line, self.nodes,
+                                       time.time() - start)
+                searched = depth
+        except SearchTimeout:
+            return SolveResult('timeout', searched, [], self.nodes,
+                               time.time() - start)
+        return SolveResult('none', searched, [], self.nodes,
+                           time.time() - start)
+
+
+def solve_board(board, max_depth=3, time_limit=10.0,
+                transposition_table=None):
+    '''Solves the real position of an AbstractBoard for its current
+    player. Returns a SolveResult.'''
+    solver = Solver(board.shape, transposition_table)
+    return solver.solve(board.ball_coords, board.man_coords,
+                        board.current_player, max_depth, time_limit)
@@ -0,0 +1,238 @@
+'''An on-disk table of the winning jumps near the goals.
+
+Most games are decided when the ball is a couple of rows from a goal.
+For a ball on row 2 or 3 from the goal line, the tablebase holds, for
+every arrangement of men in a window around it, whether the player to
+move can jump the ball into the goal, with the direction of the first
+jump and the number of jumps of the shortest such move.
+
+The window is every square from the goal line up to the ball's row,
+within RADIUS columns either side of the ball (fewer at the edges of
+the board, which are separate regions of the table). Its men give a
+fixed-size key: bit i is set if window_squares(...)[i] holds a man.
+Only jumps that stay within the window are considered, so a win in the
+table is always a real win, but a position the table has no win for
+may still have one that leaves the window.
+
+Positions near the top goal are read mirrored, so the one table serves
+both players. The file is generated offline (build_tablebase.py) and
+read through a read-only mmap, so lookups copy nothing and every
+process that opens the same file shares its pages.
+
+Values are one byte: 0 if there is no win in the window, otherwise
+0x80 | direction << 4 | jumps, with direction an index into
+moves.directions (in the frame of the bottom goal) and jumps the number
+of jumps (at most 15).
+'''
+
+import mmap
+import struct
+
+from .bitboard import find_jumps, geometry_for
+from .moves import directions
+
+TABLEBASE_VERSION = 2
+TABLEBASE_NAME = 'endgame.phtb'
+MAGIC = b'PHTB'
+RADIUS = 2
+BALL_ROWS = (2, 3)
+
+# Regions are computed in pieces of at most this many keys, so that the
+# largest (2**19 keys) is shared between processes.
+CHUNK = 1 << 15
+
+WIN = 0x80
+
+_header = struct.Struct('<4sHHH')
+_region = struct.Struct('<BBBxI')
+
+
+def window_squares(row, left, right):
+    '''Returns the (dx, y) of each square of the window for a ball on
+    the given row with left and right columns on either side, in key
+    bit order.'''
+    return [(dx, y) for y in range(row + 1)
+            for dx in range(-left, right + 1)
+            if dx or y != row]
+
+
+def regions():
+    '''Returns the (row, left, right) of every region, in file order.'''
+    return [(row, left, right) for row in BALL_ROWS
+            for left in range(RADIUS + 1) for right in range(RADIUS + 1)]
+
+
+def encode(direction, jumps):
+    return WIN | direction << 4 | min(jumps, 15)
+
+
+def decode(value):
+    '''Returns (direction index, jumps) for a table value, or None if
+    it is not a win.'''
+    if not value & WIN:
+        return None
+    return value >> 4 & 7, value & 15
+
+
+def _sign(n):
+    return (n > 0) - (n < 0)
+
+
+def region_values(row, left, right, start=0, stop=None):
+    '''Returns a bytearray of the values of the keys from start up to
+    stop (by default, every key) of a region.'''
+    geometry = geometry_for((left + right + 1, row + 1))
+    ball = geometry.index((left, row))
+    squares = [geometry.index((left + dx, y))
+               for dx, y in window_squares(row, left, right)]
+    if stop is None:
+        stop = 1 << len(squares)
+    values = bytearray(stop - start)
+    for key in range(start, stop):
+        men = 0
+        for i, square in enumerate(squares):
+            if key >> i & 1:
+                men |= 1 << square
+        best = None
+        for landing, paths in find_jumps(geometry, ball, men).items():
+            if landing[1] > 1:
+                continue
+            path = paths[0]
+            first = path[1] if len(path) > 1 else landing
+            direction = directions.index((_sign(first[0] - left),
+                                          _sign(first[1] - row)))
+            if best is None or (len(path), direction) < best:
+                best = (len(path), direction)
+        if best is not None:
+            values[key - start] = encode(best[1], best[0])
+    return values
+
+
+def chunks(all_regions):
+    '''Returns the (row, left, right, start, stop) of every piece of at
+    most CHUNK keys of the given regions, in file order.'''
+    pieces = []
+    for row, left, right in all_regions:
+        size = 1 << len(window_squares(row, left, right))
+        pieces.extend((row, left, right, start, min(start + CHUNK, size))
+                      for start in range(0, size, CHUNK))
+    return pieces
+
+
+def _chunk_values(chunk):
+    return region_values(*chunk)
+
+
+def generate(filen, pool=None):
+    '''Computes the whole table and writes it to filen. pool optionally
+    is a multiprocessing pool to compute pieces of the regions in
+    parallel.'''
+    all_regions = regions()
+    pieces = chunks(all_regions)
+    mapper = map if pool is None else pool.map
+    tables = {region: bytearray() for region in all_regions}
+    for piece, values in zip(pieces, mapper(_chunk_values, pieces)):
+        tables[piece[:3]].extend(values)
+    tables = [tables[region] for region in all_regions]
+    offset = _header.size + _region.size * len(all_regions)
+    with open(filen, 'wb') as fileh:
+        fileh.write(_header.pack(MAGIC, TABLEBASE_VERSION, RADIUS,
+                                 len(all_regions)))
+        for (row, left, right), values in zip(all_regions, tables):
+            fileh.write(_region.pack(row, left, right, offset))
+            offset += len(values)
+        for values in tables:
+            fileh.write(values)
+    return sum(len(values) for values in tables)
+
+
+class Tablebase(object):
+    '''A tablebase file, mapped read-only.'''
+
+    def __init__(self, filen):
+        self.filen = filen
+        with open(filen, 'rb') as fileh:
+            self.data = mmap.mmap(fileh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, radius, number = _header.unpack_from(self.data, 0)
+        if magic != MAGIC or version != TABLEBASE_VERSION or \
+                radius != RADIUS:
+            self.data.close()
+            raise ValueError('{} is not a version {} tablebase'.format(
+                filen, TABLEBASE_VERSION))
+        self.offsets = {}
+        for i in range(number):
+            row, left, right, offset = _region.unpack_from(
+                self.data, _header.size + i * _region.size)
+            self.offsets[(row, left, right)] = offset
+        # (stride, row, left, right, player) -> (offset, bit deltas)
+        self._windows = {}
+
+    def close(self):
+        self.data.close()
+
+    def _window(self, geometry, row, left, right, player):
+        key = (geometry.stride, row, left, right, player)
+        window = self._windows.get(key)
+        if window is None:
+            # Rows count up from the bottom goal line, and down from
+            # the top one.
+            sign = 1 if player == 'bottom' else -1
+            stride = geometry.stride
+            window = self._windows[key] = (
+                self.offsets[(row, left, right)],
+                [dx + sign * (y - row) * stride
+                 for dx, y in window_squares(row, left, right)])
+        return window
+
+    def probe_bits(self, geometry, ball, men, player):
+        '''Returns the table value for player to move, with the ball at
+        index ball and men as a bitmask of geometry, or 0 if the
+        position is not covered.'''
+        width, height = geometry.shape
+        if height < 2 * (BALL_ROWS[-1] + 1):
+            return 0
+        x, y = geometry.coords[ball]
+        row = y if player == 'bottom' else height - 1 - y
+        if row not in BALL_ROWS:
+            return 0
+        offset, deltas = self._window(geometry, row, min(x, RADIUS),
+                                      min(width - 1 - x, RADIUS), player)
+        key = 0
+        bit = 1
+        for delta in deltas:
+            if men >> (ball + delta) & 1:
+                key |= bit
+            bit <<= 1
+        return self.data[offset + key]
+
+    def probe(self, ball_coords, man_coords, shape, player):
+        '''Returns ((dx, dy) of the first jump, number of jumps) of a
+        winning move for player to move, or None if the table has
+        none.'''
+        geometry = geometry_for(shape)
+        ball = geometry.index(ball_coords)
+        men = 0
+        for coords in man_coords:
+            index = geometry.index(coords)
+            if index is not None:
+                men |= 1 << index
+        result = decode(self.probe_bits(geometry, ball, men, player))
+        if result is None:
+            return None
+        direction, jumps = result
+        dx, dy = directions[direction]
+        if player == 'top':
+            dy = -dy
+        return (dx, dy), jumps
+
+
+_opened = {}
+
+
+def open_tablebase(filen):
+    '''Returns the Tablebase for filen, opening it only once per
+    process.'''
+    tablebase = _opened.get(filen)
+    if tablebase is None:
+        tablebase = _opened[filen] = Tablebase(filen)
+    return tablebase
@@ -0,0 +1,140 @@
+'''A size-bounded transposition table, keyed by Zobrist position hash.
+
+Entries can hold cached legal moves and/or search results for a
+position. The table is split into buckets of a few entries each; when
+a bucket is full, the replacement policy decides which entry a new
+position evicts:
+
+- 'always': the oldest entry in the bucket
+- 'depth': the entry searched to the smallest depth (oldest first
+  among equals), so expensive search results survive longest
+- 'lru': the least recently looked up entry
+'''
+
+REPLACEMENT_POLICIES = ('always', 'depth', 'lru')
+
+EXACT = 'exact'
+LOWER_BOUND = 'lower'
+UPPER_BOUND = 'upper'
+
+
+class TranspositionEntry(object):
+    __slots__ = ('key', 'depth', 'value', 'flag', 'best_move',
+                 'legal_moves', 'stored', 'used')
+
+    def __init__(self, key):
+        self.key = key
+        self.depth = -1
+        self.value = None
+        self.flag = None
+        self.best_move = None
+        self.legal_moves = None
+        self.stored = 0
+        self.used = 0
+
+
+class TranspositionTable(object):
+    '''Transposition table holding at most size entries.'''
+
+    def __init__(self, size=2**16, replacement='depth', ways=4):
+        if replacement not in REPLACEMENT_POLICIES:
+            raise ValueError('Unknown replacement policy {!r}'.format(
+                replacement))
+        self.replacement = replacement
+        self.ways = ways
+        self.number_of_buckets = max(1, size // ways)
+        self.clear()
+
+    @property
+    def size(self):
+        return self.number_of_buckets * self.ways
+
+    def clear(self):
+        '''Removes all entries and resets the statistics.'''
+        self.buckets = [[] for i in range(self.number_of_buckets)]
+        self.entries = 0
+        self.tick = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def stats(self):
+        '''Returns a dictionary of usage statistics.'''
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.,
+                'stores': self.stores,
+                'replacements': self.replacements,
+                'entries': self.entries,
+                'size': self.size}
+
+    def _find(self, key):
+        for entry in self.buckets[key % self.number_of_buckets]:
+            if entry.key == key:
+                return entry
+        return None
+
+    def lookup(self, key):
+        '''Returns the entry for key, or None if there is none.'''
+        self.tick += 1
+        entry = self._find(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry.used = self.tick
+        return entry
+
+    def get_legal_moves(self, key):
+        '''Returns the cached legal moves for key, or None.'''
+        entry = self.lookup(key)
+        if entry is None or entry.legal_moves is None:
+            return None
+        return entry.legal_moves
+
+    def _entry_for_store(self, key):
+        entry = self._find(key)
+        if entry is not None:
+            return entry
+        bucket = self.buckets[key % self.number_of_buckets]
+        entry = TranspositionEntry(key)
+        if len(bucket) < self.ways:
+            bucket.append(entry)
+            self.entries += 1
+            return entry
+
+        if self.replacement == 'depth':
+            victim = min(bucket, key=lambda e: (e.depth, e.stored))
+        elif self.replacement == 'lru':
+            victim = min(bucket, key=lambda e: e.used)
+        else:
+            victim = min(bucket, key=lambda e: e.stored)
+        bucket[bucket.index(victim)] = entry
+        self.replacements += 1
+        return entry
+
+    def store(self, key, depth=0, value=None, flag=EXACT, best_move=None,
+              legal_moves=None):
+        '''Stores a search result and/or legal moves for key. A search
+        result only overwrites an existing one searched at least as
+        deeply.'''
+        self.tick += 1
+        self.stores += 1
+        entry = self._entry_for_store(key)
+        entry.stored = entry.used = self.tick
+        if legal_moves is not None:
+            entry.legal_moves = legal_moves
+        if value is not None and depth >= entry.depth:
+            entry.depth = depth
+            entry.value = value
+            entry.flag = flag
+            entry.best_move = best_move
+        return entry
+
+    def store_legal_moves(self, key, legal_moves):
+        return self.store(key, legal_moves=legal_moves)
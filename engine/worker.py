@@ -0,0 +1,306 @@
+'''Finding ai moves on a background thread.
+
+AI.get_move can take as long as its time limit, which would freeze a
+gui that called it directly. AIWorker runs it on a daemon thread
+instead, against a copy of the position, so the board can be redrawn
+and changed while the ai thinks.
+
+Callbacks (on_done and on_progress) are made through the worker's post
+function, which by default calls them straight away on the worker
+thread; a gui passes a function that schedules them on its own thread,
+e.g. with kivy's Clock. A job's on_done is only called if the job was
+not cancelled (or replaced by a newer job) before the call is made, so
+a stale move is never applied.
+
+None of the worker's methods wait for a search to finish, so they can
+be called from a gui's event loop. Cancelling a job stops its search,
+and the thread of the next job waits for it to return before starting
+its own search; the stale result is then dropped because its job is
+cancelled. wait() is there for scripts that do want to block.
+
+With ponder(), the worker also uses the opponent's turn: it searches
+the ai's replies to the opponent's likely moves, most likely first
+(the move the last search expected, then the search's own move
+ordering), until the next start() or cancel(). Each reply is kept by
+position hash, and start() plays it at once if the opponent made one of
+those moves; otherwise the search still begins with the transposition
+table the pondering filled. Pondering needs the 'search' ai mode.
+
+Example:
+
+    worker = AIWorker(AI(None, mode='search', time_limit=2.),
+                      deadline=3.)
+    worker.start(board, on_done=lambda job: board.speculate_ai_move(
+        job.move_type, job.coords, job.path))
+'''
+
+import logging
+import threading
+import time
+
+from .ai import AI
+from .search import other_player, winner_at
+
+logger = logging.getLogger(__name__)
+
+
+class AIJob(object):
+    '''One request for an ai move. Once finished, move_type, coords and
+    path hold the move, or error holds the exception the ai raised;
+    progress holds the latest (depth, value, nodes, elapsed) reported
+    by the search, if any.'''
+
+    def __init__(self, board, on_done, on_progress=None):
+        self.board = board
+        self.on_done = on_done
+        self.on_progress = on_progress
+        self.cancelled = False
+        self.finished = False
+        self.move_type = None
+        self.coords = None
+        self.path = None
+        self.progress = None
+        self.error = None
+        self.start_time = time.time()
+        self.elapsed = None
+        self.pondered = False
+        self.expired = False
+
+
+class AIWorker(object):
+    '''Runs one ai search at a time on a background thread.
+
+    deadline optionally limits the wall-clock time of a job, in
+    seconds: when it passes the search is stopped and returns the best
+    move found so far. post(function, *args) is used to make every
+    callback.
+    '''
+
+    def __init__(self, ai=None, deadline=None, post=None, ponder_moves=8):
+        if ai is None:
+            ai = AI(None)
+        self.ai = ai
+        self.deadline = deadline
+        if post is None:
+            post = _call
+        self.post = post
+        self.ponder_moves = ponder_moves
+        self.job = None
+        self.thread = None
+        self.timer = None
+        # The AIJob of the pondering in progress, if any.
+        self.ponder_job = None
+        # Held while cancelling, and while a new thread checks that its
+        # job is still wanted and resumes the ai, so that a cancel can
+        # not be undone by the resume.
+        self.lock = threading.Lock()
+        # Position hash -> (move type, coords, path) found by pondering.
+        self.replies = {}
+
+    @property
+    def busy(self):
+        return self.job is not None
+
+    def start(self, board, on_done, on_progress=None):
+        '''Starts finding a move for the current player of board,
+        cancelling any job in progress. Returns the new AIJob.'''
+        self.cancel()
+        job = self.job = AIJob(board.copy_position(), on_done, on_progress)
+
+        reply = self.replies.get(self.position_key(job.board))
+        self.replies = {}
+        if reply is not None:
+            logger.debug('Playing the pondered reply %s', reply)
+            job.move_type, job.coords, job.path = reply
+            job.pondered = True
+            job.elapsed = time.time() - job.start_time
+            job.finished = True
+            self.post(self._finish, job)
+            return job
+
+        self._start_thread(self._run, job, 'ai-worker')
+        if self.deadline is not None:
+            self.timer = threading.Timer(self.deadline, self._expire, (job,))
+            self.timer.daemon = True
+            self.timer.start()
+        return job
+
+    def ponder(self, board):
+        '''Starts searching, in the background, the ai's replies to the
+        likely moves of the current player of board.'''
+        self.cancel()
+        if self.ai.mode != 'search':
+            return
+        self.replies = {}
+        job = self.ponder_job = AIJob(board.copy_position(), None)
+        self._start_thread(self._ponder, job, 'ai-ponder')
+
+    @property
+    def pondering(self):
+        return self.ponder_job is not None
+
+    def _start_thread(self, target, job, name):
+        '''Runs target(job) on a new thread, once the previous thread,
+        whose search has been stopped, has returned.'''
+        thread = threading.Thread(target=self._after,
+                                  args=(self.thread, target, job),
+                                  name=name)
+        thread.daemon = True
+        self.thread = thread
+        thread.start()
+
+    def _after(self, previous, target, job):
+        if previous is not None:
+            previous.join()
+        with self.lock:
+            if job.cancelled:
+                return
+            # A job whose deadline passed while it waited searches
+            # stopped, i.e. returns its first move at once.
+            if not job.expired:
+                self.ai.resume()
+        target(job)
+
+    def position_key(self, board):
+        engine = self.ai.engine
+        if engine is None or engine.geometry.shape != tuple(board.shape):
+            return None
+        ball, men = engine.to_bits(board.ball_coords, board.man_coords)
+        return engine.position_hash(ball, men, board.current_player)
+
+    def cancel(self):
+        '''Cancels the job or pondering in progress, if any; a cancelled
+        job's on_done will not be called. Does not wait for the search
+        to return.'''
+        with self.lock:
+            ponder_job = self.ponder_job
+            if ponder_job is not None:
+                ponder_job.cancelled = True
+                self.ponder_job = None
+                self.ai.stop()
+            job = self.job
+            if job is None:
+                return
+            job.cancelled = True
+            self.job = None
+            self._stop_timer()
+            self.ai.stop()
+        logger.debug('AI job cancelled after %.2f s',
+                     time.time() - job.start_time)
+
+    def wait(self, timeout=None):
+        '''Waits for the worker thread to finish. This blocks, so a gui
+        should not call it.'''
+        if self.thread is not None:
+            self.thread.join(timeout)
+            if not self.thread.is_alive():
+                self.thread = None
+
+    def close(self):
+        '''Cancels any job and closes the ai (stopping an mcts worker
+        pool) once its search has returned, without waiting for it.'''
+        self.cancel()
+        thread, self.thread = self.thread, None
+        if thread is None or not thread.is_alive():
+            self.ai.close()
+            return
+        closer = threading.Thread(target=self._close_after, args=(thread,),
+                                  name='ai-close')
+        closer.daemon = True
+        closer.start()
+
+    def _close_after(self, thread):
+        thread.join()
+        self.ai.close()
+
+    def _stop_timer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def _expire(self, job):
+        with self.lock:
+            if job is self.job:
+                logger.debug('AI deadline passed, stopping the search')
+                job.expired = True
+                self.ai.stop()
+
+    def _run(self, job):
+        ai = self.ai
+        ai.abstractboard = job.board
+        if job.on_progress is not None:
+            ai.progress = lambda *progress: self._progress(job, progress)
+        else:
+            ai.progress = None
+        try:
+            job.move_type, job.coords = ai.get_move()
+            job.path = ai.path
+        except Exception as error:
+            logger.exception('AI search failed')
+            job.error = error
+        finally:
+            ai.progress = None
+        job.elapsed = time.time() - job.start_time
+        job.finished = True
+        self.post(self._finish, job)
+
+    def _ponder(self, job):
+        ai = self.ai
+        board = job.board
+        ai.abstractboard = board
+        engine = ai.search_engine()
+        geometry = engine.geometry
+        opponent = board.current_player
+        player = other_player(opponent)
+        ball, men = engine.to_bits(board.ball_coords, board.man_coords)
+        h = engine.position_hash(ball, men, opponent)
+
+        moves = engine.generate_moves(ball, men, opponent)
+        entry = engine.transposition_table.lookup(h)
+        if entry is not None and entry.best_move is not None:
+            moves.sort(key=lambda move: move[:3] != entry.best_move)
+
+        start = time.time()
+        pondered = 0
+        for move in moves[:self.ponder_moves]:
+            child_ball, child_men, child_h = engine.apply(ball, men, h, move)
+            if winner_at(geometry, child_ball) is not None:
+                continue
+            if job.cancelled:
+                break
+            result = engine.search(
+                geometry.coords[child_ball],
+                [geometry.coords[index] for index in range(geometry.size)
+                 if child_men >> index & 1],
+                player, time_limit=ai.time_limit, max_depth=ai.max_depth)
+            # A stopped search may not have reached its usual depth.
+            if engine.stopped or job.cancelled or result is None:
+                break
+            self.replies[child_h] = (result.move_type, result.coords,
+                                     result.path)
+            pondered += 1
+        with self.lock:
+            if job is self.ponder_job:
+                self.ponder_job = None
+        logger.debug('Pondered %d replies in %.2f s', pondered,
+                     time.time() - start)
+
+    def _progress(self, job, progress):
+        job.progress = progress
+        if not job.cancelled:
+            self.post(self._report, job)
+
+    def _report(self, job):
+        if job is self.job:
+            job.on_progress(job)
+
+    def _finish(self, job):
+        if job is not self.job:
+            return
+        self.job = None
+        self._stop_timer()
+        job.on_done(job)
+
+
+def _call(function, *args):
+    function(*args)
@@ -0,0 +1,83 @@
+'''Zobrist hashing of phutball positions.
+
+A position hash is the XOR of a random 64 bit key for every man, a key
+for the ball square and, when it is the bottom player's turn, a side
+to move key. Adding or removing a man, or moving the ball, changes the
+hash by a single XOR, so boards can keep it up to date incrementally.
+
+Keys are generated from a fixed seed for each board shape, so hashes
+are stable between processes and runs (and can be used as keys in
+files on disk). Each key is derived from the seed and its square only
+when it is first needed, so the memory used grows with the number of
+squares actually used rather than the size of the board.
+'''
+
+import random
+
+_keys = {}
+
+_MASK = (1 << 64) - 1
+
+
+def _mix(value):
+    '''The splitmix64 finaliser, which scrambles a 64 bit integer.'''
+    value = (value ^ (value >> 30)) * 0xbf58476d1ce4e5b9 & _MASK
+    value = (value ^ (value >> 27)) * 0x94d049bb133111eb & _MASK
+    return value ^ (value >> 31)
+
+
+class ZobristKeys(object):
+    '''The random keys for a board of the given shape.'''
+
+    def __init__(self, shape):
+        self.shape = shape = (int(shape[0]), int(shape[1]))
+        rng = random.Random('phutball-zobrist-{}x{}'.format(*shape))
+        self.seed = rng.getrandbits(64)
+        self.side = rng.getrandbits(64)
+        self.men = {}
+        self.ball = {}
+
+    def _new_key(self, coords, kind):
+        x, y = coords
+        if not (0 <= x < self.shape[0] and 0 <= y < self.shape[1]):
+            return 0
+        square = y * self.shape[0] + x
+        return _mix(self.seed + (2 * square + kind + 1) *
+                    0x9e3779b97f4a7c15 & _MASK)
+
+    def man_key(self, coords):
+        coords = (coords[0], coords[1])
+        key = self.men.get(coords)
+        if key is None:
+            key = self.men[coords] = self._new_key(coords, 0)
+        return key
+
+    def ball_key(self, coords):
+        coords = (coords[0], coords[1])
+        key = self.ball.get(coords)
+        if key is None:
+            key = self.ball[coords] = self._new_key(coords, 1)
+        return key
+
+    def side_key(self, current_player):
+        return self.side if current_player == 'bottom' else 0
+
+    def hash_men(self, man_coords):
+        man_key = self.man_key
+        result = 0
+        for coords in man_coords:
+            result ^= man_key(coords)
+        return result
+
+    def hash_position(self, ball_coords, man_coords, current_player):
+        return (self.hash_men(man_coords) ^ self.ball_key(ball_coords) ^
+                self.side_key(current_player))
+
+
+def keys_for(shape):
+    '''Returns the (cached) ZobristKeys for the given shape.'''
+    shape = (int(shape[0]), int(shape[1]))
+    keys = _keys.get(shape)
+    if keys is None:
+        keys = _keys[shape] = ZobristKeys(shape)
+    return keys
@@ -18,15 +18,24 @@ from kivy.properties import (NumericProperty, ListProperty,
                              BooleanProperty, ObjectProperty,
                              DictProperty, OptionProperty)
 from kivy.clock import Clock
+from kivy.logger import Logger
+from kivy.graphics import InstructionGroup, Color, Mesh
+from kivy.core.image import Image as CoreImage
 
-from abstractboard import AbstractBoard
+from abstractboard import AbstractBoard, AI, AIWorker
 
 import random
+from math import cos, sin, pi
 from os.path import exists
 
 def sign(n):
     return 1 if n >= 0 else -1
 
+def post_to_clock(function, *args):
+    '''Calls function(*args) on the next frame of the gui thread. Safe
+    to call from any thread.'''
+    Clock.schedule_once(lambda dt: function(*args), 0)
+
 def coords_in_grid(coords, shape):
     x, y = coords
     if (x < 0 or y < 0 or x >= (shape[0]-1) or y >= (shape[1]-1)):
@@ -181,6 +190,149 @@ class LegalMoveMarker(Widget):
     coords = ListProperty([0, 0])
 
 
+class WidgetPool(object):
+    '''Keeps widgets of one class that are no longer shown, so that they
+    can be shown again instead of constructing new ones.'''
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.free = []
+
+    def get(self, **properties):
+        '''Returns a free widget, or a new one, with the given property
+        values.'''
+        if not self.free:
+            return self.cls(**properties)
+        widget = self.free.pop()
+        for name, value in properties.items():
+            setattr(widget, name, value)
+        return widget
+
+    def release(self, widget):
+        self.free.append(widget)
+
+
+class BatchedLayer(object):
+    '''Draws a stone or marker at each of a set of coords with a single
+    Mesh, instead of one widget each.
+
+    Every item has a fixed block of vertices. Removing an item moves
+    the last block into its place, so the vertex list itself changes in
+    constant time. The Mesh is given the whole list again after every
+    change, though, so add() and remove() each cost time in proportion
+    to the number of items; sync() makes any number of changes with a
+    single update. A resize rebuilds the vertices in one pass without
+    touching any widgets.
+    '''
+
+    def __init__(self, colour=(1, 1, 1, 1), source=None, segments=0):
+        if segments:
+            # A disc: the centre, then points around the rim.
+            self.template = [(0.5, 0.5)] + [
+                (0.5 + 0.5*cos(2*pi*i/segments),
+                 0.5 + 0.5*sin(2*pi*i/segments))
+                for i in range(segments)]
+            self.triangles = []
+            for i in range(segments):
+                self.triangles.extend((0, 1 + i, 1 + (i + 1) % segments))
+        else:
+            self.template = [(0, 0), (1, 0), (1, 1), (0, 1)]
+            self.triangles = [0, 1, 2, 2, 3, 0]
+        self.block = 4 * len(self.template)
+
+        texture = None
+        if source is not None:
+            texture = CoreImage(source, mipmap=True).texture
+        self.group = InstructionGroup()
+        self.group.add(Color(*colour))
+        self.mesh = Mesh(mode='triangles', texture=texture)
+        self.group.add(self.mesh)
+
+        self.coords = []  # The coords of each block, in order
+        self.slots = {}
+        self.vertices = []
+        self.indices = []
+        self.origin = (0, 0)
+        self.cell_size = (1, 1)
+
+    def __contains__(self, coords):
+        return tuple(coords) in self.slots
+
+    def __len__(self):
+        return len(self.coords)
+
+    def item_vertices(self, coords):
+        x = self.origin[0] + coords[0] * self.cell_size[0]
+        y = self.origin[1] + coords[1] * self.cell_size[1]
+        width, height = self.cell_size
+        vertices = []
+        for u, v in self.template:
+            vertices.extend((x + u * width, y + v * height, u, v))
+        return vertices
+
+    def _add(self, coords):
+        self.slots[coords] = len(self.coords)
+        self.coords.append(coords)
+        self.vertices.extend(self.item_vertices(coords))
+
+    def _remove(self, coords):
+        slot = self.slots.pop(coords)
+        last = self.coords.pop()
+        block = self.block
+        if last != coords:
+            self.coords[slot] = last
+            self.slots[last] = slot
+            self.vertices[slot*block:(slot + 1)*block] = self.vertices[-block:]
+        del self.vertices[-block:]
+
+    def update_mesh(self):
+        number = len(self.coords)
+        size = len(self.template)
+        length = number * len(self.triangles)
+        for item in range(len(self.indices) // len(self.triangles), number):
+            self.indices.extend(item * size + i for i in self.triangles)
+        self.mesh.vertices = self.vertices
+        self.mesh.indices = self.indices[:length]
+
+    def add(self, coords):
+        coords = tuple(coords)
+        if coords in self.slots:
+            return
+        self._add(coords)
+        self.update_mesh()
+
+    def remove(self, coords):
+        coords = tuple(coords)
+        if coords not in self.slots:
+            return
+        self._remove(coords)
+        self.update_mesh()
+
+    def sync(self, coords_list):
+        '''Shows items at exactly the given coords, adding and removing
+        only those that differ. Returns True if anything changed.'''
+        wanted = set(map(tuple, coords_list))
+        removed = [coords for coords in self.slots if coords not in wanted]
+        added = [coords for coords in wanted if coords not in self.slots]
+        if not (removed or added):
+            return False
+        for coords in removed:
+            self._remove(coords)
+        for coords in added:
+            self._add(coords)
+        self.update_mesh()
+        return True
+
+    def layout(self, origin, cell_size):
+        '''Moves every item to a new board position and cell size.'''
+        self.origin = tuple(origin)
+        self.cell_size = tuple(cell_size)
+        self.vertices = []
+        for coords in self.coords:
+            self.vertices.extend(self.item_vertices(coords))
+        self.update_mesh()
+
+
 class BoardInterface(BoxLayout):
     '''The widget for a whole board interface, intended to take up the
     whole screen.'''
@@ -248,8 +400,34 @@ class Board(Widget):
 
     show_legal_moves = BooleanProperty(True)
 
+    batched_rendering = BooleanProperty(False)
+    '''If True, all men are drawn by one BatchedLayer and all legal move
+    markers by another, kept in step with the AbstractBoard, instead of
+    by one widget each. This is much cheaper on crowded boards and on
+    resizing.'''
+
+    man_layer = ObjectProperty(None, allownone=True)
+    legal_move_layer = ObjectProperty(None, allownone=True)
+
+    ai_worker = ObjectProperty(None, allownone=True)
+    ai_thinking = BooleanProperty(False)
+    ai_status = StringProperty('')
+    ai_deadline = NumericProperty(5.)
+    '''The longest time, in seconds, the ai may think before it must
+    play the best move found so far.'''
+
+    ai_mode = OptionProperty('heuristic', options=['heuristic', 'search',
+                                                   'mcts'])
+    ai_ponder = BooleanProperty(False)
+    '''If True (and ai_mode is 'search'), the ai searches its replies
+    to the player's likely moves while the player thinks.'''
+
     def __init__(self, *args, **kwargs):
         self.register_event_type('on_win')
+        self.man_pool = WidgetPool(Man)
+        self.legal_move_marker_pool = WidgetPool(LegalMoveMarker)
+        self.speculative_segment_marker_pool = WidgetPool(
+            SpeculativeSegmentMarker)
         if 'use_ai' in kwargs:
             use_ai = kwargs.pop('use_ai')
         else:
@@ -261,18 +439,49 @@ class Board(Widget):
 #        Clock.schedule_once(self.initialise_ball, 0)
         #self.initialise_ball()
 
+    def on_batched_rendering(self, *args):
+        if self.abstractboard is not None:
+            self.clear_all_transient_widgets()
+        if self.batched_rendering and self.man_layer is None:
+            self.man_layer = BatchedLayer(
+                source='stones/black_simple_100.png')
+            self.legal_move_layer = BatchedLayer(colour=(0, 0, 1, 0.1),
+                                                 segments=24)
+            # Drawn above the board and below the ball and touch marker.
+            index = len(self.canvas.children)
+            if self.move_marker is not None:
+                index = self.canvas.indexof(self.move_marker.canvas)
+            self.canvas.insert(index, self.legal_move_layer.group)
+            self.canvas.insert(index, self.man_layer.group)
+            self.layout_layers()
+        if self.abstractboard is not None:
+            self.resync_with_abstractboard()
+
+    def layout_layers(self):
+        if self.man_layer is None:
+            return
+        origin = self.coords_to_pos((0, 0))
+        self.man_layer.layout(origin, self.cell_size)
+        self.legal_move_layer.layout(origin, self.cell_size)
+
+    def sync_men(self):
+        '''Brings the men shown in line with the AbstractBoard, adding
+        and removing only those that differ.'''
+        man_coords = self.abstractboard.man_coords
+        if self.man_layer.sync(man_coords):
+            self.men = {tuple(coords): None for coords in man_coords}
+
     def on_win(self, winner):
         # import ipdb
         # ipdb.set_trace()
         mode = self.game_mode
-        print('mode is', mode)
+        Logger.debug('Phutball: win in mode {}'.format(mode))
         if mode[:8] == 'tutorial':
             number = int(mode[8:]) + 1
             if winner == 'bottom':
                 number -= 1
             next_file = 'puzzles/dir01_tutorials/tutorial{}.phut'.format(number)
             next_mode = 'tutorial{}'.format(number)
-            print('next file is', next_file, exists(next_file))
             if exists(next_file):
                 if winner == 'bottom':
                     winner_text = 'You lose'
@@ -306,8 +515,8 @@ class Board(Widget):
         mode = self.touch_mode
         if mode == 'play_man':
             self.abstractboard.reset_speculation()
-            self.clear_transient_ui_elements()
-            self.display_legal_moves()
+            self.clear_speculative_segment_markers()
+            self.refresh_legal_moves()
             self.move_marker.mode = 'play_man'
         else:
             self.move_marker.mode = 'move_ball'
@@ -334,11 +543,21 @@ class Board(Widget):
         if instructions is None:
             return  # Nothing changes
 
-        if 'add' in instructions:
+        # The ball moves first, so that a man can be added on the
+        # square it left.
+        if 'move_ball_to' in instructions:
+            ball_coords = instructions['move_ball_to']
+            ball = self.ball
+            ball.coords = ball_coords
+            ball.pos = self.coords_to_pos(ball_coords)
+        if self.batched_rendering:
+            if 'add' in instructions or 'remove' in instructions:
+                self.sync_men()
+        elif 'add' in instructions:
             add_coords = instructions['add']
             for coords in add_coords:
                 self.add_man(coords)
-        if 'remove' in instructions:
+        if 'remove' in instructions and not self.batched_rendering:
             remove_coords = instructions['remove']
             for coords in remove_coords:
                 self.remove_man(coords)
@@ -349,13 +568,8 @@ class Board(Widget):
             conflicting_markers = instructions['conflicting_paths']
             self.draw_conflicting_markers(conflicting_markers)
         if 'clear_transient' in instructions:
-            self.clear_transient_ui_elements()
-            self.display_legal_moves()
-        if 'move_ball_to' in instructions:
-            ball_coords = instructions['move_ball_to']
-            ball = self.ball
-            ball.coords = ball_coords
-            ball.pos = self.coords_to_pos(ball_coords)
+            self.clear_speculative_segment_markers()
+            self.refresh_legal_moves()
 
     def draw_conflicting_markers(self, components):
         end_coords, paths = components
@@ -402,10 +616,9 @@ class Board(Widget):
                      Vector(self.cell_size)/2.)
         end_pos = (Vector(self.coords_to_pos(end_coords)) +
                    Vector(self.cell_size)/2.)
-        marker = SpeculativeSegmentMarker(start_coords=start_coords,
-                                          end_coords=end_coords,
-                                          start_pos=start_pos,
-                                          end_pos=end_pos)
+        marker = self.speculative_segment_marker_pool.get(
+            start_coords=start_coords, end_coords=end_coords,
+            start_pos=start_pos, end_pos=end_pos)
         self.add_widget(marker)
         self.speculative_segment_markers[identifier] = marker
 
@@ -414,6 +627,7 @@ class Board(Widget):
             return
         marker = self.speculative_segment_markers.pop(identifier)
         self.remove_widget(marker)
+        self.speculative_segment_marker_pool.release(marker)
 
     def clear_speculative_segment_markers(self):
         for identifier in list(self.speculative_segment_markers.keys()):
@@ -425,10 +639,14 @@ class Board(Widget):
         if coords in self.men or (coords[0] == self.ball.coords[0] and
                                   coords[1] == self.ball.coords[1]):
             return
-        man = Man(coords=coords)
+        if self.batched_rendering:
+            self.men[coords] = None
+            self.man_layer.add(coords)
+            return
+        man = self.man_pool.get(coords=coords,
+                                pos=self.coords_to_pos(coords),
+                                size=self.cell_size)
         self.men[coords] = man
-        man.pos = self.coords_to_pos(coords)
-        man.size = self.cell_size
         self.add_widget(man)
 
     def remove_man(self, coords):
@@ -437,12 +655,21 @@ class Board(Widget):
         if coords not in self.men:
             return
         man = self.men.pop(coords)
-        self.remove_widget(man)
+        if man is None:
+            self.man_layer.remove(coords)
+        else:
+            self.remove_widget(man)
+            self.man_pool.release(man)
 
     def clear_men(self):
         '''Removes all men from the gui board.'''
         for coords in list(self.men.keys()):
-            self.remove_man(coords)
+            man = self.men.pop(coords)
+            if man is not None:
+                self.remove_widget(man)
+                self.man_pool.release(man)
+        if self.man_layer is not None:
+            self.man_layer.sync(())
 
     def toggle_man(self, coords):
         '''Toggles a man at the given coords.'''
@@ -459,9 +686,13 @@ class Board(Widget):
         coords = tuple(coords)
         if coords in self.legal_move_markers:
             return
-        marker = LegalMoveMarker(pos=self.coords_to_pos(coords),
-                                 size=self.cell_size,
-                                 coords=coords)
+        if self.batched_rendering:
+            self.legal_move_markers[coords] = None
+            self.legal_move_layer.add(coords)
+            return
+        marker = self.legal_move_marker_pool.get(
+            pos=self.coords_to_pos(coords), size=self.cell_size,
+            coords=coords)
         self.legal_move_markers[coords] = marker
         self.add_widget(marker)
 
@@ -471,12 +702,20 @@ class Board(Widget):
         if coords not in self.legal_move_markers:
             return
         marker = self.legal_move_markers.pop(coords)
-        self.remove_widget(marker)
+        if marker is None:
+            self.legal_move_layer.remove(coords)
+        else:
+            self.remove_widget(marker)
+            self.legal_move_marker_pool.release(marker)
 
     def clear_legal_move_markers(self):
         for marker_coords in list(self.legal_move_markers.keys()):
             marker = self.legal_move_markers.pop(marker_coords)
-            self.remove_widget(marker)
+            if marker is not None:
+                self.remove_widget(marker)
+                self.legal_move_marker_pool.release(marker)
+        if self.legal_move_layer is not None:
+            self.legal_move_layer.sync(())
 
     def clear_transient_ui_elements(self, *args):
         '''Removes any transient ui elements, e.g. LegalMoveMarkers.'''
@@ -492,12 +731,15 @@ class Board(Widget):
         if self.ball is not None:
             self.ball.pos = self.coords_to_pos(self.abstractboard.ball_coords)
             self.ball.size = self.cell_size
-        for man_coords, man in self.men.items():
-            man.pos = self.coords_to_pos(man.coords)
-            man.size = self.cell_size
-        for marker_coords, marker in self.legal_move_markers.items():
-            marker.pos = self.coords_to_pos(marker.coords)
-            marker.size = self.cell_size
+        if self.batched_rendering:
+            self.layout_layers()
+        else:
+            for man_coords, man in self.men.items():
+                man.pos = self.coords_to_pos(man.coords)
+                man.size = self.cell_size
+            for marker_coords, marker in self.legal_move_markers.items():
+                marker.pos = self.coords_to_pos(marker.coords)
+                marker.size = self.cell_size
         self.goal_rectangle_size = (Vector([self.grid[0], 2]) *
                                     Vector(self.cell_size))
         self.top_rectangle_pos = self.coords_to_pos((0, self.grid[1]-2))
@@ -512,7 +754,7 @@ class Board(Widget):
             end_pos = (Vector(self.coords_to_pos(end_coords)) +
                        Vector(self.cell_size)/2.)
             marker.start_pos = start_pos
-            marker_end_pos = end_pos
+            marker.end_pos = end_pos
 
         self.move_marker.size = cell_size
         self.move_marker.on_coords()
@@ -521,11 +763,14 @@ class Board(Widget):
         cell_size = self.cell_size
         if self.ball:
             self.ball.size = self.cell_size
-        for man_coords in self.men:
-            man = self.men[man_coords]
-            man.size = self.cell_size
-        for marker_coords, marker in self.legal_move_markers.items():
-            marker.size = self.cell_size
+        if self.batched_rendering:
+            self.layout_layers()
+        else:
+            for man_coords in self.men:
+                man = self.men[man_coords]
+                man.size = self.cell_size
+            for marker_coords, marker in self.legal_move_markers.items():
+                marker.size = self.cell_size
         for marker_coords, marker in self.speculative_segment_markers.items():
             start_coords = marker.start_coords
             end_coords = marker.end_coords
@@ -534,7 +779,7 @@ class Board(Widget):
             end_pos = (Vector(self.coords_to_pos(end_coords)) +
                        Vector(self.cell_size)/2.)
             marker.start_pos = start_pos
-            marker_end_pos = end_pos
+            marker.end_pos = end_pos
 
     def initialise_ball(self, *args):
         if self.ball is None:
@@ -596,8 +841,7 @@ class Board(Widget):
             instructions = self.abstractboard.speculative_move_ball_to(coords)
             self.follow_instructions(instructions)
 
-        self.clear_legal_move_markers()
-        self.display_legal_moves()
+        self.refresh_legal_moves()
 
     def on_current_player(self, *args):
         self.abstractboard.current_player = self.current_player
@@ -607,11 +851,56 @@ class Board(Widget):
                                'bottom': 'top'}[self.current_player]
         if self.use_ai and self.current_player == 'bottom':
             self.do_ai_move()
+        elif self.use_ai and self.ai_ponder:
+            self.get_ai_worker().ponder(self.abstractboard)
+
+    def get_ai_worker(self):
+        worker = self.ai_worker
+        if worker is None or worker.ai.mode != self.ai_mode:
+            if worker is not None:
+                worker.close()
+            worker = self.ai_worker = AIWorker(AI(None, mode=self.ai_mode),
+                                               deadline=self.ai_deadline,
+                                               post=post_to_clock)
+        return worker
 
     def do_ai_move(self, *args):
-        self.abstractboard.do_ai_move()
+        '''Starts the ai thinking on a background thread; its move is
+        played by on_ai_move when found.'''
+        self.get_ai_worker()
+        self.ai_worker.deadline = self.ai_deadline
+        self.ai_thinking = True
+        self.touch_mode = 'dormant'
+        self.ai_worker.start(self.abstractboard, self.on_ai_move,
+                             self.on_ai_progress)
+
+    def on_ai_progress(self, job):
+        depth, value, nodes, elapsed = job.progress
+        self.ai_status = 'Thinking (depth {})'.format(depth)
+        Logger.debug('Phutball: ai depth {}, {} nodes in {:.2f} s'.format(
+            depth, nodes, elapsed))
+
+    def on_ai_move(self, job):
+        self.ai_thinking = False
+        self.ai_status = ''
+        if job.move_type is None:
+            Logger.warning('Phutball: ai found no move: {}'.format(
+                job.error))
+            self.touch_mode = 'play_man'
+            return
+        Logger.debug('Phutball: ai move in {:.2f} s{}'.format(
+            job.elapsed, ' (pondered)' if job.pondered else ''))
+        self.follow_instructions(self.abstractboard.speculate_ai_move(
+            job.move_type, job.coords, job.path))
         self.confirm_speculation()
 
+    def cancel_ai_move(self, *args):
+        '''Stops the ai thinking, if it is; its move is not played.'''
+        if self.ai_worker is not None:
+            self.ai_worker.cancel()
+        self.ai_thinking = False
+        self.ai_status = ''
+
     def confirm_speculation(self):
         instructions = self.abstractboard.confirm_speculation()
         if instructions is None:
@@ -624,9 +913,28 @@ class Board(Widget):
     def display_legal_moves(self, force=False):
         if self.show_legal_moves or force:
             legal_moves = self.abstractboard.speculative_legal_moves
+            if self.batched_rendering:
+                if self.legal_move_layer.sync(legal_moves):
+                    self.legal_move_markers = {coords: None
+                                               for coords in legal_moves}
+                return
             for coords in legal_moves:
                 self.add_legal_move_marker(coords)
 
+    def refresh_legal_moves(self):
+        '''Shows the legal moves of the current speculation in place of
+        those shown before, adding and removing only the markers that
+        differ.'''
+        if not self.show_legal_moves:
+            self.clear_legal_move_markers()
+            return
+        legal_moves = self.abstractboard.speculative_legal_moves
+        if not self.batched_rendering:
+            for coords in list(self.legal_move_markers.keys()):
+                if coords not in legal_moves:
+                    self.remove_legal_move_marker(coords)
+        self.display_legal_moves()
+
     def pos_to_coords(self, pos):
         '''Takes a pos in screen coordinates, and converts to a grid
         position.'''
@@ -700,6 +1008,7 @@ class Board(Widget):
 
     def load_position(self, filen):
         '''Tries to load position from the given filename.'''
+        self.cancel_ai_move()
         self.abstractboard.load_file(filen)
         self.resync_with_abstractboard()
         
@@ -714,18 +1023,20 @@ class Board(Widget):
         ab = self.abstractboard
         self.clear_all_transient_widgets()
         self.shape = ab.shape
-        for coords in ab.man_coords:
-            self.add_man(coords)
+        if self.batched_rendering:
+            self.sync_men()
+        else:
+            for coords in ab.man_coords:
+                self.add_man(coords)
         self.display_legal_moves()
         Clock.schedule_once(self.sync_ball, 0)
-        print('ab ball_coords are', ab.ball_coords)
         self.message = ab.message
 
     def sync_ball(self, *args):
-        print('syncing ab ball_coords are', self.abstractboard.ball_coords)
         self.ball.pos = self.coords_to_pos(self.abstractboard.ball_coords)
 
     def reset(self, *args, **kwargs):
+        self.cancel_ai_move()
         self.abstractboard.reset()
         self.clear_all_transient_widgets()
         #self.clear_legal_move_markers()
@@ -9,10 +9,12 @@ from kivy.uix.button import Button
 from kivy.uix.screenmanager import ScreenManager, Screen, SlideTransition
 from kivy.properties import ListProperty, ObjectProperty, StringProperty
 
-from os.path import exists
+from os.path import exists, join
 from glob import glob
 import random
 
+from abstractboard import MANIFEST_NAME, load_manifest
+
 class NavBar(ActionBar):
     pass
 
@@ -115,7 +117,10 @@ class PhutballManager(ScreenManager):
         
 class GameScreen(Screen):
     '''Screen containing a BoardInterface'''
-    
+
+    def on_pre_leave(self, *args):
+        self.children[0].board.cancel_ai_move()
+
 
 class HomeScreen(Screen):
     pass
@@ -128,14 +133,28 @@ class RulesScreen(Screen):
 class ProblemChooserScreen(Screen):
     chooser_container = ObjectProperty()
     def populate(self):
-        filens = glob('puzzles/dir*')
-        numbers = [int(name.split('_')[0]) for name in filens]
-        argsort = [i for i, x in sorted(enumerate(numbers),
-                                        key=lambda j: j[1])]
+        '''Adds a row for each puzzle set in the manifest (see
+        engine.manifest and build_manifest.py). No puzzle files are
+        read until one is chosen.'''
+        self.chooser_container.clear_widgets()
+        manifest = load_manifest(join('puzzles', MANIFEST_NAME))
+        if manifest is None:
+            return
+        for puzzle_set in manifest['sets']:
+            self.new_problem_set(puzzle_set)
+
+    def new_problem_set(self, puzzle_set):
+        row = ProblemRow(title=puzzle_set['title'],
+                         identifier=puzzle_set['identifier'])
+        for puzzle in puzzle_set['puzzles']:
+            text = puzzle['title']
+            if puzzle['difficulty'] is not None:
+                text += '\n({} moves)'.format(puzzle['difficulty'])
+            button = ProblemButton(text=text,
+                                   filen=join('puzzles', puzzle['file']))
+            row.buttons.add_widget(button)
+        self.chooser_container.add_widget(row)
 
-    def new_problem_set(self, filen):
-        pass
-        
 
 
 class ProblemRow(BoxLayout):
@@ -144,7 +163,10 @@ class ProblemRow(BoxLayout):
     buttons = ObjectProperty()
 
 class ProblemButton(Button):
-    pass
+    filen = StringProperty('')
+
+    def on_release(self):
+        App.get_running_app().manager.new_board(from_file=self.filen)
 
 
 class ProblemLabel(Label):
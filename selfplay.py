@@ -0,0 +1,135 @@
+'''Plays games between AI players without the gui.
+
+Games are spread over a pool of processes, and each finished game is
+appended to the output file (in the format of engine.records) as soon
+as it is done. Game i is played with seed base_seed + i, so any game
+of a run can be played again on its own.
+
+Examples:
+
+    python selfplay.py -n 100 --top search --bottom heuristic -o games.phr
+    python selfplay.py -n 20 --start puzzles/dir01_tutorials --processes 2
+
+Searches are limited by time, so for results that repeat exactly use
+players that finish within their time limit (a small --max-depth, or
+--iterations for mcts).
+'''
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from engine.records import RecordWriter
+from engine.selfplay import GameSpec, PLAYERS, run_games
+
+
+def load_starts(paths):
+    '''Returns a list of (name, dict) for every .phut file in paths,
+    which may be files or directories.'''
+    starts = []
+    for path in paths:
+        if os.path.isdir(path):
+            filens = sorted(glob.glob(os.path.join(path, '*.phut')))
+        else:
+            filens = [path]
+        for filen in filens:
+            with open(filen, 'r') as fileh:
+                starts.append((filen, json.load(fileh)))
+    return starts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Play phutball games between AI players.')
+    parser.add_argument('-n', '--games', type=int, default=10,
+                        help='number of games to play')
+    parser.add_argument('--top', choices=PLAYERS, default='search',
+                        help='player for the top side')
+    parser.add_argument('--bottom', choices=PLAYERS, default='heuristic',
+                        help='player for the bottom side')
+    parser.add_argument('--start', nargs='*', default=[],
+                        help='.phut files or directories of them to start '
+                        'from, used in turn; default is an empty board')
+    parser.add_argument('--shape', type=int, nargs=2, default=(15, 19),
+                        metavar=('WIDTH', 'HEIGHT'),
+                        help='board shape for games from an empty board')
+    parser.add_argument('--time-limit', type=float, default=0.1,
+                        help='seconds per move for search and mcts')
+    parser.add_argument('--max-depth', type=int, default=None,
+                        help='maximum depth for search (default: deepen '
+                        'until the time limit)')
+    parser.add_argument('--iterations', type=int, default=None,
+                        help='iterations per move for mcts, instead of '
+                        'the time limit')
+    parser.add_argument('--tablebase', default=None,
+                        help='endgame tablebase file for search and mcts '
+                        '(see build_tablebase.py)')
+    parser.add_argument('--max-moves', type=int, default=200,
+                        help='moves before a game is abandoned as a draw')
+    parser.add_argument('--random-opening', type=int, default=0,
+                        help='number of random opening moves, so that '
+                        'games between deterministic players differ')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='base seed; game i uses seed + i')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: one per cpu)')
+    parser.add_argument('-o', '--output', default='selfplay.phr',
+                        help='file to write game records to')
+    parser.add_argument('--append', action='store_true',
+                        help='add to the output file instead of replacing '
+                        'it')
+    return parser.parse_args(argv)
+
+
+def game_specs(args, starts):
+    for index in range(args.games):
+        start_name, start = None, None
+        shape = args.shape
+        if starts:
+            start_name, start = starts[index % len(starts)]
+            shape = start['shape']
+        yield GameSpec(index, args.seed + index,
+                       {'top': args.top, 'bottom': args.bottom},
+                       shape=shape, start=start, start_name=start_name,
+                       time_limit=args.time_limit, max_depth=args.max_depth,
+                       max_moves=args.max_moves,
+                       random_opening=args.random_opening,
+                       iterations=args.iterations, tablebase=args.tablebase)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    starts = load_starts(args.start)
+    if args.start and not starts:
+        sys.exit('No .phut files found in {}'.format(' '.join(args.start)))
+
+    wins = {'top': 0, 'bottom': 0, None: 0}
+    games = moves = 0
+    start = time.time()
+    if not args.append and os.path.exists(args.output):
+        os.remove(args.output)
+    with RecordWriter(args.output) as writer:
+        for record in run_games(game_specs(args, starts), args.processes):
+            writer.write(record)
+            writer.flush()
+            games += 1
+            moves += len(record.moves)
+            wins[record.winner] += 1
+            print('game {} ({}): {} after {} moves'.format(
+                record.info['game'], record.info['start'] or 'empty board',
+                record.winner or 'draw', len(record.moves)))
+    elapsed = time.time() - start
+
+    print('{} games, {} moves in {:.2f} s: {:.2f} games/s, '
+          '{:.1f} moves/s'.format(games, moves, elapsed,
+                                  games / elapsed if elapsed else 0.,
+                                  moves / elapsed if elapsed else 0.))
+    print('top ({}) won {}, bottom ({}) won {}, {} drawn'.format(
+        args.top, wins['top'], args.bottom, wins['bottom'], wins[None]))
+
+
+if __name__ == '__main__':
+    main()
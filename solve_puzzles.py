@@ -0,0 +1,166 @@
+'''Finds the shortest forced win in .phut puzzles, without the gui.
+
+Every puzzle is solved for the player to move, with engine.solver,
+over a pool of processes. One json line per puzzle is written to the
+results file, holding the status ('win', 'none' or 'timeout'), the
+depth of the win in moves of the player to move, a main line of moves,
+the number of nodes searched and the time taken.
+
+Results are also kept in a cache file keyed by position hash, so
+solving the same puzzles again (or the same position under another
+name) is instant. Timeouts are not cached.
+
+Examples:
+
+    python solve_puzzles.py puzzles
+    python solve_puzzles.py puzzles/dir01_tutorials --max-depth 4 -o out.jsonl
+'''
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from engine.records import load_phut
+from engine.solver import Solver
+from engine.zobrist import keys_for
+
+
+def find_puzzles(paths):
+    '''Returns every .phut file in paths, which may be files or
+    directories (searched recursively).'''
+    filens = []
+    for path in paths:
+        if os.path.isdir(path):
+            filens.extend(sorted(glob.glob(
+                os.path.join(path, '**', '*.phut'), recursive=True)))
+        else:
+            filens.append(path)
+    return filens
+
+
+def cache_key(record):
+    keys = keys_for(record.shape)
+    return '{}x{}:{:016x}'.format(
+        record.shape[0], record.shape[1],
+        keys.hash_position(record.ball_coords, record.man_coords,
+                           record.current_player))
+
+
+def load_cache(filen):
+    if filen is None or not os.path.exists(filen):
+        return {}
+    with open(filen, 'r') as fileh:
+        return json.load(fileh)
+
+
+def save_cache(cache, filen):
+    temporary = filen + '.tmp'
+    with open(temporary, 'w') as fileh:
+        json.dump(cache, fileh, sort_keys=True)
+    os.replace(temporary, filen)
+
+
+def cached_result(cache, key, max_depth):
+    '''Returns the cached result for key if it answers a search to
+    max_depth, or None.'''
+    result = cache.get(key)
+    if result is None:
+        return None
+    if result['status'] == 'win' and result['depth'] <= max_depth:
+        return result
+    if result['status'] == 'none' and result['depth'] >= max_depth:
+        return result
+    return None
+
+
+def solve_file(task):
+    filen, max_depth, time_limit = task
+    record = load_phut(filen)
+    solver = Solver(record.shape)
+    result = solver.solve(record.ball_coords, record.man_coords,
+                          record.current_player, max_depth, time_limit)
+    return filen, result.as_dict()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Find forced wins in phutball puzzles.')
+    parser.add_argument('paths', nargs='+',
+                        help='.phut files or directories of them')
+    parser.add_argument('--max-depth', type=int, default=3,
+                        help='longest win to look for, in moves of the '
+                        'player to move')
+    parser.add_argument('--time-limit', type=float, default=10.,
+                        help='seconds per puzzle')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: one per cpu)')
+    parser.add_argument('-o', '--output', default='solutions.jsonl',
+                        help='file to write results to')
+    parser.add_argument('--cache', default='.solver_cache.json',
+                        help='file of cached results')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='neither read nor write the cache')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    filens = find_puzzles(args.paths)
+    if not filens:
+        sys.exit('No .phut files found in {}'.format(' '.join(args.paths)))
+    cache_filen = None if args.no_cache else args.cache
+    cache = load_cache(cache_filen)
+
+    start = time.time()
+    results = {}
+    keys = {}
+    tasks = []
+    for filen in filens:
+        key = keys[filen] = cache_key(load_phut(filen))
+        result = cached_result(cache, key, args.max_depth)
+        if result is not None:
+            results[filen] = dict(result, cached=True)
+        else:
+            tasks.append((filen, args.max_depth, args.time_limit))
+
+    if args.processes == 1 or len(tasks) <= 1:
+        solved = map(solve_file, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(args.processes)
+        solved = pool.imap_unordered(solve_file, tasks)
+    try:
+        for filen, result in solved:
+            results[filen] = dict(result, cached=False)
+            if result['status'] != 'timeout':
+                cache[keys[filen]] = result
+            print('{}: {} in {} ({} nodes, {:.2f} s)'.format(
+                filen, result['status'], result['depth'], result['nodes'],
+                result['elapsed']))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    with open(args.output, 'w') as fileh:
+        for filen in filens:
+            line = dict(results[filen], file=filen, hash=keys[filen])
+            fileh.write(json.dumps(line, sort_keys=True) + '\n')
+    if cache_filen is not None:
+        save_cache(cache, cache_filen)
+
+    statuses = [result['status'] for result in results.values()]
+    print('{} puzzles in {:.2f} s ({} from the cache): {} wins, {} without '
+          'a win, {} timed out'.format(
+              len(filens), time.time() - start,
+              sum(result['cached'] for result in results.values()),
+              statuses.count('win'), statuses.count('none'),
+              statuses.count('timeout')))
+
+
+if __name__ == '__main__':
+    main()